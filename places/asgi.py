@@ -9,8 +9,20 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "places.settings")
 
-application = get_asgi_application()
+# As get_asgi_application() does
+django.setup(set_prefix=False)
+
+# Imported once Django is set up, they use the models
+from places_api.events import EventStreamApplication  # noqa: E402
+from places_api.handlers import ASGIHandler  # noqa: E402
+
+# Streams the exports from the thread of the ORM, see places_api/handlers.py
+django_application = ASGIHandler()
+
+# Serves the live place events, which Django 4.1 cannot stream, and hands
+# every other request to Django
+application = EventStreamApplication(django_application)
@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for serving places/asgi.py with uvicorn workers:
+
+    gunicorn -c gunicorn.conf.py places.asgi:application
+
+Gunicorn supervises the worker processes, restarting those that die, and on
+SIGTERM stops accepting connections and lets the workers finish the requests
+in flight for up to GRACEFUL_TIMEOUT seconds. Every setting can also be
+overridden with GUNICORN_CMD_ARGS.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+# Django runs the sync parts of a request on one thread per process, so the
+# API scales across cores with processes, one per core by default
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# The arbiter imports the application, and sets Django up, once before it
+# forks the workers: they start ready to serve, sharing the memory of the
+# modules. Nothing connects to the database or starts a thread while Django
+# is set up, the workers open their own. Code changes then need a restart
+# rather than a HUP
+preload_app = os.environ.get("PRELOAD_APP", "on").lower() in ("1", "true", "yes", "on")
+
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+keepalive = int(os.environ.get("KEEPALIVE", 5))
+
+accesslog = "-" if os.environ.get("ACCESS_LOG") else None
@@ -1,21 +1,330 @@
+"""
+The admin of places, which stays as fast on millions of places as on a few.
+
+Its changelist reads an index for everything it shows:
+
+- Pages are navigated with cursors, as in the API, seeking to the place the
+  previous page ended with instead of skipping over the places before it.
+  The orderings the list can be sorted by are those of the place indexes.
+- The search matches codes starting with the search text, a range of the
+  code index, and places with every word of it as in the API's `?q=`, from
+  the full-text index.
+- The type and tag filters list the types and the most common tags from the
+  summaries of `stats.py`, and filter with the type and tagged item indexes.
+- Searches and filters matching more than `SORT_LIMIT` places are checked
+  place by place along the index of the ordering rather than sorted.
+- Lists are counted up to `PlaceAdmin.count_limit`. Single filters and
+  searches are counted from the summaries and the search index instead, and
+  the whole table from the estimate the database keeps of its size.
+- The tags of the page are loaded with one query.
+"""
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Exists
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.utils.formats import number_format
+from django.utils.functional import cached_property
+from django.utils.translation import gettext
+from django.utils.translation import gettext_lazy as _
 
+from . import search
+from . import stats
+from .filters import FullTextSearchFilter
 from .models import Place
+from .models import UUIDTaggedItem
+from .models import tag_names
+from .pagination import KeysetPagination
+from .pagination import decode_cursor
+from .pagination import encode_cursor
+from .pagination import position_of
+from .search import search_words
+
+CURSOR_VAR = "cursor"
+MAX_TAG_CHOICES = 50
+# Searches and filters matching more places than this are checked place by
+# place along the index of the ordering, which finds a page of them after
+# reading about a page divided by their share of the places. Fewer are read
+# from their own indexes and sorted
+SORT_LIMIT = 10_000
+# The orderings of the place indexes, the changelist is sorted by one of them
+# or its reverse
+INDEXED_ORDERINGS = [
+    ("code", "uuid"),
+    ("type", "code", "uuid"),
+    ("-reward_checkin_points", "code", "uuid"),
+]
+
+
+def indexed_ordering(ordering):
+    """
+    The index ordering starting with the first field of `ordering`, reversed
+    if that field is, the ordering by code if no index starts with it.
+    """
+    first = ordering[0] if ordering else None
+    for index_ordering in INDEXED_ORDERINGS:
+        if first == index_ordering[0]:
+            return index_ordering
+        reverse_ordering = KeysetPagination.invert(index_ordering)
+        if first == reverse_ordering[0]:
+            return reverse_ordering
+    return INDEXED_ORDERINGS[0]
+
+
+def code_prefix(term):
+    """
+    Codes starting with `term`, a range of the code index: up to the term
+    with its last character incremented.
+    """
+    return Q(
+        code__gte=term,
+        code__lt=term[:-1] + chr(ord(term[-1]) + 1),
+        code__startswith=term,
+    )
+
+
+def estimated_rows(model, using):
+    """
+    The number of rows of the model's table as the database estimates it,
+    without reading them, None if it does not know.
+    """
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            # Rowids grow with the insertions, the largest one is found at the
+            # end of the table's b-tree
+            cursor.execute(f"SELECT MAX(rowid) FROM {table}")
+        elif connection.vendor == "postgresql":
+            # Updated by VACUUM and ANALYZE, -1 before the first one
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [table],
+            )
+        else:
+            return None
+        rows = cursor.fetchone()[0]
+    return rows if rows is not None and rows >= 0 else None
+
+
+class PlaceChangeList(ChangeList):
+    def get_queryset(self, request):
+        # Like page numbers, cursors are left out of the links to other
+        # filters, searches and orderings, which start from the first page
+        self.params.pop(CURSOR_VAR, None)
+        return super().get_queryset(request)
+
+    def get_ordering(self, request, queryset):
+        return list(indexed_ordering(super().get_ordering(request, queryset)))
+
+    def get_results(self, request):
+        ordering = tuple(self.queryset.query.order_by)
+        queryset, position, reverse = self.queryset, None, False
+        if CURSOR_VAR in request.GET:
+            try:
+                position, reverse = decode_cursor(request.GET[CURSOR_VAR], ordering)
+                if reverse:
+                    queryset = queryset.order_by(*KeysetPagination.invert(ordering))
+                queryset = queryset.filter(
+                    KeysetPagination.seek(queryset.query.order_by, position)
+                )
+            except (ValidationError, TypeError, ValueError):
+                raise IncorrectLookupParameters
+
+        places = list(queryset[: self.list_per_page + 1])
+        has_more = len(places) > self.list_per_page
+        places = places[: self.list_per_page]
+        if reverse:
+            places.reverse()
+        names = tag_names([place.uuid for place in places])
+        for place in places:
+            place.tag_names = names[place.uuid]
+
+        has_next = has_more if not reverse else True
+        has_previous = has_more if reverse else position is not None
+        self.next_url = self.previous_url = self.first_url = None
+        if places and has_next:
+            self.next_url = self.cursor_url(places[-1], reverse=False)
+        if places and has_previous:
+            self.previous_url = self.cursor_url(places[0], reverse=True)
+            self.first_url = self.get_query_string()
+
+        self.count_results()
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = places
+        self.can_show_all = False
+        self.multi_page = has_next or has_previous
+        self.paginator = None
+
+    def cursor_url(self, place, reverse):
+        ordering = tuple(self.queryset.query.order_by)
+        cursor = encode_cursor(position_of(place, ordering), reverse, ordering)
+        return self.get_query_string({CURSOR_VAR: cursor})
+
+    def count_results(self):
+        """
+        Counts the places of the list, up to the admin's `count_limit` beyond
+        which the places of the whole table are estimated, and those of other
+        lists only said to be more.
+        """
+        limit = self.model_admin.count_limit
+        using = self.queryset.db
+        term = self.query.strip()
+        filters = [spec for spec in self.filter_specs if spec.value() is not None]
+        exact = False
+        if len(filters) == 1 and not term:
+            # From the summaries
+            count, exact = filters[0].count, True
+        elif term and not filters:
+            codes, words = self.model_admin.search_sizes(term, using, limit)
+            if words is not None and not (codes and words):
+                # Only codes or only words match, as many as counted
+                count = codes + words
+            elif max(codes, words or 0) > limit:
+                count = limit + 1
+            else:
+                count = self.queryset[: limit + 1].count()
+        else:
+            count = self.queryset[: limit + 1].count()
+
+        self.result_count = count
+        self.result_count_display = number_format(count, force_grouping=True)
+        if exact or count <= limit:
+            return
+
+        estimate = None
+        if not self.queryset.query.has_filters():
+            estimate = estimated_rows(self.model, using)
+        if estimate is not None and estimate > limit:
+            self.result_count = estimate
+            self.result_count_display = gettext("about %(count)s") % {
+                "count": number_format(estimate, force_grouping=True)
+            }
+        else:
+            self.result_count = limit
+            self.result_count_display = gettext("more than %(count)s") % {
+                "count": number_format(limit, force_grouping=True)
+            }
+
+
+class TypeFilter(admin.SimpleListFilter):
+    title = _("type")
+    parameter_name = "type"
+
+    def lookups(self, request, model_admin):
+        return [
+            (row["type"], f"{row['type']} ({row['count']})")
+            for row in stats.type_stats()
+        ]
+
+    def queryset(self, request, queryset):
+        # The (type, code, uuid) index serves the default ordering
+        if self.value() is not None:
+            return queryset.filter(type=self.value())
+        return queryset
+
+    @cached_property
+    def count(self):
+        return stats.type_count(self.value())
+
+
+class TagFilter(admin.SimpleListFilter):
+    title = _("tags")
+    parameter_name = "tag"
+
+    def lookups(self, request, model_admin):
+        return [
+            (row["slug"], f"{row['name']} ({row['count']})")
+            for row in stats.tag_stats(MAX_TAG_CHOICES)
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        tagged = UUIDTaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Place),
+            tag__slug=self.value(),
+        )
+        if self.count > SORT_LIMIT:
+            # Looked up place by place in the tagged item index
+            return queryset.filter(Exists(tagged.filter(object_id=OuterRef("uuid"))))
+        return queryset.filter(uuid__in=tagged.values("object_id"))
+
+    @cached_property
+    def count(self):
+        return stats.tag_count(self.value())
 
 
 class PlaceAdmin(admin.ModelAdmin):
-    ordering = ['code']
-    search_fields = ['type']
-    list_display = ["code", "name", "address", "location", "reward_checkin_points", "type", "all_tags"]
+    ordering = ["code"]
+    search_fields = ["code"]
+    search_help_text = _(
+        "Places whose code starts with the text, or with every word of it "
+        "in their name, address, type or tags."
+    )
+    list_display = [
+        "code",
+        "name",
+        "address",
+        "location",
+        "reward_checkin_points",
+        "type",
+        "all_tags",
+    ]
+    list_filter = [TypeFilter, TagFilter]
+    sortable_by = ["code", "type", "reward_checkin_points"]
+    show_full_result_count = False
+    # Lists of more places are counted from an estimate, or not at all
+    count_limit = 10_000
+
+    def get_changelist(self, request, **kwargs):
+        return PlaceChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+
+        codes, words = self.search_sizes(term, queryset.db, SORT_LIMIT)
+        if words == 0:
+            return queryset.filter(code_prefix(term)), False
+        if words is not None and words > SORT_LIMIT and not codes:
+            # Too many to sort, checked one by one along the index of the
+            # ordering instead
+            return queryset.filter(search.match_condition(term, queryset.db)), False
+        found = FullTextSearchFilter.search(Place.objects.all(), term)
+        return (
+            queryset.filter(code_prefix(term) | Q(uuid__in=found.values("uuid"))),
+            False,
+        )
+
+    def search_sizes(self, term, using, limit):
+        """
+        The number of codes starting with the search term and of places
+        matching its words, counted up to `limit` + 1. The places matching
+        its words are not counted without the full-text index, the number is
+        None then if the term has words.
+        """
+        codes = Place.objects.using(using).filter(code_prefix(term))
+        words = None
+        if not search_words(term):
+            words = 0
+        elif search.is_available(using):
+            words = search.count_matches(term, limit + 1, using)
+        return codes.values("pk")[: limit + 1].count(), words
 
     def location(self, place):
         return f"{place.location_lat} - {place.location_lon}"
 
     def all_tags(self, place):
-        tags = []
-        for tag in place.tags.all():
-            tags.append(str(tag))
-        return ', '.join(tags)
+        # Loaded for the whole page by the changelist
+        return ", ".join(place.tag_names)
 
 
 admin.site.register(Place, PlaceAdmin)
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class PlacesApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "places_api"
+
+    def ready(self):
+        # Connects the receivers that keep the full-text index, the response
+        # cache, the change feed, the map clusters and the tag statistics in
+        # sync with the places, that wake the live events, and that count the
+        # queries of every connection for the request metrics
+        from . import caching  # noqa: F401
+        from . import changes  # noqa: F401
+        from . import clusters  # noqa: F401
+        from . import events  # noqa: F401
+        from . import metrics  # noqa: F401
+        from . import search  # noqa: F401
+        from . import stats  # noqa: F401
+        from .checks import check_migrations
+
+        checks.register(check_migrations, checks.Tags.database)
@@ -0,0 +1,149 @@
+"""
+Async reads of places, for the ASGI server.
+
+Under ASGI Django runs sync views on one thread per process, so each of them
+waits for the views queued before it. These views answer GETs of the place
+list and details from the event loop instead: cached responses and 304s are
+served without a database connection, and details missing from the cache are
+read in the thread of the ORM. The cache, file based in the containers, and
+the replica snapshots are read in threads of their own, which neither block
+the event loop nor wait for the thread of the ORM. Everything else, writes,
+filtered details and the browsable API included, is handed over to
+`PlaceViewSet`.
+"""
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import APIException
+
+from . import caching
+from . import conditional
+from . import replicas
+from .models import Place
+from .serializers import PlaceSerializer
+from .views import PlaceViewSet
+
+READ_METHODS = ("GET", "HEAD")
+
+viewset_list = PlaceViewSet.as_view({"get": "list", "post": "create"})
+viewset_detail = PlaceViewSet.as_view(
+    {
+        "get": "retrieve",
+        "put": "update",
+        "patch": "partial_update",
+        "delete": "destroy",
+    }
+)
+
+
+def negotiate(request, action, **kwargs):
+    """
+    Wraps the request the way `PlaceViewSet` does and picks its renderer, or
+    raises the `APIException` the viewset would answer with.
+    """
+    view = PlaceViewSet(
+        action_map={"get": action, "head": action},
+        args=(),
+        kwargs=kwargs,
+        format_kwarg=None,
+    )
+    request = view.initialize_request(request, **kwargs)
+    renderer, media_type = view.perform_content_negotiation(request)
+    request.accepted_renderer, request.accepted_media_type = renderer, media_type
+    return request
+
+
+@sync_to_async(thread_sensitive=False)
+def lookup(request, api_request, version_keys, key_etag=False):
+    return caching.lookup(
+        api_request, version_keys, key_etag, source=replicas.source(request)
+    )
+
+
+@sync_to_async(thread_sensitive=False)
+def store(key, response):
+    caching.store(key, response)
+
+
+def read_place(request, place_uuid):
+    # In the thread of the ORM, whose connections reading() may reopen
+    with replicas.reading(request):
+        return Place.objects.prefetch_related("tags").get(uuid=place_uuid)
+
+
+async def place_list(request):
+    if request.method not in READ_METHODS:
+        return await sync_to_async(viewset_list)(request)
+    try:
+        api_request = negotiate(request, "list")
+    except APIException:
+        return await sync_to_async(viewset_list)(request)
+    if api_request.accepted_renderer.format not in caching.CACHED_FORMATS:
+        return await sync_to_async(viewset_list)(request)
+
+    # Lists are filtered and paginated by the viewset, which looks the cache
+    # up again on a miss, a cheap second read compared to building the page
+    _, _, response = await lookup(
+        request, api_request, caching.list_version_keys(), key_etag=True
+    )
+    if response is None:
+        response = await sync_to_async(viewset_list)(request)
+    return response
+
+
+async def place_detail(request, pk):
+    # Query parameters are filters the viewset applies to details too
+    if request.method not in READ_METHODS or request.GET.keys() - {"format"}:
+        return await sync_to_async(viewset_detail)(request, pk=pk)
+    try:
+        place_uuid = uuid.UUID(pk)
+        api_request = negotiate(request, "retrieve", pk=pk)
+    except (ValueError, APIException):
+        return await sync_to_async(viewset_detail)(request, pk=pk)
+    if api_request.accepted_renderer.format not in caching.CACHED_FORMATS:
+        return await sync_to_async(viewset_detail)(request, pk=pk)
+
+    key, _, response = await lookup(
+        request, api_request, caching.place_version_keys(place_uuid)
+    )
+    if response is not None:
+        return response
+
+    try:
+        place = await sync_to_async(read_place)(request, place_uuid)
+    except Place.DoesNotExist:
+        # The viewset renders the 404 like any of its errors
+        return await sync_to_async(viewset_detail)(request, pk=pk)
+
+    caching.record("misses")
+    etag = conditional.place_etag(place)
+    if conditional.if_none_match(api_request, etag):
+        return conditional.not_modified(etag)
+
+    renderer = api_request.accepted_renderer
+    content = renderer.render(
+        PlaceSerializer(place).data,
+        api_request.accepted_media_type,
+        {"request": api_request},
+    )
+    content_type = api_request.accepted_media_type
+    if renderer.charset:
+        content_type = f"{content_type}; charset={renderer.charset}"
+    response = HttpResponse(content, content_type=content_type)
+    response["ETag"] = etag
+    response["X-Cache"] = "MISS"
+    patch_vary_headers(response, ["Accept"])
+    await store(key, response)
+    return response
+
+
+# Counted in the request metrics as the viewset actions they stand in for
+place_list.metrics_view = viewset_list
+place_detail.metrics_view = viewset_detail
+
+# The viewset does its own CSRF checks, as DRF views do. Set directly, as
+# csrf_exempt() only wraps sync views before Django 5.0
+place_list.csrf_exempt = True
+place_detail.csrf_exempt = True
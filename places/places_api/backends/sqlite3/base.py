@@ -0,0 +1,139 @@
+"""
+SQLite backend tuned for a web server's many readers and few writers.
+
+Connections switch the database to WAL, where readers never wait for the
+writer, and set the pragmas below, which settings can override with
+`OPTIONS["pragmas"]`. `OPTIONS["read_only"]` makes a connection refuse
+writes, for the `read` alias `ReadWriteRouter` sends queries to.
+`OPTIONS["snapshot"]` opens the file as immutable, without locking, for the
+read replicas of places_api/replicas.py, which are replaced as a whole by
+renaming a new snapshot over them: a connection keeps reading the file it
+opened until it is reopened.
+
+Transactions start with `BEGIN IMMEDIATE`: a deferred `BEGIN` takes the
+write lock on its first write, and fails with "database is locked" straight
+away, without waiting, when another transaction wrote in between. Writers of
+the same process also queue on a lock, in turn, rather than in SQLite's busy
+handler, which polls the database with growing sleeps.
+"""
+import os
+import threading
+from urllib.parse import quote
+
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    "journal_mode": "wal",
+    # Durable at checkpoints rather than at every commit, safe with WAL
+    "synchronous": "normal",
+    # Milliseconds writers of other processes wait for the write lock
+    "busy_timeout": 5000,
+    # Negative sizes are in KiB: 32 MB of page cache per connection
+    "cache_size": -32000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "memory",
+}
+
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+
+def write_lock(name):
+    with _write_locks_lock:
+        return _write_locks.setdefault(str(name), threading.Lock())
+
+
+def file_id(path):
+    """Identifies the file at `path`, None if there is none."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    holds_write_lock = False
+    # The file_id() of the snapshot the connection opened
+    snapshot_id = None
+
+    @property
+    def read_only(self):
+        return self.settings_dict["OPTIONS"].get("read_only", False)
+
+    @property
+    def snapshot(self):
+        return self.settings_dict["OPTIONS"].get("snapshot", False)
+
+    def snapshot_replaced(self):
+        """Whether the snapshot file changed since the connection opened it."""
+        return (
+            self.connection is not None
+            and file_id(self.settings_dict["NAME"]) != self.snapshot_id
+        )
+
+    def pragmas(self):
+        pragmas = {**PRAGMAS, **self.settings_dict["OPTIONS"].get("pragmas", {})}
+        if self.read_only:
+            # The journal mode is a write, left to the writers
+            del pragmas["journal_mode"]
+            pragmas["query_only"] = "on"
+        return pragmas
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop("pragmas", None)
+        kwargs.pop("read_only", None)
+        if kwargs.pop("snapshot", False):
+            # Connections are opened with uri=True
+            kwargs["database"] = f"file:{quote(str(kwargs['database']))}?immutable=1"
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        if self.snapshot:
+            # Before opening it, a snapshot renamed in between is then seen
+            # as replaced, and opened again
+            self.snapshot_id = file_id(self.settings_dict["NAME"])
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas().items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.read_only:
+            return super()._start_transaction_under_autocommit()
+
+        # Past the busy timeout, the transaction goes ahead without its turn
+        # and SQLite decides, so a writer stuck in another thread cannot
+        # block this one forever
+        timeout = self.pragmas()["busy_timeout"] / 1000
+        lock = write_lock(self.settings_dict["NAME"])
+        self.holds_write_lock = lock.acquire(timeout=timeout)
+        try:
+            self.cursor().execute("BEGIN IMMEDIATE")
+        except Exception:
+            self.release_write_lock()
+            raise
+
+    def release_write_lock(self):
+        if self.holds_write_lock:
+            self.holds_write_lock = False
+            write_lock(self.settings_dict["NAME"]).release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self.release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self.release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self.release_write_lock()
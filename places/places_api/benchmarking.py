@@ -0,0 +1,184 @@
+"""
+Helpers shared by the `bench_*` management commands.
+
+Benchmarks run against a throwaway database created the same way the test
+runner creates one, so they never touch the configured database.
+"""
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connection
+from django.db import connections
+from django.test.utils import setup_test_environment
+from django.test.utils import teardown_test_environment
+
+from .bulk import chunked
+from .bulk import set_tags
+from .models import Place
+
+# Roughly the extent of Greece, dense enough for "near me" queries to hit
+REGION = (35.0, 19.5, 41.5, 28.5)
+PLACE_TYPES = ["office", "cafe", "restaurant", "museum", "park", "shop", "hotel"]
+# Word pools for names and addresses, so text searches have realistic hit rates
+NAME_WORDS = (
+    "blue golden old little royal green central sunny harbour olive marble "
+    "village corner garden castle lighthouse market bakery tavern gallery"
+).split()
+STREET_NAMES = (
+    "Ermou Athinas Stadiou Panepistimiou Akadimias Solonos Patision Syngrou "
+    "Kifisias Egnatia Tsimiski Mitropoleos"
+).split()
+# Most popular first, generate_tags() picks them with a long tail
+TAG_NAMES = (
+    "wifi parking outdoor family accessible vegan pet-friendly rooftop "
+    "late-night live-music brunch seaview historic quiet student-discount "
+    "takeaway delivery terrace playground bike-rental"
+).split()
+
+
+@contextmanager
+def benchmark_database(verbosity=0, name=None):
+    """
+    With `name`, the database is created in that file, for benchmarks that
+    need other processes to open it, where SQLite would default to memory.
+    """
+    test_settings = connection.settings_dict["TEST"]
+    old_test_name = test_settings["NAME"]
+    if name is not None:
+        test_settings["NAME"] = str(name)
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False
+    )
+    # The read-only connections to the same database follow it
+    mirrors = {
+        alias: connections[alias].settings_dict["NAME"]
+        for alias in connections
+        if connections[alias].settings_dict["TEST"]["MIRROR"] == DEFAULT_DB_ALIAS
+    }
+    for alias in mirrors:
+        connections[alias].close()
+        connections[alias].settings_dict["NAME"] = connection.settings_dict["NAME"]
+    try:
+        yield
+    finally:
+        for alias, name in mirrors.items():
+            connections[alias].close()
+            connections[alias].settings_dict["NAME"] = name
+        connection.creation.destroy_test_db(old_name, verbosity)
+        teardown_test_environment()
+        test_settings["NAME"] = old_test_name
+
+
+def random_point(rng, region=REGION):
+    min_lat, min_lon, max_lat, max_lon = region
+    return (
+        round(rng.uniform(min_lat, max_lat), 6),
+        round(rng.uniform(min_lon, max_lon), 6),
+    )
+
+
+def generate_places(count, batch_size=5000, seed=0, region=REGION):
+    """Bulk inserts `count` synthetic places and returns the number created."""
+    rng = random.Random(seed)
+    created = 0
+    while created < count:
+        batch = []
+        for i in range(created, min(created + batch_size, count)):
+            lat, lon = random_point(rng, region)
+            place = Place(
+                # Seeded too, they decide the order of ties and index layouts
+                uuid=uuid.UUID(int=rng.getrandbits(128), version=4),
+                code=f"{i:012d}",
+                address=f"{rng.choice(STREET_NAMES)} {rng.randint(1, 200)}",
+                location_lat=lat,
+                location_lon=lon,
+                name=" ".join(rng.sample(NAME_WORDS, 2)).title(),
+                reward_checkin_points=rng.randint(1, 100),
+                type=rng.choice(PLACE_TYPES),
+            )
+            place.update_geohash()
+            batch.append(place)
+        Place.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def generate_tags(batch_size=5000, seed=0, max_per_place=4):
+    """
+    Tags every place with up to `max_per_place` tags, the first ones of
+    `TAG_NAMES` far more often than the last, and returns the number of
+    tagged items created.
+    """
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(TAG_NAMES) + 1)]
+    uuids = Place.objects.order_by("code").values_list("uuid", flat=True)
+    tagged = 0
+    for chunk in chunked(list(uuids), batch_size):
+        tags_by_uuid = {
+            place_uuid: set(
+                rng.choices(TAG_NAMES, weights, k=rng.randint(0, max_per_place))
+            )
+            for place_uuid in chunk
+        }
+        set_tags(tags_by_uuid, replace=False)
+        tagged += sum(len(names) for names in tags_by_uuid.values())
+    return tagged
+
+
+def timed(func, *args, **kwargs):
+    """Returns the result of the call and its duration in milliseconds."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+
+def format_summary(label, summary):
+    return (
+        f"{label:<24} n={summary['count']:<5} mean={summary['mean_ms']:9.2f}ms "
+        f"p50={summary['p50_ms']:9.2f}ms p95={summary['p95_ms']:9.2f}ms "
+        f"p99={summary['p99_ms']:9.2f}ms"
+    )
+
+
+def regressions(results, baseline, threshold):
+    """
+    Describes every scenario of `results` slower than in `baseline` by more
+    than `threshold` (a fraction) at p50 or p95, or running more queries.
+    Scenarios missing from either side are not compared.
+    """
+    found = []
+    for name, result in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if result[metric] > base[metric] * (1 + threshold):
+                found.append(
+                    f"{name}: {metric} {base[metric]:.2f} -> {result[metric]:.2f}"
+                )
+        # Query counts do not depend on the machine, any increase counts
+        if result["queries"] > base["queries"] + 0.01:
+            found.append(
+                f"{name}: queries {base['queries']:.2f} -> {result['queries']:.2f}"
+            )
+    return found
@@ -0,0 +1,215 @@
+"""
+Set-based writers for large batches of places.
+
+They bypass `Place.save()` and the per-row tag manager, so each batch costs a
+handful of queries regardless of its size, and they announce what they wrote
+through `signals.places_bulk_changed` instead of the per-instance signals.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.utils import timezone
+from taggit.models import Tag
+
+from .models import Place
+from .models import UUIDTaggedItem
+from .models import lock_saved_values
+from .models import tag_ids
+from .signals import places_bulk_changed
+
+BATCH_SIZE = 500
+
+
+def chunked(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def create_places(rows):
+    """
+    Creates places from validated `PlaceSerializer` data in one transaction
+    and returns them in the same order.
+    """
+    places, tags = [], {}
+    for row in rows:
+        row = dict(row)
+        names = row.pop("tags", None)
+        place = Place(**row)
+        place.update_geohash()
+        places.append(place)
+        if names:
+            tags[place.uuid] = names
+
+    with transaction.atomic():
+        Place.objects.bulk_create(places)
+        set_tags(tags, replace=False)
+        places_bulk_changed.send(sender=Place, created=places, updated=[])
+    for place in places:
+        place.remember_saved_values()
+    return places
+
+
+def update_places(changes):
+    """
+    Applies validated `PlaceSerializer` data to existing places in one
+    transaction. `changes` is a list of (place, data) pairs; tags are replaced
+    only for the places whose data includes them, like a regular update.
+    """
+    places = [place for place, _ in changes]
+    tags, fields = {}, {"geohash", "updated_at"}
+    now = timezone.now()
+    with transaction.atomic():
+        # What the update replaces, read once the rows are locked rather than
+        # when the instances were loaded, and the values of the fields it
+        # leaves alone, which the geohash and the receivers see
+        lock_saved_values(places)
+        for place, row in changes:
+            for attname, value in place.saved_values.items():
+                setattr(place, attname, value)
+            row = dict(row)
+            names = row.pop("tags", None)
+            for field, value in row.items():
+                setattr(place, field, value)
+                fields.add(field)
+            place.update_geohash()
+            place.updated_at = now
+            if names is not None:
+                tags[place.uuid] = names
+
+        update_rows(places, sorted(fields), increment=["version"])
+        # For the receivers, which only see the tags once replaced
+        replaced = tag_ids(list(tags))
+        for place in places:
+            place.replaced_tag_ids = replaced.get(place.uuid)
+        set_tags(tags, replace=True)
+        # Places deleted in between were not updated
+        updated = [place for place in places if place.saved_values]
+        places_bulk_changed.send(sender=Place, created=[], updated=updated)
+    for place in places:
+        place.remember_saved_values()
+    return places
+
+
+def update_rows(places, fields, increment=()):
+    """
+    Writes the given fields of many places with one prepared UPDATE run through
+    executemany(). Unlike bulk_update(), which builds a CASE expression per row
+    and field in Python, the cost per row is a parameter tuple. The columns
+    in `increment` are incremented by the database instead, and the instances
+    are left with their previous value.
+    """
+    connection = connections[router.db_for_write(Place)]
+    quote_name = connection.ops.quote_name
+    meta = Place._meta
+    columns = [meta.get_field(name) for name in fields]
+    assignments = [f"{quote_name(field.column)} = %s" for field in columns] + [
+        "{0} = {0} + 1".format(quote_name(meta.get_field(name).column))
+        for name in increment
+    ]
+    sql = "UPDATE {} SET {} WHERE {} = %s".format(
+        quote_name(meta.db_table), ", ".join(assignments), quote_name(meta.pk.column)
+    )
+    params = [
+        [
+            field.get_db_prep_save(getattr(place, field.attname), connection)
+            for field in columns
+        ]
+        + [meta.pk.get_db_prep_save(place.pk, connection)]
+        for place in places
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def add_to_summaries(model, columns, deltas, using=None):
+    """
+    Adds deltas to the rows of a summary table with one prepared upsert run
+    through executemany(). `deltas` maps the values of the key columns, a
+    unique constraint, to those added to the other columns, the first of
+    which counts the places summed up. Rows missing are inserted with the
+    deltas, and rows left counting no place are deleted.
+    """
+    # Sorted so that concurrent writers lock the rows in the same order
+    rows = sorted((*key, *delta) for key, delta in deltas.items() if any(delta))
+    if not rows:
+        return
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    columns = [quote_name(column) for column in columns]
+    keys = columns[: len(next(iter(deltas)))]
+    sums = columns[len(keys) :]
+    assignments = ", ".join(
+        f"{column} = {table}.{column} + excluded.{column}" for column in sums
+    )
+    # Without a transaction of its own, the delete checks the count again so
+    # rows filled again in between are kept
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {assignments}",
+            rows,
+        )
+        emptied = [row[: len(keys)] for row in rows if row[len(keys)] < 0]
+        if emptied:
+            conditions = " AND ".join(f"{column} = %s" for column in keys)
+            cursor.executemany(
+                f"DELETE FROM {table} WHERE {conditions} AND {sums[0]} <= 0",
+                emptied,
+            )
+
+
+def delete_places(uuids):
+    """Deletes the places in one transaction and returns the deleted instances."""
+    with transaction.atomic():
+        # Locked so that the receivers of the deletion, which read the
+        # places again, see the values of the last concurrent update
+        places = list(
+            Place.objects.select_for_update().filter(uuid__in=uuids).order_by("pk")
+        )
+        Place.objects.filter(uuid__in=uuids).delete()
+    return places
+
+
+def set_tags(tags_by_uuid, replace=True):
+    """
+    Tags many places with set-based inserts into `UUIDTaggedItem`.
+    `tags_by_uuid` maps place uuids to tag names; with `replace` the existing
+    tags of those places are removed first.
+    """
+    content_type = ContentType.objects.get_for_model(Place)
+    if replace and tags_by_uuid:
+        UUIDTaggedItem.objects.filter(
+            content_type=content_type, object_id__in=list(tags_by_uuid)
+        ).delete()
+
+    tags = get_or_create_tags(
+        {name for names in tags_by_uuid.values() for name in names}
+    )
+    UUIDTaggedItem.objects.bulk_create(
+        [
+            UUIDTaggedItem(content_type=content_type, object_id=uuid, tag=tags[name])
+            for uuid, names in tags_by_uuid.items()
+            for name in set(names)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def get_or_create_tags(names):
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = names - tags.keys()
+    if missing:
+        Tag.objects.bulk_create(
+            [Tag(name=name, slug=Tag().slugify(name)) for name in missing],
+            ignore_conflicts=True,
+        )
+        tags.update((tag.name, tag) for tag in Tag.objects.filter(name__in=missing))
+
+    # Names whose slug collided with another tag get taggit's own suffixing
+    for name in names - tags.keys():
+        tags[name], _ = Tag.objects.get_or_create(name=name)
+    return tags
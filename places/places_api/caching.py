@@ -0,0 +1,220 @@
+"""
+Response cache for the place list and detail endpoints.
+
+Rendered JSON responses are stored in the `places` cache, configured in
+settings like any other Django cache, under keys that embed version
+counters: one for every list page, one per place for its detail, and one for
+tag names, which appear in both. Writes bump the counters they affect, so
+stale entries are never read again and simply age out of the cache.
+
+The counters live in the `places_versions` cache. Only they need to be shared
+by the server processes: responses are immutable under their keys, so each
+process can keep its own copies in memory. The cache bounds the number of
+counters by evicting some, which only costs misses: missing counters restart
+from the clock, never from a value an evicted one had.
+
+Counters are bumped when the write happens, for the transaction that made
+it, and again once it commits, so a concurrent read cannot store data from
+before the commit under the new version.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
+from taggit.models import Tag
+
+from . import conditional
+from .models import Place
+from .models import UUIDTaggedItem
+from .signals import places_bulk_changed
+
+CACHE_ALIAS = "places"
+VERSIONS_CACHE_ALIAS = "places_versions"
+CACHED_FORMATS = {"json"}
+LIST_VERSION_KEY = "places:version:list"
+TAGS_VERSION_KEY = "places:version:tags"
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+_last_bump = 0
+_bump_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_versions_cache():
+    return caches[VERSIONS_CACHE_ALIAS]
+
+
+def place_version_key(place_uuid):
+    return f"places:version:place:{place_uuid}"
+
+
+def get_versions(keys):
+    """
+    Returns the current value of the version counters, starting missing ones
+    from the clock so they never repeat a value an evicted counter had.
+    """
+    cache = get_versions_cache()
+    versions = cache.get_many(keys)
+    for key in set(keys) - versions.keys():
+        cache.add(key, time.time_ns(), None)
+        versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(keys):
+    # Setting counters from the clock, rather than incrementing them, needs no
+    # read, which processes sharing a file based cache could interleave. The
+    # clock may be coarse, successive bumps still have to change the counters
+    global _last_bump
+    with _bump_lock:
+        _last_bump = max(time.time_ns(), _last_bump + 1)
+        version = _last_bump
+    get_versions_cache().set_many(dict.fromkeys(keys, version), None)
+
+
+def invalidate(place_uuids=(), tags=False):
+    """Makes the list pages, and the details of the given places, stale."""
+    keys = [LIST_VERSION_KEY]
+    keys += {place_version_key(place_uuid) for place_uuid in place_uuids}
+    if tags:
+        keys.append(TAGS_VERSION_KEY)
+    bump_versions(keys)
+    transaction.on_commit(lambda: bump_versions(keys))
+
+
+def list_version_keys():
+    return [LIST_VERSION_KEY, TAGS_VERSION_KEY]
+
+
+def place_version_keys(place_uuid):
+    return [place_version_key(place_uuid), TAGS_VERSION_KEY]
+
+
+def response_key(request, version_keys, source=""):
+    versions = ":".join(str(version) for version in get_versions(version_keys))
+    uri = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return (
+        f"places:response:{request.accepted_renderer.format}:{versions}:{source}:{uri}"
+    )
+
+
+def lookup(request, version_keys, key_etag=False, source=""):
+    """
+    Returns the cache key of the request, its ETag when `key_etag` derives it
+    from the key, and the response to answer with from the cache, or None on
+    a miss. The key changes with the versions, so with `key_etag` unchanged
+    responses get a 304 without even reading the cache entry.
+    """
+    key = response_key(request, version_keys, source)
+    etag = None
+    if key_etag:
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+        if conditional.if_none_match(request, etag):
+            record("not_modified")
+            return key, etag, conditional.not_modified(etag)
+
+    cached = get_cache().get(key)
+    if cached is None:
+        return key, etag, None
+
+    content, content_type, etag = cached
+    if etag and conditional.if_none_match(request, etag):
+        record("not_modified")
+        return key, etag, conditional.not_modified(etag)
+    record("hits")
+    response = HttpResponse(content, content_type=content_type)
+    response["X-Cache"] = "HIT"
+    if etag:
+        response["ETag"] = etag
+    patch_vary_headers(response, ["Accept"])
+    return key, etag, response
+
+
+def store(key, response):
+    get_cache().set(
+        key, (response.content, response["Content-Type"], response.get("ETag"))
+    )
+
+
+def cached_response(request, version_keys, view, key_etag=False, source=""):
+    """
+    Returns the cached response for the request, or the one `view` returns,
+    storing it once rendered if it succeeded. The ETag of the response is
+    stored with it and honoured for `If-None-Match`. Responses are kept per
+    `source`, the replica the view reads from.
+    """
+    if request.accepted_renderer.format not in CACHED_FORMATS:
+        return view()
+
+    key, etag, response = lookup(request, version_keys, key_etag, source)
+    if response is not None:
+        return response
+
+    record("misses")
+    response = view()
+    response["X-Cache"] = "MISS"
+    if etag:
+        response["ETag"] = etag
+    if response.status_code == 200:
+        response.add_post_render_callback(lambda rendered: store(key, rendered))
+    return response
+
+
+def record(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def stats():
+    """Hit and miss counts of this process since it started."""
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+        not_modified = _stats["not_modified"]
+    # A 304 is a hit that did not even need the cached body
+    lookups = hits + not_modified + misses
+    return {
+        "hits": hits,
+        "not_modified": not_modified,
+        "misses": misses,
+        "hit_ratio": (hits + not_modified) / lookups if lookups else None,
+    }
+
+
+@receiver(post_save, sender=Place)
+@receiver(post_delete, sender=Place)
+def place_changed(sender, instance, **kwargs):
+    invalidate([instance.uuid])
+
+
+@receiver(m2m_changed, sender=UUIDTaggedItem)
+def place_tags_changed(sender, instance, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate([instance.uuid])
+
+
+@receiver(places_bulk_changed, sender=Place)
+def places_bulk_saved(sender, created, updated, **kwargs):
+    # Created places were never cached, but appear in the list pages
+    invalidate([place.uuid for place in updated])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, created=False, **kwargs):
+    # New tags are only visible once places are tagged with them
+    if not created:
+        invalidate(tags=True)
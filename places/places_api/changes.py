@@ -0,0 +1,214 @@
+"""
+Change feed of places, for clients that keep a copy of the catalogue.
+
+Every write to a place, its tags or its existence appends a `PlaceChange` row,
+from the receivers below. `GET /api/place/changes?since=<token>` returns the
+places changed after the token, each once, by its latest change, in the order
+of the changes: the current representation of the place, or a tombstone if it
+was deleted. Clients store the token of the response and pass it next time,
+so what they download is proportional to what changed since.
+
+Tokens hold the id of the last change returned, the changes are numbered in
+their order. On SQLite writes are serialized, so rows commit in the order of
+their ids. On PostgreSQL, the writers take a lock until they commit, so a
+client cannot read a change and miss an earlier one committed after it.
+
+`compact()` deletes the changes later ones supersede, which no client needs,
+and the tombstones older than a retention period. Tokens also hold the latest
+compaction when they were issued: those from before a compaction that pruned
+tombstones after their change expire, their clients have to sync again from
+the start, which returns every place once and no tombstone.
+"""
+from datetime import timedelta
+
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.db.models import Exists
+from django.db.models import Max
+from django.db.models import OuterRef
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from taggit.models import Tag
+
+from .models import ChangeFeedCompaction
+from .models import Place
+from .models import PlaceChange
+from .models import UUIDTaggedItem
+from .serializers import place_representations
+from .serializers import place_values
+from .signals import place_changes_recorded
+from .signals import places_bulk_changed
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+TOMBSTONE_RETENTION = timedelta(days=30)
+# pg_advisory_xact_lock() key serializing the writers of the feed
+LOCK_KEY = 0x706C6163
+
+
+def record(place_uuids, deleted=False, using=None):
+    """Appends a change, or a tombstone, for each place."""
+    if not place_uuids:
+        return
+    using = using or router.db_for_write(PlaceChange)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.vendor == "postgresql":
+            # Held until the transaction commits, so the ids are committed in
+            # their order
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [LOCK_KEY])
+        PlaceChange.objects.using(using).bulk_create(
+            [
+                PlaceChange(place_uuid=place_uuid, deleted=deleted)
+                for place_uuid in place_uuids
+            ]
+        )
+        place_changes_recorded.send(sender=PlaceChange, using=using)
+
+
+def latest_compaction():
+    """The id and horizon of the latest compaction, zeros before the first."""
+    return ChangeFeedCompaction.objects.order_by("-id").values_list(
+        "id", "horizon"
+    ).first() or (0, 0)
+
+
+def make_token(change_id, compaction_id):
+    return f"{change_id}.{compaction_id}"
+
+
+def parse_token(token):
+    """The change and compaction ids of a token, ValueError if it is not one."""
+    change_id, compaction_id = (int(part) for part in token.split("."))
+    if change_id < 0 or compaction_id < 0:
+        raise ValueError(token)
+    return change_id, compaction_id
+
+
+def expired(token, compaction):
+    """Whether a compaction after the token pruned tombstones it did not see."""
+    change_id, compaction_id = token
+    latest_id, horizon = compaction
+    return compaction_id < latest_id and change_id < horizon
+
+
+def latest_changes(since, limit):
+    """
+    The changes after `since` no later change of the same place supersedes,
+    in order, at most `limit` of them.
+    """
+    later = PlaceChange.objects.filter(
+        place_uuid=OuterRef("place_uuid"), id__gt=OuterRef("id")
+    )
+    return list(
+        PlaceChange.objects.filter(id__gt=since)
+        .exclude(Exists(later))
+        .order_by("id")[:limit]
+    )
+
+
+def last_change_id():
+    return PlaceChange.objects.aggregate(id=Max("id"))["id"] or 0
+
+
+def change_items(rows, compaction_id):
+    """
+    The items of the feed for `latest_changes()` rows: their token, and the
+    current representation of the place or a tombstone. Upserts of places
+    deleted since are left out, their tombstone follows.
+    """
+    places = {
+        place["uuid"]: place
+        for place in place_representations(
+            list(
+                place_values(
+                    Place.objects.filter(
+                        uuid__in=[row.place_uuid for row in rows if not row.deleted]
+                    )
+                )
+            )
+        )
+    }
+    items = []
+    for row in rows:
+        place = None if row.deleted else places.get(str(row.place_uuid))
+        if not row.deleted and place is None:
+            continue
+        items.append(
+            {
+                "token": make_token(row.id, compaction_id),
+                "uuid": str(row.place_uuid),
+                "deleted": row.deleted,
+                "place": place,
+            }
+        )
+    return items
+
+
+def compact(tombstone_retention=TOMBSTONE_RETENTION):
+    """
+    Deletes the superseded changes and the tombstones older than the
+    retention, and returns how many rows of each it deleted.
+    """
+    later = PlaceChange.objects.filter(
+        place_uuid=OuterRef("place_uuid"), id__gt=OuterRef("id")
+    )
+    with transaction.atomic():
+        superseded, _ = PlaceChange.objects.filter(Exists(later)).delete()
+        tombstones = PlaceChange.objects.filter(
+            deleted=True, created_at__lt=timezone.now() - tombstone_retention
+        )
+        latest = tombstones.aggregate(id=Max("id"))["id"]
+        pruned = 0
+        if latest is not None:
+            pruned, _ = tombstones.filter(id__lte=latest).delete()
+            ChangeFeedCompaction.objects.create(horizon=latest)
+    return superseded, pruned
+
+
+@receiver(post_save, sender=Place)
+def place_saved(sender, instance, using, **kwargs):
+    record([instance.uuid], using=using)
+
+
+@receiver(post_delete, sender=Place)
+def place_deleted(sender, instance, using, **kwargs):
+    record([instance.uuid], deleted=True, using=using)
+
+
+@receiver(m2m_changed, sender=UUIDTaggedItem)
+def place_tags_changed(sender, instance, action, using, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        record([instance.uuid], using=using)
+
+
+@receiver(places_bulk_changed, sender=Place)
+def places_bulk_saved(sender, created, updated, **kwargs):
+    record([place.uuid for place in created + updated])
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, using, **kwargs):
+    # Renaming a tag changes every place carrying it
+    if not created:
+        record(tagged_uuids(instance, using), using=using)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, using, **kwargs):
+    # In the transaction deleting the tag, while its items still exist
+    record(tagged_uuids(instance, using), using=using)
+
+
+def tagged_uuids(tag, using):
+    return list(
+        UUIDTaggedItem.objects.using(using)
+        .filter(tag=tag)
+        .values_list("object_id", flat=True)
+    )
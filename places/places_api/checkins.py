@@ -0,0 +1,372 @@
+"""
+Check-ins of users at places, which award them the check-in points of the
+place.
+
+`POST /api/place/<uuid>/checkins` answers once the check-in is in the buffer
+of the process, which records the check-ins in batches: a transaction writes
+the `PlaceCheckin` rows of hundreds of them and adds them to the counters of
+their places and users, `PlaceCheckinSummary` and `UserCheckinSummary`, with
+one upsert each. The database increments the counters, so the batches of
+several processes add up.
+
+The buffer appends each check-in to a segment of the log in
+`PLACES_CHECKIN_LOG_DIR` before answering, with a single write, and deletes
+the segment once its check-ins are recorded, every
+`PLACES_CHECKIN_FLUSH_INTERVAL` seconds. A crash of the process loses none
+of them, the operating system holds the lines, and a power loss at most
+those of the last interval, which it may not have written to the disk yet.
+Segments that fail to record are synced and retried. Those no buffer holds,
+of processes that stopped, are recorded by the next buffer to start and by
+`manage.py replay_checkins`. Check-ins already recorded are skipped, so are
+retries of a check-in with the same id.
+"""
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db import close_old_connections
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .bulk import add_to_summaries
+from .bulk import chunked
+from .models import Place
+from .models import PlaceCheckin
+from .models import PlaceCheckinSummary
+from .models import UserCheckinSummary
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows, replays there also take live segments
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ["count", "points_sum"]
+# Check-ins of a process waiting to be recorded before new ones are refused
+MAX_PENDING = 100_000
+# pg_advisory_xact_lock() key serializing the writers of check-ins
+LOCK_KEY = 0x63686B6E
+
+
+class CheckinsBackedUp(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many check-ins are waiting to be recorded, retry later."
+    default_code = "checkins_backed_up"
+    # Seconds, sent as Retry-After
+    wait = 1
+
+
+def record(checkins, using=None):
+    """
+    Writes check-ins and adds them to the summaries, in a transaction per
+    batch, but those already recorded and those of places deleted since.
+    Returns the check-ins written.
+    """
+    using = using or router.db_for_write(PlaceCheckin)
+    written = []
+    for batch in chunked(list(checkins)):
+        written += record_batch(batch, using)
+    return written
+
+
+def record_batch(checkins, using):
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.vendor == "postgresql":
+            # Held until the transaction commits, so two writers cannot both
+            # find the same check-in missing
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [LOCK_KEY])
+        seen = set(
+            PlaceCheckin.objects.using(using)
+            .filter(id__in=[checkin.id for checkin in checkins])
+            .values_list("id", flat=True)
+        )
+        places = set(
+            Place.objects.using(using)
+            .filter(uuid__in={checkin.place_uuid for checkin in checkins})
+            .values_list("uuid", flat=True)
+        )
+        written = []
+        for checkin in checkins:
+            if checkin.id not in seen and checkin.place_uuid in places:
+                seen.add(checkin.id)
+                written.append(checkin)
+        PlaceCheckin.objects.using(using).bulk_create(written)
+
+        place_key = PlaceCheckinSummary._meta.pk
+        add_to_summaries(
+            PlaceCheckinSummary,
+            [place_key.column, *COLUMNS],
+            summary_deltas(
+                (place_key.get_db_prep_value(checkin.place_uuid, connection), checkin)
+                for checkin in written
+            ),
+            using,
+        )
+        add_to_summaries(
+            UserCheckinSummary,
+            [UserCheckinSummary._meta.pk.column, *COLUMNS],
+            summary_deltas((checkin.user, checkin) for checkin in written),
+            using,
+        )
+    return written
+
+
+def summary_deltas(keyed_checkins):
+    """The changes of the summaries, by key, for (key, check-in) pairs."""
+    deltas = {}
+    for key, checkin in keyed_checkins:
+        delta = deltas.setdefault((key,), [0, 0])
+        delta[0] += 1
+        delta[1] += checkin.points
+    return deltas
+
+
+def totals(model, key):
+    """The check-ins recorded for a place or a user, and the points awarded."""
+    count, points = model.objects.filter(pk=key).values_list(
+        "count", "points_sum"
+    ).first() or (0, 0)
+    return {"count": count, "points": points}
+
+
+def encode(checkin):
+    line = json.dumps(
+        {
+            "id": str(checkin.id),
+            "place": str(checkin.place_uuid),
+            "user": checkin.user,
+            "points": checkin.points,
+            "created_at": checkin.created_at.isoformat(),
+        }
+    )
+    return f"{line}\n".encode("utf-8")
+
+
+def decode(line):
+    """The check-in of a line of the log, ValueError if it is not one."""
+    try:
+        data = json.loads(line)
+        created_at = parse_datetime(data["created_at"])
+        if created_at is None:
+            raise ValueError(data["created_at"])
+        return PlaceCheckin(
+            id=uuid.UUID(data["id"]),
+            place_uuid=uuid.UUID(data["place"]),
+            user=str(data["user"]),
+            points=int(data["points"]),
+            created_at=created_at,
+        )
+    except (KeyError, TypeError) as error:
+        raise ValueError(line) from error
+
+
+def lock(fd, blocking=True):
+    """Locks a segment, returns False if another open file holds it."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
+
+
+class Segment:
+    """
+    Check-ins of a buffer, and the file of the log they are appended to if
+    it has one. The file stays locked until they are recorded.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.checkins = []
+        self.fd = None
+        if path is not None:
+            # Created under another name and renamed once locked, as replays
+            # take the `.log` files they can lock
+            temporary = path.with_suffix(".tmp")
+            self.fd = os.open(
+                temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644
+            )
+            lock(self.fd)
+            os.replace(temporary, path)
+
+    def append(self, checkin):
+        if self.fd is not None:
+            os.write(self.fd, encode(checkin))
+        self.checkins.append(checkin)
+
+    def sync(self):
+        if self.fd is not None:
+            os.fsync(self.fd)
+
+    def delete(self):
+        if self.fd is not None:
+            # Before closing, which releases the lock
+            self.path.unlink()
+            os.close(self.fd)
+            self.fd = None
+
+
+def read_segment(path):
+    checkins = []
+    with open(path, "rb") as file:
+        for number, line in enumerate(file, 1):
+            try:
+                checkins.append(decode(line))
+            except ValueError:
+                # The last line, of a segment the disk got part of
+                logger.warning("Skipped line %s of %s, not a check-in", number, path)
+    return checkins
+
+
+def replay(log_dir, using=None):
+    """
+    Records the check-ins of the segments of `log_dir` no buffer holds, left
+    by processes that stopped before recording them, and deletes them.
+    Returns the number of segments and of check-ins recorded.
+    """
+    segments = recorded = 0
+    for path in sorted(Path(log_dir).glob("*.log")):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:  # Recorded in between
+            continue
+        try:
+            if not lock(fd, blocking=False):
+                continue
+            recorded += len(record(read_segment(path), using))
+            path.unlink(missing_ok=True)
+            segments += 1
+        finally:
+            os.close(fd)
+    return segments, recorded
+
+
+class CheckinBuffer:
+    """
+    The check-ins of this process waiting to be recorded: those of the
+    segment they are appended to and of the segments being recorded. A
+    thread records them every `flush_interval` seconds, once started, and
+    an interval of 0 records each check-in as it is added. Without a
+    `log_dir` they are only kept in memory.
+    """
+
+    def __init__(self, log_dir=None, flush_interval=1.0, max_pending=MAX_PENDING):
+        self.log_dir = Path(log_dir) if log_dir else None
+        if self.log_dir is not None:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Guards the segments, held for the write of a line
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.segment = None
+        # Segments being recorded, or that failed to, oldest first
+        self.closed = []
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add(self, checkin):
+        """Raises `CheckinsBackedUp` when too many are waiting."""
+        if not self.flush_interval:
+            record([checkin])
+            return
+        with self.lock:
+            if self.pending() >= self.max_pending:
+                raise CheckinsBackedUp()
+            if self.segment is None:
+                self.segment = Segment(self.segment_path())
+            self.segment.append(checkin)
+
+    def pending(self):
+        segments = self.closed + ([self.segment] if self.segment else [])
+        return sum(len(segment.checkins) for segment in segments)
+
+    def segment_path(self):
+        if self.log_dir is None:
+            return None
+        # Sorted in their order, unique across processes
+        return self.log_dir / f"{time.time_ns()}-{os.getpid()}.log"
+
+    def flush(self):
+        """
+        Records the check-ins waiting and returns how many were recorded.
+        Raises `DatabaseError` when a segment fails to record, it is synced
+        and retried by the next flush.
+        """
+        with self.flush_lock:
+            with self.lock:
+                if self.segment is not None:
+                    self.closed.append(self.segment)
+                    self.segment = None
+                segments = list(self.closed)
+            recorded = 0
+            for segment in segments:
+                try:
+                    recorded += len(record(segment.checkins))
+                except DatabaseError:
+                    segment.sync()
+                    raise
+                segment.delete()
+                with self.lock:
+                    self.closed.remove(segment)
+            return recorded
+
+    def start(self):
+        if not self.flush_interval or self.thread is not None:
+            return
+        self.thread = threading.Thread(
+            target=self.run, name="places-checkins", daemon=True
+        )
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stops the thread once it recorded the check-ins still waiting."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        if self.log_dir is not None:
+            try:
+                replay(self.log_dir)
+            except DatabaseError:
+                logger.warning("Replaying the check-in log failed", exc_info=True)
+        while True:
+            stopping = self.stopped.wait(self.flush_interval)
+            # As between requests, for the connection of this thread
+            close_old_connections()
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.warning("Recording check-ins failed", exc_info=True)
+            if stopping:
+                connections.close_all()
+                return
+
+
+@functools.lru_cache(maxsize=None)
+def get_buffer():
+    """The buffer of this process, started on first use."""
+    buffer = CheckinBuffer(
+        settings.PLACES_CHECKIN_LOG_DIR, settings.PLACES_CHECKIN_FLUSH_INTERVAL
+    )
+    buffer.start()
+    return buffer
@@ -0,0 +1,48 @@
+from django.apps import apps
+from django.core.checks import Error
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.questioner import NonInteractiveMigrationQuestioner
+from django.db.migrations.state import ProjectState
+
+APP_LABELS = {"places_api"}
+
+
+def check_migrations(app_configs=None, databases=None, **kwargs):
+    """
+    Fails the commands checking the databases, `migrate`, `test` and `check
+    --database default`, when the models of this project have changes no
+    migration describes, as `makemigrations --check` would, so the schema the
+    migrations create is always the one the ORM expects. Registered as a
+    database check, `makemigrations`, which is run to fix the drift, does not
+    run it.
+    """
+    # As Django's database checks, run for the commands passing databases
+    if not databases:
+        return []
+    labels = APP_LABELS
+    if app_configs is not None:
+        labels = labels & {app_config.label for app_config in app_configs}
+    if not labels:
+        return []
+
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    autodetector = MigrationAutodetector(
+        loader.project_state(),
+        ProjectState.from_apps(apps),
+        NonInteractiveMigrationQuestioner(specified_apps=labels, dry_run=True),
+    )
+    changes = autodetector.changes(graph=loader.graph, trim_to_apps=labels)
+    return [
+        Error(
+            f"The {label} models differ from its migrations: "
+            + "; ".join(
+                operation.describe()
+                for migration in migrations
+                for operation in migration.operations
+            ),
+            hint=f"Run `manage.py makemigrations {label}`.",
+            id="places_api.E001",
+        )
+        for label, migrations in sorted(changes.items())
+    ]
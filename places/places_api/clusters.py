@@ -0,0 +1,279 @@
+"""
+Server-side clusters of places, for the tiles of a web map.
+
+`PlaceCluster` sums up the places of each type within every geohash cell, for
+the cell prefixes of one to `MAX_PRECISION` characters: their count, and the
+sums of their coordinates and check-in points. The receivers below keep it in
+step with the writes, adding the values a place is saved with and subtracting
+those it had in the database, read with its row locked in the transaction of
+the write so that concurrent writes to the same place wait for each other,
+and `rebuild()` recomputes it from the places, for writes that bypass the
+signals.
+
+A tile reads the coarsest precision with at least `CELLS_PER_TILE` cells
+across it, 4 to 16 as geohash cells halve their width in turns of two and
+eight, within the geohash prefixes covering it, so its cost depends on its
+size on screen rather than on the number of places in it. Each cell is a
+cluster, centred on the mean of its places, and belongs to the tile its
+centre falls in. From `PLACES_ZOOM` on, tiles list their places instead,
+unless there are more than `MAX_TILE_PLACES` of them.
+"""
+from decimal import Decimal
+
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .bulk import add_to_summaries
+from .filters import GeoFilter
+from .geo import geohash_cell_size
+from .geo import geohash_cover
+from .geo import tile_bbox
+from .models import Place
+from .models import PlaceCluster
+from .serializers import place_representations
+from .serializers import place_values
+from .signals import places_bulk_changed
+
+# Cells of about 150m, a sixteenth of the width of the tiles before PLACES_ZOOM
+MAX_PRECISION = 7
+CELLS_PER_TILE = 4
+# Geohash prefixes a tile is read with
+COVER_CELLS = 16
+PLACES_ZOOM = 15
+MAX_ZOOM = 22
+MAX_TILE_PLACES = 500
+TOP_TYPES = 3
+# Coordinates are summed in millionths of a degree
+MICRO = 1_000_000
+SUMMARY_FIELDS = [
+    "geohash",
+    "type",
+    "location_lat",
+    "location_lon",
+    "reward_checkin_points",
+]
+COLUMNS = [
+    "precision",
+    "cell",
+    "type",
+    "count",
+    "lat_sum",
+    "lon_sum",
+    "points_sum",
+]
+
+
+def precision_for_zoom(zoom):
+    """The coarsest precision with at least `CELLS_PER_TILE` cells across a tile."""
+    tile_width = 360.0 / 2**zoom
+    for precision in range(1, MAX_PRECISION + 1):
+        if geohash_cell_size(precision)[1] <= tile_width / CELLS_PER_TILE:
+            return precision
+    return MAX_PRECISION
+
+
+def in_tile(lat, lon, bbox):
+    # Tiles own their western and southern edges, so no point is in two
+    min_lat, min_lon, max_lat, max_lon = bbox
+    return min_lat <= lat < max_lat and min_lon <= lon < max_lon
+
+
+def tile(zoom, x, y):
+    """
+    The clusters of a tile and, from `PLACES_ZOOM` on, its places:
+    `{"zoom": ..., "bbox": [...], "clusters": [...], "places": [...]}`, where
+    `places` is null for tiles with too many places to list.
+    """
+    bbox = tile_bbox(zoom, x, y)
+    places = tile_places(bbox) if zoom >= PLACES_ZOOM else None
+    return {
+        "zoom": zoom,
+        "bbox": list(bbox),
+        "clusters": [] if places is not None else tile_clusters(bbox, zoom),
+        "places": places,
+    }
+
+
+def tile_places(bbox):
+    """The places of a tile, None if there are more than `MAX_TILE_PLACES`."""
+    rows = list(
+        place_values(GeoFilter.filter_bbox(Place.objects.all(), *bbox)).order_by(
+            "code", "uuid"
+        )[: MAX_TILE_PLACES + 1]
+    )
+    if len(rows) > MAX_TILE_PLACES:
+        return None
+    return place_representations(
+        [
+            row
+            for row in rows
+            if in_tile(float(row["location_lat"]), float(row["location_lon"]), bbox)
+        ]
+    )
+
+
+def tile_clusters(bbox, zoom):
+    """The clusters centred in a tile, by cell."""
+    precision = precision_for_zoom(zoom)
+    rows = PlaceCluster.objects.filter(precision=precision)
+    prefixes = {
+        cell[:precision] for cell in geohash_cover(*bbox, max_cells=COVER_CELLS)
+    }
+    if prefixes:
+        # "{" sorts right after "z", the last geohash character. The precision
+        # is repeated in every range for SQLite to search the index with each
+        prefix_ranges = Q()
+        for prefix in prefixes:
+            prefix_ranges |= Q(
+                precision=precision, cell__gte=prefix, cell__lt=prefix + "{"
+            )
+        rows = PlaceCluster.objects.filter(prefix_ranges)
+
+    cells = {}
+    for cell, place_type, *sums in rows.values_list("cell", *COLUMNS[2:]):
+        cells.setdefault(cell, []).append((place_type, *sums))
+
+    clusters = []
+    for cell, types in sorted(cells.items()):
+        count, lat_sum, lon_sum, points_sum = (
+            sum(row[column] for row in types) for column in range(1, 5)
+        )
+        lat, lon = lat_sum / count / MICRO, lon_sum / count / MICRO
+        if not in_tile(lat, lon, bbox):
+            continue
+        types.sort(key=lambda row: (-row[1], row[0]))
+        clusters.append(
+            {
+                "cell": cell,
+                "count": count,
+                "location": {"lat": round(lat, 6), "lon": round(lon, 6)},
+                "types": [
+                    {"type": place_type, "count": type_count}
+                    for place_type, type_count, *_ in types[:TOP_TYPES]
+                ],
+                "reward_checkin_points": points_sum,
+            }
+        )
+    return clusters
+
+
+def summary(values):
+    """
+    What a place adds to the clusters, from its field values by attname:
+    (geohash, type, lat, lon, points), None if some of them are unknown.
+    """
+    if not all(values.get(field) is not None for field in SUMMARY_FIELDS):
+        return None
+    return (
+        values["geohash"],
+        values["type"],
+        micro(values["location_lat"]),
+        micro(values["location_lon"]),
+        values["reward_checkin_points"],
+    )
+
+
+def micro(degrees):
+    # Through str() so floats convert to the decimal they were written as
+    return round(Decimal(str(degrees)) * MICRO)
+
+
+def current_values(place):
+    return {field: getattr(place, field) for field in SUMMARY_FIELDS}
+
+
+def place_deltas(changes):
+    """
+    The changes of the cluster sums, by (precision, cell, type), for (saved
+    values, new values) pairs of places, None values for creations and
+    deletions.
+    """
+    deltas = {}
+    for old, new in changes:
+        old, new = summary(old or {}), summary(new or {})
+        if old == new:
+            continue
+        for sign, values in ((-1, old), (1, new)):
+            if values is None:
+                continue
+            geohash, place_type, *sums = values
+            for precision in range(1, MAX_PRECISION + 1):
+                delta = deltas.setdefault(
+                    (precision, geohash[:precision], place_type), [0, 0, 0, 0]
+                )
+                for i, value in enumerate([1, *sums]):
+                    delta[i] += sign * value
+    return deltas
+
+
+def apply(deltas, using=None):
+    """
+    Adds the deltas to the clusters and deletes the clusters left without
+    places.
+    """
+    add_to_summaries(PlaceCluster, COLUMNS, deltas, using)
+
+
+def rebuild(using=None):
+    """
+    Recomputes every cluster from the places, in one transaction, and returns
+    the number of clusters. The finest cells are summed up from the places,
+    each coarser precision from the one below.
+    """
+    using = using or router.db_for_write(PlaceCluster)
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    table = quote_name(PlaceCluster._meta.db_table)
+    columns = ", ".join(quote_name(column) for column in COLUMNS)
+    meta = Place._meta
+    place_table = quote_name(meta.db_table)
+    geohash, place_type, lat, lon, points = (
+        quote_name(meta.get_field(field).column) for field in SUMMARY_FIELDS
+    )
+    precision, cell, cluster_type, *sums = (quote_name(column) for column in COLUMNS)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) "
+            f"SELECT %s, SUBSTR({geohash}, 1, %s), {place_type}, COUNT(*), "
+            f"SUM(CAST(ROUND({lat} * {MICRO}) AS BIGINT)), "
+            f"SUM(CAST(ROUND({lon} * {MICRO}) AS BIGINT)), SUM({points}) "
+            f"FROM {place_table} GROUP BY SUBSTR({geohash}, 1, %s), {place_type}",
+            [MAX_PRECISION, MAX_PRECISION, MAX_PRECISION],
+        )
+        for coarser in range(MAX_PRECISION - 1, 0, -1):
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT %s, SUBSTR({cell}, 1, %s), {cluster_type}, "
+                f"{', '.join(f'SUM({column})' for column in sums)} "
+                f"FROM {table} WHERE {precision} = %s "
+                f"GROUP BY SUBSTR({cell}, 1, %s), {cluster_type}",
+                [coarser, coarser, coarser + 1, coarser],
+            )
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        return cursor.fetchone()[0]
+
+
+@receiver(post_save, sender=Place)
+def place_saved(sender, instance, using, **kwargs):
+    apply(place_deltas([(instance.saved_values, current_values(instance))]), using)
+
+
+@receiver(post_delete, sender=Place)
+def place_deleted(sender, instance, using, **kwargs):
+    apply(place_deltas([(instance.saved_values, None)]), using)
+
+
+@receiver(places_bulk_changed, sender=Place)
+def places_bulk_saved(sender, created, updated, **kwargs):
+    apply(
+        place_deltas(
+            [(None, current_values(place)) for place in created]
+            + [(place.saved_values, current_values(place)) for place in updated]
+        )
+    )
@@ -0,0 +1,84 @@
+"""
+Conditional requests on places.
+
+A place's ETag is its `version`, so it is strong: the version changes with
+every change to the representation, tags included. `If-None-Match` on reads
+answers 304 before serializing, and `If-Match` on writes makes them fail with
+412 when the place changed since the client read it.
+"""
+from django.db.models import F
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Place
+
+# Other renderers, such as the browsable API, produce different bytes for
+# the same version of a place, they get no ETag
+ETAG_FORMATS = {"json"}
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "The place was modified since it was read."
+    default_code = "precondition_failed"
+
+
+def has_etag(request):
+    return request.accepted_renderer.format in ETAG_FORMATS
+
+
+def place_etag(place):
+    return quote_etag(str(place.version))
+
+
+def if_none_match(request, etag):
+    """Weak comparison, as RFC 9110 requires for If-None-Match."""
+    header = request.headers.get("If-None-Match")
+    if header is None:
+        return False
+    etags = {strip_weakness(tag) for tag in parse_etags(header)}
+    return "*" in etags or strip_weakness(etag) in etags
+
+
+def strip_weakness(etag):
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def not_modified(etag):
+    # A plain response, so views outside of DRF can return it too
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+def check_if_match(request, place):
+    """
+    Enforces `If-Match` before a write and locks the place row until the end
+    of the transaction, so a concurrent write cannot slip in after the check.
+    Must run inside the transaction of the write.
+    """
+    header = request.headers.get("If-Match")
+    if header is None:
+        return
+
+    place_rows = Place.objects.filter(pk=place.pk)
+    etags = parse_etags(header)
+    if "*" not in etags:
+        # Strong comparison: weak ETags never match
+        versions = [
+            int(etag[1:-1])
+            for etag in etags
+            if etag.startswith('"') and etag[1:-1].isdigit()
+        ]
+        place_rows = place_rows.filter(version__in=versions)
+
+    # An update that changes nothing takes the row lock (the database write
+    # lock on SQLite) and tells whether the version still matches
+    if not place_rows.update(version=F("version")):
+        raise PreconditionFailed()
+    place.refresh_from_db()
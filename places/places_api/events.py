@@ -0,0 +1,504 @@
+"""
+Live place changes, streamed to dashboards as server-sent events.
+
+`GET /api/place/events` answers with a `text/event-stream` of the items of
+the change feed (see `changes.py`) as they commit, one `change` event each,
+with the token of the item as the event id:
+
+    id: 42.0
+    event: change
+    data: {"token": "42.0", "uuid": "...", "deleted": false, "place": {...}}
+
+`?bbox=min_lon,min_lat,max_lon,max_lat` and `?tags=cafe,wifi` (all of them,
+or any with `&tags_match=any`) keep the places the list would. Deletions are
+sent to every client, their place is gone. Browsers reconnect with the id of
+the last event they got, other clients can pass a token as `?since=`: the
+changes they missed are sent first. When they are too many, or the token
+expired, a `reset` event ends the stream, the client has to sync from
+`/api/place/changes` again.
+
+Django 4.1 cannot stream from async views, the stream is served by
+`EventStreamApplication`, which wraps the Django application in `asgi.py`
+and, serving the stream before the middleware, checks the host against
+`ALLOWED_HOSTS` itself.
+Each process runs one `Broadcaster`: it reads the new changes once for all
+the connections of the process, queues the events to each and sends them the
+heartbeats, so an idle connection costs a list and the coroutines waiting
+on it and on the client. The lists are bounded, a client falling behind
+gets a `reset` instead of holding events back, browsers then reconnect and
+catch up from the feed. Writers only schedule a wake-up of the broadcaster
+once they commit.
+
+Which writes wake the broadcaster depends on `PLACES_EVENTS_BACKEND`:
+`LocalBackend` only sees the writes of its process, `PollingBackend` also
+reads the feed every second for the writes of the other workers and of
+commands, and `PostgresBackend` listens for the notifications the writers
+send on PostgreSQL.
+"""
+import asyncio
+import functools
+import io
+import json
+import logging
+import select
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+from . import changes
+from .filters import GeoFilter
+from .models import PlaceChange
+from .renderers import ndjson_line
+from .signals import place_changes_recorded
+
+logger = logging.getLogger(__name__)
+# Where Django logs the requests of unknown hosts
+security_logger = logging.getLogger("django.security.DisallowedHost")
+
+EVENTS_PATH = "/api/place/events"
+# Events a client may fall behind by before it is reset
+QUEUE_SIZE = 1000
+# Changes sent to reconnecting clients, those missing more are reset
+MAX_REPLAY = changes.MAX_PAGE_SIZE
+# Comments keep idle connections open through proxies, and reveal those the
+# clients dropped
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 3000
+NOTIFY_CHANNEL = "places_changes"
+
+RESET = (
+    b"event: reset\n"
+    b'data: {"detail":"Sync again from the change feed, then reconnect."}\n\n'
+)
+HEARTBEAT = b": heartbeat\n\n"
+
+
+class LocalBackend:
+    """Wakes the broadcaster when the writes of this process commit."""
+
+    # Seconds between reads of the feed when nothing woke the broadcaster
+    poll_interval = None
+
+    def __init__(self):
+        self.wake = None
+
+    def start(self, wake):
+        self.wake = wake
+
+    def stop(self):
+        self.wake = None
+
+    def recorded(self, using):
+        # Called in the transaction of the writer
+        wake = self.wake
+        if wake is not None:
+            transaction.on_commit(wake, using=using)
+
+
+class PollingBackend(LocalBackend):
+    """Also reads the feed every second, for the writes of other processes."""
+
+    poll_interval = 1
+
+
+class PostgresBackend(LocalBackend):
+    """
+    Wakes the broadcaster on the notifications every writer sends on
+    PostgreSQL, which are delivered when their transaction commits. A thread
+    listens for them on a connection of its own.
+    """
+
+    reconnect_seconds = 1
+
+    def start(self, wake):
+        super().start(wake)
+        self.stopped = threading.Event()
+        threading.Thread(
+            target=self.listen,
+            args=(wake, self.stopped),
+            name="places-events-listener",
+            daemon=True,
+        ).start()
+
+    def stop(self):
+        self.stopped.set()
+        super().stop()
+
+    def recorded(self, using):
+        connection = connections[using]
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, '')", [NOTIFY_CHANNEL])
+        super().recorded(using)
+
+    def listen(self, wake, stopped):
+        wrapper = connections[router.db_for_write(PlaceChange)]
+        while not stopped.is_set():
+            listener = None
+            try:
+                listener = wrapper.get_new_connection(wrapper.get_connection_params())
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Changes may have committed while it was not listening
+                wake()
+                while not stopped.is_set():
+                    if select.select([listener], [], [], 1)[0]:
+                        listener.poll()
+                        if listener.notifies:
+                            listener.notifies.clear()
+                            wake()
+            except wrapper.Database.Error:
+                logger.warning("Listening for place changes failed", exc_info=True)
+                stopped.wait(self.reconnect_seconds)
+            finally:
+                if listener is not None:
+                    listener.close()
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.PLACES_EVENTS_BACKEND)()
+
+
+@receiver(place_changes_recorded)
+def changes_recorded(sender, using, **kwargs):
+    get_backend().recorded(using)
+
+
+class Subscription:
+    """
+    The filters of a connection, and the messages pending for it: pairs of
+    the change id of an event, None for the others, and the event to send.
+    None ends the stream.
+    """
+
+    # A list and a future, lighter than a queue with thousands of connections
+    __slots__ = ("bbox", "tags", "any_tag", "pending", "waiter", "closed")
+
+    def __init__(self, bbox=None, tags=None, any_tag=False):
+        self.bbox = bbox
+        self.tags = tags
+        self.any_tag = any_tag
+        self.pending = []
+        self.waiter = None
+        self.closed = False
+
+    def wants(self, item):
+        place = item["place"]
+        if place is None:
+            return True
+        if self.bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = self.bbox
+            location = place["location"]
+            if not (
+                min_lat <= location["lat"] <= max_lat
+                and min_lon <= location["lon"] <= max_lon
+            ):
+                return False
+        if self.tags:
+            if self.any_tag:
+                return not self.tags.isdisjoint(place["tags"])
+            return self.tags.issubset(place["tags"])
+        return True
+
+    def put(self, change_id, item, event):
+        if self.closed or not self.wants(item):
+            return
+        if len(self.pending) >= QUEUE_SIZE:
+            # The events it missed are dropped, the reset is all it still gets
+            self.close((None, RESET))
+        else:
+            self.push((change_id, event))
+
+    def heartbeat(self):
+        # Those with events pending get them instead
+        if not self.closed and not self.pending:
+            self.push((None, HEARTBEAT))
+
+    def close(self, message=None):
+        """Drops the pending messages, `message` is the last one."""
+        self.closed = True
+        self.pending.clear()
+        self.push(message)
+
+    def push(self, message):
+        self.pending.append(message)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def get(self):
+        """Waits for messages, and returns all those pending."""
+        while not self.pending:
+            self.waiter = asyncio.get_running_loop().create_future()
+            await self.waiter
+        messages, self.pending = self.pending, []
+        return messages
+
+
+class Broadcaster:
+    """
+    Reads the changes committed since its last read, when the backend wakes
+    it, and queues their events to the subscriptions of the process. It runs
+    while there are subscriptions, on the event loop of the server.
+    """
+
+    def __init__(self, backend, loop):
+        self.backend = backend
+        self.loop = loop
+        self.subscriptions = set()
+        # Set once it knows the last change id, the subscriptions get the
+        # events of the changes after it
+        self.ready = asyncio.Event()
+        self.wakeup = asyncio.Event()
+        self.change_id = 0
+        self.task = None
+
+    def subscribe(self, subscription):
+        self.subscriptions.add(subscription)
+        if self.task is None:
+            self.task = self.loop.create_task(self.run())
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def wake(self):
+        # From any thread, e.g. the one committing a write
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:  # The loop was closed
+            pass
+
+    async def run(self):
+        self.backend.start(self.wake)
+        heartbeats = self.loop.create_task(self.send_heartbeats())
+        try:
+            while self.subscriptions:
+                try:
+                    if self.ready.is_set():
+                        await self.read()
+                    else:
+                        self.change_id = await sync_to_async(changes.last_change_id)()
+                        self.ready.set()
+                except Exception:
+                    logger.exception("Reading the place changes failed")
+                try:
+                    await asyncio.wait_for(
+                        self.wakeup.wait(),
+                        self.backend.poll_interval
+                        if self.ready.is_set()
+                        else RETRY_MS / 1000,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+        finally:
+            heartbeats.cancel()
+            self.backend.stop()
+            self.ready.clear()
+            self.task = None
+
+    async def send_heartbeats(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            for subscription in self.subscriptions:
+                subscription.heartbeat()
+
+    async def read(self):
+        while self.subscriptions:
+            events, change_id, more = await sync_to_async(read_events)(
+                self.change_id, changes.MAX_PAGE_SIZE
+            )
+            self.change_id = change_id
+            for event_id, item, event in events:
+                for subscription in self.subscriptions:
+                    subscription.put(event_id, item, event)
+            if not more:
+                return
+
+
+_broadcaster = None
+
+
+def get_broadcaster():
+    """The broadcaster of this process, for the running event loop."""
+    global _broadcaster
+    loop = asyncio.get_running_loop()
+    if _broadcaster is None or _broadcaster.loop is not loop:
+        _broadcaster = Broadcaster(get_backend(), loop)
+    return _broadcaster
+
+
+def read_events(since, limit):
+    """
+    The events of the changes after the id `since`, up to `limit` of them,
+    the id they were read up to and whether there are more, as
+    `(change id, item, event)` triples.
+    """
+    compaction_id, _ = changes.latest_compaction()
+    rows = changes.latest_changes(since, limit + 1)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    items = changes.change_items(rows, compaction_id)
+    events = [
+        (changes.parse_token(item["token"])[0], item, encode_event(item))
+        for item in items
+    ]
+    return events, rows[-1].id if rows else since, more
+
+
+def replay_events(token):
+    """The events a client missed since its token, None if it has to sync again."""
+    if changes.expired(token, changes.latest_compaction()):
+        return None
+    events, _, more = read_events(token[0], MAX_REPLAY)
+    return None if more else events
+
+
+def encode_event(item):
+    event = f"id: {item['token']}\nevent: change\ndata: {ndjson_line(item)}\n"
+    return event.encode("utf-8")
+
+
+def parse_subscription(request):
+    """
+    The subscription and token of `?bbox=`, `?tags=`, `?tags_match=` and
+    `?since=`, or of the `Last-Event-ID` header, raises `ValidationError`.
+    """
+    params = request.query_params
+    bbox = GeoFilter().get_bbox(request)
+    tags = {tag.strip() for tag in params.get("tags", "").split(",") if tag.strip()}
+    tags_match = params.get("tags_match", "all")
+    if tags_match not in ("all", "any"):
+        raise ValidationError({"tags_match": ["Expected all or any."]})
+    token = request.META.get("HTTP_LAST_EVENT_ID") or params.get("since")
+    if token is not None:
+        try:
+            token = changes.parse_token(token)
+        except ValueError:
+            raise ValidationError({"since": ["Not a token of this feed."]})
+    return Subscription(bbox, tags or None, tags_match == "any"), token
+
+
+class EventStreamApplication:
+    """Serves `EVENTS_PATH` and hands every other request to `application`."""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == EVENTS_PATH:
+            await self.stream(scope, receive, send)
+        else:
+            await self.application(scope, receive, send)
+
+    async def stream(self, scope, receive, send):
+        request = Request(ASGIRequest(scope, io.BytesIO()))
+        # Served before the middleware, which reject unknown hosts when they
+        # first read the host, as CommonMiddleware does. The API has no
+        # authentication nor CORS headers to apply
+        try:
+            request.get_host()
+        except DisallowedHost as error:
+            security_logger.error(str(error))
+            await self.respond(send, 400, {"detail": "Invalid host."})
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            await self.respond(
+                send,
+                405,
+                {"detail": f'Method "{scope["method"]}" not allowed.'},
+                [(b"allow", b"GET, HEAD")],
+            )
+            return
+        try:
+            subscription, token = parse_subscription(request)
+        except ValidationError as error:
+            await self.respond(send, 400, error.detail)
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    # Unbuffered by nginx
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body"})
+            return
+
+        broadcaster = get_broadcaster()
+        broadcaster.subscribe(subscription)
+        disconnected = asyncio.ensure_future(self.disconnect(receive, subscription))
+        try:
+            await self.send_events(send, broadcaster, subscription, token)
+        finally:
+            broadcaster.unsubscribe(subscription)
+            disconnected.cancel()
+        await send({"type": "http.response.body"})
+
+    async def send_events(self, send, broadcaster, subscription, token):
+        await self.send_body(send, f"retry: {RETRY_MS}\n\n".encode())
+        await broadcaster.ready.wait()
+        # Queued events of changes the replay already sent are skipped
+        sent_id = 0
+        if token is not None:
+            events = await sync_to_async(replay_events)(token)
+            if events is None:
+                await self.send_body(send, RESET)
+                return
+            for change_id, item, event in events:
+                if subscription.wants(item):
+                    await self.send_body(send, event)
+                sent_id = max(sent_id, change_id)
+
+        while True:
+            # Sent at once when several are pending
+            messages = await subscription.get()
+            last = messages[-1]
+            body = b"".join(
+                event
+                for change_id, event in filter(None, messages)
+                if change_id is None or change_id > sent_id
+            )
+            if body:
+                await self.send_body(send, body)
+            if last is None or last[1] is RESET:
+                return
+
+    @staticmethod
+    async def disconnect(receive, subscription):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        subscription.close()
+
+    @staticmethod
+    async def send_body(send, body):
+        await send({"type": "http.response.body", "body": body, "more_body": True})
+
+    @staticmethod
+    async def respond(send, status, data, headers=()):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"application/json"), *headers],
+            }
+        )
+        await send({"type": "http.response.body", "body": json.dumps(data).encode()})
@@ -0,0 +1,67 @@
+"""
+Row generators for streaming the place catalogue.
+
+Places are read with a chunked iterator, the tags of each chunk are loaded
+with one query, and rows are flushed a chunk at a time, so memory stays flat
+however large the catalogue is.
+"""
+import csv
+from itertools import islice
+
+from .renderers import ndjson_line
+from .serializers import place_representations
+from .serializers import place_values
+
+CHUNK_SIZE = 1000
+CSV_COLUMNS = [
+    "uuid",
+    "address",
+    "code",
+    "location_lat",
+    "location_lon",
+    "name",
+    "reward_checkin_points",
+    "tags",
+    "type",
+]
+
+
+class Echo:
+    """File-like object that hands back what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def iter_representations(queryset, chunk_size=CHUNK_SIZE):
+    """Yields lists of serialized places, one list per chunk."""
+    rows = place_values(queryset).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield place_representations(chunk)
+
+
+def ndjson_rows(queryset, chunk_size=CHUNK_SIZE):
+    for chunk in iter_representations(queryset, chunk_size):
+        yield "".join(ndjson_line(data) for data in chunk)
+
+
+def csv_rows(queryset, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for chunk in iter_representations(queryset, chunk_size):
+        yield "".join(
+            writer.writerow(
+                [
+                    data["uuid"],
+                    data["address"],
+                    data["code"],
+                    data["location"]["lat"],
+                    data["location"]["lon"],
+                    data["name"],
+                    data["reward_checkin_points"],
+                    ",".join(data["tags"]),
+                    data["type"],
+                ]
+            )
+            for data in chunk
+        )
@@ -0,0 +1,250 @@
+import math
+
+import django_filters
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import BooleanField
+from django.db.models import Count
+from django.db.models import ExpressionWrapper
+from django.db.models import F
+from django.db.models import FloatField
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from . import postgres
+from .geo import METERS_PER_DEGREE
+from .geo import geohash_cover
+from .geo import radius_bbox
+from .models import Place
+from .models import UUIDTaggedItem
+from .search import is_available
+from .search import match_query
+from .search import search_words
+
+
+# Spheroid distances and the equirectangular ones of `distance_sq` differ by
+# less than this
+WITHIN_MARGIN = 1.05
+
+
+def parse_floats(request, param, count):
+    raw = request.query_params.get(param)
+    if raw is None:
+        return None
+    try:
+        values = [float(value) for value in raw.split(",")]
+    except ValueError:
+        values = []
+    if len(values) != count or not all(map(math.isfinite, values)):
+        raise ValidationError({param: f"Expected {count} comma-separated numbers."})
+    return values
+
+
+def validate_coordinates(param, lat, lon):
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise ValidationError({param: "Coordinates are out of range."})
+
+
+class GeoFilter(BaseFilterBackend):
+    """
+    Filters places around a point (`?near=lat,lon&radius_m=`) and/or inside a
+    bounding box (`?bbox=min_lon,min_lat,max_lon,max_lat`).
+
+    Candidates are narrowed with the indexed geohash column, or the PostGIS
+    geography one around a `near` point, before the exact bounding box and
+    distance checks, so only nearby rows are ever read.
+    Results are ordered by distance from the `near` point, or from the centre
+    of the bounding box, unless an explicit `?ordering=` is requested.
+    """
+
+    near_param = "near"
+    radius_param = "radius_m"
+    bbox_param = "bbox"
+    default_radius_m = 1000
+    max_radius_m = 100000
+
+    def filter_queryset(self, request, queryset, view):
+        near = self.get_near(request)
+        bbox = self.get_bbox(request)
+        if near is None and bbox is None:
+            return queryset
+
+        if near is not None:
+            lat, lon, radius_m = near
+            box = radius_bbox(lat, lon, radius_m)
+            if bbox is not None:
+                box = (
+                    max(box[0], bbox[0]),
+                    max(box[1], bbox[1]),
+                    min(box[2], bbox[2]),
+                    min(box[3], bbox[3]),
+                )
+        else:
+            box = bbox
+            lat, lon = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+
+        if box[0] > box[2] or box[1] > box[3]:
+            return queryset.none()
+
+        if near is not None and postgres.has_geography(queryset.db):
+            queryset = self.filter_within(queryset, lat, lon, radius_m)
+            queryset = self.filter_bbox(queryset, *box, geohash=False)
+        else:
+            queryset = self.filter_bbox(queryset, *box)
+        queryset = queryset.annotate(distance_sq=self.distance_sq(lat, lon))
+        if near is not None:
+            max_distance = radius_m / METERS_PER_DEGREE
+            queryset = queryset.filter(distance_sq__lte=max_distance**2)
+        return queryset.order_by("distance_sq")
+
+    def get_near(self, request):
+        near = parse_floats(request, self.near_param, 2)
+        if near is None:
+            return None
+        lat, lon = near
+        validate_coordinates(self.near_param, lat, lon)
+
+        radius = parse_floats(request, self.radius_param, 1)
+        radius_m = radius[0] if radius else self.default_radius_m
+        if not 0 < radius_m <= self.max_radius_m:
+            raise ValidationError(
+                {self.radius_param: f"Must be between 0 and {self.max_radius_m}."}
+            )
+        return lat, lon, radius_m
+
+    def get_bbox(self, request):
+        bbox = parse_floats(request, self.bbox_param, 4)
+        if bbox is None:
+            return None
+        min_lon, min_lat, max_lon, max_lat = bbox
+        validate_coordinates(self.bbox_param, min_lat, min_lon)
+        validate_coordinates(self.bbox_param, max_lat, max_lon)
+        if min_lat > max_lat or min_lon > max_lon:
+            raise ValidationError({self.bbox_param: "Minimum exceeds maximum."})
+        return min_lat, min_lon, max_lat, max_lon
+
+    @staticmethod
+    def filter_bbox(queryset, min_lat, min_lon, max_lat, max_lon, geohash=True):
+        queryset = queryset.filter(
+            location_lat__gte=min_lat,
+            location_lat__lte=max_lat,
+            location_lon__gte=min_lon,
+            location_lon__lte=max_lon,
+        )
+        cells = geohash and geohash_cover(min_lat, min_lon, max_lat, max_lon)
+        if not cells:
+            return queryset
+
+        # "{" sorts right after "z", the last geohash character
+        prefix_ranges = Q()
+        for cell in cells:
+            prefix_ranges |= Q(geohash__gte=cell, geohash__lt=cell + "{")
+        return queryset.filter(prefix_ranges)
+
+    @staticmethod
+    def filter_within(queryset, lat, lon, radius_m):
+        """
+        Narrows candidates with the PostGIS GiST index instead of geohashes.
+        The radius gets a margin, the exact check is still `distance_sq`, so
+        both databases answer with the same places.
+        """
+        sql, params = postgres.within_sql(
+            queryset.db, lat, lon, radius_m * WITHIN_MARGIN
+        )
+        return queryset.filter(RawSQL(sql, params, output_field=BooleanField()))
+
+    @staticmethod
+    def distance_sq(lat, lon):
+        """
+        Squared equirectangular distance in degrees of latitude.
+        Within a couple of percent of the great-circle distance at the radii
+        this filter accepts, and cheap for SQLite to evaluate per row.
+        """
+        dx = (Cast("location_lon", FloatField()) - lon) * math.cos(math.radians(lat))
+        dy = Cast("location_lat", FloatField()) - lat
+        return ExpressionWrapper(dx * dx + dy * dy, output_field=FloatField())
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Filters places matching every word of `?q=` in their name, address, type
+    or tags, each word as a prefix, ordered by relevance.
+
+    Backed by the FTS5 index on SQLite. Other databases fall back to
+    `icontains` lookups over the same fields, without ranking.
+    """
+
+    search_param = "q"
+    fields = ["name", "address", "type"]
+
+    def filter_queryset(self, request, queryset, view):
+        return self.search(queryset, request.query_params.get(self.search_param, ""))
+
+    @classmethod
+    def search(cls, queryset, terms):
+        query = match_query(terms)
+        if not query:
+            return queryset
+
+        if is_available(queryset.db):
+            return (
+                queryset.filter(search_document__document=query)
+                .annotate(relevance=F("search_document__rank"))
+                .order_by("relevance")
+            )
+
+        for word in search_words(terms):
+            condition = Q(
+                uuid__in=UUIDTaggedItem.objects.filter(
+                    tag__name__icontains=word
+                ).values("object_id")
+            )
+            for field in cls.fields:
+                condition |= Q(**{f"{field}__icontains": word})
+            queryset = queryset.filter(condition)
+        return queryset
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class PlaceFilterSet(django_filters.FilterSet):
+    """
+    `?type=cafe,bar` keeps places of any of the given types, `?tags=cafe,wifi`
+    places having all of the given tags, or any of them with `&tags_match=any`.
+
+    Tags are matched with a subquery on the tagged items index, so the whole
+    filter runs in the database as part of the list query.
+    """
+
+    type = CharInFilter()
+    tags = CharInFilter(method="filter_tags")
+    tags_match = django_filters.ChoiceFilter(
+        choices=[("all", "all"), ("any", "any")],
+        method="filter_tags_match",
+        empty_label=None,
+    )
+
+    class Meta:
+        model = Place
+        fields = ["type", "tags", "tags_match"]
+
+    def filter_tags(self, queryset, name, value):
+        names = {tag.strip() for tag in value if tag.strip()}
+        if not names:
+            return queryset
+
+        tagged = UUIDTaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Place),
+            tag__name__in=names,
+        ).values("object_id")
+        if self.form.cleaned_data.get("tags_match") != "any":
+            tagged = tagged.annotate(matched=Count("tag")).filter(matched=len(names))
+        return queryset.filter(uuid__in=tagged.values("object_id"))
+
+    def filter_tags_match(self, queryset, name, value):
+        # Read by filter_tags()
+        return queryset
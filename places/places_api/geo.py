@@ -0,0 +1,129 @@
+import math
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """
+    Encodes a coordinate into a geohash string of the given precision.
+    Nearby points share a common prefix, so a B-tree index on the geohash
+    can answer "everything inside this cell" with a single range scan.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            rng, value = lon_range, lon
+        else:
+            rng, value = lat_range, lat
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision):
+    """Returns the (height, width) of a geohash cell in degrees."""
+    lon_bits = math.ceil(5 * precision / 2)
+    lat_bits = math.floor(5 * precision / 2)
+    return 180.0 / 2**lat_bits, 360.0 / 2**lon_bits
+
+
+def geohash_cover(min_lat, min_lon, max_lat, max_lon, max_cells=4):
+    """
+    Returns the geohash prefixes that together cover the bounding box.
+    The finest precision that needs at most `max_cells` cells is used.
+    An empty list means the box is too large to be worth a prefix filter.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_size(precision)
+        first_row = math.floor(min_lat / height)
+        first_col = math.floor(min_lon / width)
+        rows = math.floor(max_lat / height) - first_row + 1
+        cols = math.floor(max_lon / width) - first_col + 1
+        if rows * cols > max_cells:
+            continue
+
+        # Encoding the centre of every cell avoids rounding onto a neighbour
+        cells = set()
+        for row in range(first_row, first_row + rows):
+            lat = min((row + 0.5) * height, 90.0)
+            for col in range(first_col, first_col + cols):
+                lon = min((col + 0.5) * width, 180.0)
+                cells.add(geohash_encode(lat, lon, precision))
+        return sorted(cells)
+    return []
+
+
+def radius_bbox(lat, lon, radius_m):
+    """
+    Returns the (min_lat, min_lon, max_lat, max_lon) box enclosing the circle.
+    The box is clamped to valid coordinates and does not wrap the antimeridian.
+    """
+    dlat = radius_m / METERS_PER_DEGREE
+    min_lat = max(lat - dlat, -90.0)
+    max_lat = min(lat + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat <= 1e-9:
+        return min_lat, -180.0, max_lat, 180.0
+    dlon = dlat / cos_lat
+    return min_lat, max(lon - dlon, -180.0), max_lat, min(lon + dlon, 180.0)
+
+
+def tile_bbox(zoom, x, y):
+    """
+    Returns the (min_lat, min_lon, max_lat, max_lon) of a web map tile, in the
+    scheme of OpenStreetMap: 2**zoom Web Mercator tiles across, x growing
+    eastwards from the antimeridian and y southwards from latitude 85.05.
+    """
+    tiles = 2**zoom
+    return (
+        tile_lat(y + 1, tiles),
+        x / tiles * 360.0 - 180.0,
+        tile_lat(y, tiles),
+        (x + 1) / tiles * 360.0 - 180.0,
+    )
+
+
+def tile_lat(y, tiles):
+    """Returns the latitude of the northern edge of the tiles in row `y`."""
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / tiles))))
+
+
+def point_tile(lat, lon, zoom):
+    """Returns the x and y of the web map tile holding a coordinate."""
+    tiles = 2**zoom
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * tiles
+    return (
+        min(int((lon + 180.0) / 360.0 * tiles), tiles - 1),
+        min(max(int(y), 0), tiles - 1),
+    )
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Returns the great-circle distance between two coordinates in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
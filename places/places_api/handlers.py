@@ -0,0 +1,53 @@
+"""
+The ASGI handler of the project, which reads the bodies of streaming
+responses in the thread sync views run in.
+
+Django 4.1 iterates them on the event loop, where a generator reading the
+database, as the exports of `PlaceViewSet.export` do, raises
+`SynchronousOnlyOperation` once the status has been sent. Each part is read
+with `sync_to_async` instead, one at a time, so the body is still streamed,
+and the queries run on the connections of the thread the view ran in.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+
+_END = object()
+
+
+def next_part(parts):
+    return next(parts, _END)
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    async def send_response(self, response, send):
+        # Django 4.2 streams async iterators itself
+        if not response.streaming or getattr(response, "is_async", False):
+            return await super().send_response(response, send)
+
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append(
+                (b"Set-Cookie", cookie.output(header="").encode("ascii").strip())
+            )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": headers,
+            }
+        )
+        read = sync_to_async(next_part, thread_sensitive=True)
+        parts = iter(response)
+        while (part := await read(parts)) is not _END:
+            for chunk, _ in self.chunk_bytes(part):
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
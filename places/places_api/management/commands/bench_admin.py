@@ -0,0 +1,135 @@
+import random
+from contextlib import ExitStack
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from taggit.models import Tag
+
+from places_api import clusters
+from places_api import search
+from places_api import stats
+from places_api.admin import PlaceAdmin
+from places_api.benchmarking import NAME_WORDS
+from places_api.benchmarking import PLACE_TYPES
+from places_api.benchmarking import benchmark_database
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import generate_places
+from places_api.benchmarking import generate_tags
+from places_api.benchmarking import summarize
+from places_api.benchmarking import timed
+from places_api.models import Place
+from places_api.pagination import encode_cursor
+from places_api.pagination import position_of
+
+SCENARIOS = [
+    "first",
+    "deep",
+    "previous",
+    "points",
+    "search_code",
+    "search_words",
+    "type",
+    "tag",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the place changelist of the admin on a synthetic place "
+        "table: pages deep in the list, sorted, searched and filtered."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--places", type=int, default=1_000_000)
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument(
+            "--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.run(options)
+
+    def run(self, options):
+        # generate_places() bulk inserts without signals, summarize afterwards
+        _, ms = timed(generate_places, options["places"])
+        tagged, tag_ms = timed(generate_tags)
+        self.stdout.write(
+            f"Generated {options['places']} places in {ms / 1000:.1f}s "
+            f"and {tagged} tags in {tag_ms / 1000:.1f}s"
+        )
+        _, ms = timed(lambda: (search.rebuild(), stats.rebuild(), clusters.rebuild()))
+        self.stdout.write(f"Indexed and summed them up in {ms / 1000:.1f}s")
+
+        self.client = Client()
+        self.client.force_login(
+            User.objects.create_superuser("bench", "bench@example.com", "bench")
+        )
+        self.url = reverse("admin:places_api_place_changelist")
+        self.codes = list(Place.objects.values_list("code", flat=True))
+        for name in options["scenarios"]:
+            # Seeded by name, for the same data whichever scenarios run
+            rng = random.Random(name)
+            params = [
+                getattr(self, f"params_{name}")(rng) for _ in range(options["requests"])
+            ]
+            samples, queries = self.measure(params)
+            self.stdout.write(
+                f"{format_summary(name, summarize(samples))} queries={queries:.1f}"
+            )
+
+    def measure(self, params):
+        samples, queries = [], 0
+        for query in params:
+            with ExitStack() as stack:
+                # Reads and writes go to different aliases, see the router
+                captured = [
+                    stack.enter_context(CaptureQueriesContext(connections[alias]))
+                    for alias in connections
+                ]
+                response, ms = timed(self.client.get, self.url, query)
+            if response.status_code != 200:
+                raise CommandError(
+                    f"{self.url} {query} answered {response.status_code}"
+                )
+            samples.append(ms)
+            queries += sum(len(context) for context in captured)
+        return samples, queries / len(params)
+
+    def cursor(self, rng, ordering, reverse=False):
+        place = Place.objects.get(code=rng.choice(self.codes))
+        return encode_cursor(position_of(place, ordering), reverse, ordering)
+
+    def params_first(self, rng):
+        return {}
+
+    def params_deep(self, rng):
+        return {"cursor": self.cursor(rng, ("code", "uuid"))}
+
+    def params_previous(self, rng):
+        return {"cursor": self.cursor(rng, ("code", "uuid"), reverse=True)}
+
+    def params_points(self, rng):
+        ordering = ("-reward_checkin_points", "code", "uuid")
+        # Column numbers start at 1, after the action checkbox
+        column = PlaceAdmin.list_display.index("reward_checkin_points") + 1
+        return {"o": f"-{column}", "cursor": self.cursor(rng, ordering)}
+
+    def params_search_code(self, rng):
+        return {"q": rng.choice(self.codes)[: rng.randint(6, 10)]}
+
+    def params_search_words(self, rng):
+        return {"q": " ".join(rng.sample(NAME_WORDS, rng.randint(1, 2)))}
+
+    def params_type(self, rng):
+        return {"type": rng.choice(PLACE_TYPES)}
+
+    def params_tag(self, rng):
+        if not hasattr(self, "slugs"):
+            self.slugs = list(Tag.objects.values_list("slug", flat=True))
+        return {"tag": rng.choice(self.slugs)}
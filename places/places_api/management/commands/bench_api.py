@@ -0,0 +1,257 @@
+import gc
+import json
+import os
+import platform
+import random
+import time
+from contextlib import ExitStack
+
+import django
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from places_api import caching
+from places_api import search
+from places_api.benchmarking import NAME_WORDS
+from places_api.benchmarking import PLACE_TYPES
+from places_api.benchmarking import STREET_NAMES
+from places_api.benchmarking import TAG_NAMES
+from places_api.benchmarking import benchmark_database
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import generate_places
+from places_api.benchmarking import generate_tags
+from places_api.benchmarking import random_point
+from places_api.benchmarking import regressions
+from places_api.benchmarking import summarize
+from places_api.benchmarking import timed
+from places_api.models import Place
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+SCENARIOS = ["list", "search", "ordering", "retrieve", "create", "update", "destroy"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the PlaceViewSet endpoints on a synthetic, tagged place "
+        "table, optionally saving the results as JSON and failing when they "
+        "regress from a baseline saved the same way."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="10k")
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per scenario."
+        )
+        parser.add_argument(
+            "--rounds",
+            type=int,
+            default=3,
+            help="Times each scenario runs, the fastest round is kept.",
+        )
+        parser.add_argument(
+            "--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS
+        )
+        parser.add_argument("--output", help="File to save the results in.")
+        parser.add_argument(
+            "--baseline", help="Results file to compare the results with."
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.3,
+            help="Latency increase over the baseline that fails, 0.3 for 30%%.",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+            if baseline["scale"] != options["scale"]:
+                raise CommandError(
+                    f"The baseline was recorded at the {baseline['scale']} scale."
+                )
+
+        with benchmark_database():
+            results = self.run(options)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write("\n")
+        if baseline is not None:
+            found = regressions(results, baseline, options["threshold"])
+            for regression in found:
+                self.stderr.write(regression)
+            if found:
+                raise CommandError(f"{len(found)} results regressed.")
+            self.stdout.write(self.style.SUCCESS("No regressions."))
+
+    def run(self, options):
+        places = SCALES[options["scale"]]
+        _, ms = timed(generate_places, places)
+        tagged, tag_ms = timed(generate_tags)
+        search.rebuild()
+        self.stdout.write(
+            f"Generated {places} places in {ms / 1000:.1f}s "
+            f"and {tagged} tags in {tag_ms / 1000:.1f}s"
+        )
+
+        rng = random.Random(1)
+        self.client = Client()
+        # Places to read and update, and others to delete in every round
+        count, rounds = options["requests"], options["rounds"]
+        uuids = list(Place.objects.order_by("code").values_list("uuid", flat=True))
+        self.sample = rng.sample(uuids, min(len(uuids), (1 + rounds) * count))
+        self.doomed = self.sample[count:]
+        self.sample = self.sample[:count]
+
+        results = {
+            "scale": options["scale"],
+            "places": places,
+            "requests": count,
+            "rounds": rounds,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "machine": f"{platform.machine()}, {os.cpu_count()} cpus",
+            "scenarios": {},
+        }
+        for name in options["scenarios"]:
+            # Seeded by name, for the same data whichever scenarios run
+            rng = random.Random(name)
+            measured = [
+                self.measure(getattr(self, f"requests_{name}")(rng, count))
+                for _ in range(rounds)
+            ]
+            results["scenarios"][name] = result = self.best(measured)
+            self.stdout.write(
+                f"{format_summary(name, result)} {result['requests_per_s']:8.1f} "
+                f"req/s queries={result['queries']:.1f}"
+            )
+        return results
+
+    def measure(self, requests):
+        """
+        Runs the requests one after the other. Reads are measured uncached:
+        the response cache is cleared before each of them.
+        """
+        samples, queries = [], 0
+        for method, url, data in requests:
+            if method == "get":
+                caching.get_cache().clear()
+            # Garbage collections triggered by the previous requests would
+            # land in the timings at random, and the query log holds at most
+            # 9000 queries, past which the captured ones cannot be counted
+            gc.collect()
+            with ExitStack() as stack:
+                # Reads and writes go to different aliases, see the router
+                captured = []
+                for alias in connections:
+                    connections[alias].queries_log.clear()
+                    captured.append(
+                        stack.enter_context(CaptureQueriesContext(connections[alias]))
+                    )
+                start = time.perf_counter()
+                response = getattr(self.client, method)(
+                    url, data, content_type="application/json"
+                )
+                samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(
+                    f"{method.upper()} {url} answered {response.status_code}"
+                )
+            queries += sum(len(context) for context in captured)
+
+        result = summarize(samples)
+        result["requests_per_s"] = len(samples) / (sum(samples) / 1000)
+        result["queries"] = queries / len(samples)
+        return result
+
+    @staticmethod
+    def best(measured):
+        """
+        Other processes slow down some rounds, never speed them up, so each
+        timing is the best of the rounds. Query counts vary with the data of
+        the rounds and are averaged over all of them.
+        """
+        result = {
+            metric: min(measurement[metric] for measurement in measured)
+            for metric in ("mean_ms", "p50_ms", "p95_ms", "p99_ms")
+        }
+        result["count"] = measured[0]["count"]
+        result["requests_per_s"] = max(
+            measurement["requests_per_s"] for measurement in measured
+        )
+        result["queries"] = sum(
+            measurement["queries"] for measurement in measured
+        ) / len(measured)
+        return result
+
+    @staticmethod
+    def place_data(rng):
+        lat, lon = random_point(rng)
+        return {
+            "address": f"{rng.choice(STREET_NAMES)} {rng.randint(1, 200)}",
+            "code": f"bench-{rng.getrandbits(48):012x}",
+            "location": {"lat": lat, "lon": lon},
+            "name": " ".join(rng.sample(NAME_WORDS, 2)).title(),
+            "reward_checkin_points": rng.randint(1, 100),
+            "tags": rng.sample(TAG_NAMES, rng.randint(0, 4)),
+            "type": rng.choice(PLACE_TYPES),
+        }
+
+    def requests_list(self, rng, count):
+        url = reverse("place-list")
+        return [
+            ("get", f"{url}?type={rng.choice(PLACE_TYPES)}", None)
+            if i % 2
+            else ("get", url, None)
+            for i in range(count)
+        ]
+
+    def requests_search(self, rng, count):
+        url = reverse("place-list")
+        return [
+            (
+                "get",
+                f"{url}?q={rng.choice(NAME_WORDS)}+{rng.choice(STREET_NAMES)}",
+                None,
+            )
+            for _ in range(count)
+        ]
+
+    def requests_ordering(self, rng, count):
+        url = reverse("place-list")
+        return [
+            ("get", f"{url}?ordering={rng.choice(['code', '-code'])}", None)
+            for _ in range(count)
+        ]
+
+    def requests_retrieve(self, rng, count):
+        return [
+            ("get", reverse("place-detail", args=[place_uuid]), None)
+            for place_uuid in self.sample[:count]
+        ]
+
+    def requests_create(self, rng, count):
+        url = reverse("place-list")
+        return [("post", url, self.place_data(rng)) for _ in range(count)]
+
+    def requests_update(self, rng, count):
+        return [
+            ("put", reverse("place-detail", args=[place_uuid]), self.place_data(rng))
+            for place_uuid in self.sample[:count]
+        ]
+
+    def requests_destroy(self, rng, count):
+        doomed, self.doomed = self.doomed[:count], self.doomed[count:]
+        return [
+            ("delete", reverse("place-detail", args=[place_uuid]), None)
+            for place_uuid in doomed
+        ]
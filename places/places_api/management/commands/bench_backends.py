@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from places_api.management.commands.bench_api import SCALES
+from places_api.management.commands.bench_api import SCENARIOS
+
+BACKENDS = ["sqlite", "postgresql"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs bench_api on SQLite and on PostgreSQL, configured by the DB_ "
+        "environment variables, and compares their results side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="10k")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--rounds", type=int, default=3)
+        parser.add_argument(
+            "--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS
+        )
+
+    def handle(self, *args, **options):
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for backend in BACKENDS:
+                output = Path(directory) / f"{backend}.json"
+                self.stdout.write(f"{backend}:")
+                self.bench(backend, output, options)
+                with open(output) as f:
+                    results[backend] = json.load(f)["scenarios"]
+
+        self.stdout.write(
+            f"{'':12} {'sqlite p50':>12} {'postgres p50':>13} {'ratio':>7} "
+            f"{'sqlite req/s':>13} {'postgres req/s':>15}"
+        )
+        for name in options["scenarios"]:
+            sqlite, postgresql = results["sqlite"][name], results["postgresql"][name]
+            self.stdout.write(
+                f"{name:12} {sqlite['p50_ms']:10.2f}ms {postgresql['p50_ms']:11.2f}ms "
+                f"{postgresql['p50_ms'] / sqlite['p50_ms']:6.2f}x "
+                f"{sqlite['requests_per_s']:13.1f} {postgresql['requests_per_s']:15.1f}"
+            )
+
+    def bench(self, backend, output, options):
+        command = [
+            sys.executable,
+            "manage.py",
+            "bench_api",
+            "--scale",
+            options["scale"],
+            "--requests",
+            str(options["requests"]),
+            "--rounds",
+            str(options["rounds"]),
+            "--output",
+            str(output),
+            "--scenarios",
+            *options["scenarios"],
+        ]
+        # In a process of its own, as the database is chosen by the settings
+        env = dict(
+            os.environ,
+            DB_ENGINE=backend,
+            PYTHONPATH=os.pathsep.join(
+                filter(None, [str(settings.BASE_DIR), os.environ.get("PYTHONPATH")])
+            ),
+        )
+        result = subprocess.run(
+            command, cwd=Path(settings.BASE_DIR) / "places", env=env
+        )
+        if result.returncode:
+            raise CommandError(f"bench_api failed on {backend}")
@@ -0,0 +1,140 @@
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connections
+from django.test import Client
+from django.test import override_settings
+from django.urls import reverse
+
+from places_api import checkins
+from places_api.benchmarking import benchmark_database
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import generate_places
+from places_api.benchmarking import summarize
+from places_api.benchmarking import timed
+from places_api.models import Place
+from places_api.models import PlaceCheckin
+
+MODES = ["immediate", "buffered"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks check-ins posted to the API by concurrent clients, "
+        "recorded in their requests and buffered in the log, and reports "
+        "their throughput and latency, and how long the buffer takes to "
+        "record the last ones. Then times the database recording check-ins "
+        "one per transaction and in the batches of the buffer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--places", type=int, default=10_000)
+        parser.add_argument(
+            "--checkins", type=int, default=20_000, help="Check-ins per mode."
+        )
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--flush-interval", type=float, default=0.5)
+        parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+
+    def handle(self, *args, **options):
+        rates = {}
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            # In a file, the buffer records from a thread and connection of
+            # its own
+            with benchmark_database(name=directory / "db.sqlite3"):
+                _, ms = timed(generate_places, options["places"])
+                self.stdout.write(
+                    f"Generated {options['places']} places in {ms / 1000:.1f}s"
+                )
+                self.uuids = list(Place.objects.values_list("uuid", flat=True))
+                for mode in options["modes"]:
+                    rates[mode] = self.run(mode, directory / "checkins", options)
+                if rates.get("immediate") and "buffered" in rates:
+                    self.stdout.write(
+                        "Buffered throughput: "
+                        f"{rates['buffered'] / rates['immediate']:.2f}x immediate"
+                    )
+                self.record_rates(options)
+
+    def run(self, mode, log_dir, options):
+        interval = options["flush_interval"] if mode == "buffered" else 0
+        per_thread = options["checkins"] // options["threads"]
+        samples, errors = [], []
+
+        def client(seed):
+            rng = random.Random(seed)
+            client = Client()
+            thread_samples, thread_errors = [], 0
+            for _ in range(per_thread):
+                response, ms = timed(
+                    client.post,
+                    reverse("place-checkins", args=[rng.choice(self.uuids)]),
+                    {"user": f"user{rng.randrange(options['users'])}"},
+                    content_type="application/json",
+                )
+                if response.status_code == 202:
+                    thread_samples.append(ms)
+                else:
+                    thread_errors += 1
+            connections.close_all()
+            samples.extend(thread_samples)
+            errors.append(thread_errors)
+
+        recorded = PlaceCheckin.objects.count()
+        with override_settings(
+            PLACES_CHECKIN_LOG_DIR=str(log_dir),
+            PLACES_CHECKIN_FLUSH_INTERVAL=interval,
+        ):
+            checkins.get_buffer.cache_clear()
+            buffer = checkins.get_buffer()
+            start = time.perf_counter()
+            threads = [
+                threading.Thread(target=client, args=(seed,))
+                for seed in range(options["threads"])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            # Records what the requests left in the buffer
+            _, drain_ms = timed(buffer.stop)
+            checkins.get_buffer.cache_clear()
+
+        recorded = PlaceCheckin.objects.count() - recorded
+        if recorded != len(samples):
+            raise CommandError(
+                f"{mode}: {len(samples)} check-ins accepted, {recorded} recorded"
+            )
+        rate = len(samples) / elapsed
+        self.stdout.write(
+            f"{format_summary(mode, summarize(samples))} {rate:8.1f} req/s "
+            f"errors={sum(errors)} recorded the last in {drain_ms:.0f}ms"
+        )
+        return rate
+
+    def record_rates(self, options):
+        rng = random.Random(0)
+        made = [
+            PlaceCheckin(
+                place_uuid=rng.choice(self.uuids),
+                user=f"user{rng.randrange(options['users'])}",
+                points=1,
+            )
+            for _ in range(options["checkins"])
+        ]
+        # Fewer one by one, they take longer
+        single, batched = made[: len(made) // 10], made[len(made) // 10 :]
+        _, single_ms = timed(lambda: [checkins.record([checkin]) for checkin in single])
+        _, batched_ms = timed(checkins.record, batched)
+        self.stdout.write(
+            f"Recorded {len(single) / single_ms * 1000:.0f} check-ins/s one per "
+            f"transaction, {len(batched) / batched_ms * 1000:.0f}/s in batches"
+        )
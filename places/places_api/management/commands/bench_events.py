@@ -0,0 +1,189 @@
+import asyncio
+import http.client
+import json
+import os
+import resource
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from places_api.benchmarking import benchmark_database
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import generate_places
+from places_api.benchmarking import summarize
+from places_api.events import EVENTS_PATH
+from places_api.models import Place
+
+from .bench_http import Command as HTTPCommand
+
+# Receive buffer of the streams that never read, small so the server soon
+# has to hold their events back
+SLOW_RCVBUF = 4096
+
+
+class Command(BaseCommand):
+    help = (
+        "Load tests the live place events under gunicorn: opens idle event "
+        "streams, some of which never read, updates places through the API, "
+        "and reports the latency of the writes, with and without the streams, "
+        "and of the events reaching every stream."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--places", type=int, default=1000)
+        parser.add_argument(
+            "--connections", type=int, default=1000, help="Event streams."
+        )
+        parser.add_argument(
+            "--slow", type=int, default=20, help="Event streams which never read."
+        )
+        parser.add_argument("--writes", type=int, default=200)
+        parser.add_argument("--rate", type=float, default=20, help="Writes per second.")
+        parser.add_argument(
+            "--workers", type=int, default=2, help="Gunicorn worker processes."
+        )
+
+    def handle(self, *args, **options):
+        # Every stream is a file descriptor, in this process and the server's
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            with benchmark_database(name=directory / "db.sqlite3"):
+                generate_places(options["places"])
+                uuids = list(Place.objects.values_list("uuid", flat=True))
+                server = HTTPCommand().serve("gunicorn", directory, options["workers"])
+                with server as port:
+                    self.stdout.write(f"{options['workers']} workers:")
+                    samples = self.write(port, uuids, "idle", options)
+                    self.stdout.write(format_summary("writes", summarize(samples)))
+                    asyncio.run(self.run(port, uuids, server.process.pid, options))
+
+    async def run(self, port, uuids, pid, options):
+        sent_at, delivered = {}, []
+        connected = asyncio.Semaphore(0)
+        streams = [
+            asyncio.ensure_future(self.listen(port, connected, sent_at, delivered))
+            for _ in range(options["connections"])
+        ]
+        slow = [await self.open(port, SLOW_RCVBUF) for _ in range(options["slow"])]
+        for _ in streams:
+            await connected.acquire()
+        self.stdout.write(
+            f"{len(streams)} streams and {len(slow)} slow ones open, "
+            f"server RSS {self.rss_mb(pid):.0f}MB"
+        )
+
+        loop = asyncio.get_running_loop()
+        cpu_seconds = self.cpu_seconds(pid)
+        samples = await loop.run_in_executor(
+            None, self.write, port, uuids, "streamed", options, sent_at
+        )
+        self.stdout.write(format_summary("writes", summarize(samples)))
+        expected = options["writes"] * len(streams)
+        deadline = time.perf_counter() + 10
+        while len(delivered) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+        cpu_seconds = self.cpu_seconds(pid) - cpu_seconds
+        self.stdout.write(format_summary("delivery", summarize(delivered)))
+        self.stdout.write(
+            f"Delivered {len(delivered)}/{expected} events, server CPU "
+            f"{cpu_seconds:.1f}s, RSS {self.rss_mb(pid):.0f}MB"
+        )
+
+        resets = 0
+        for reader, writer in slow:
+            # Read at last, up to the end of what the server could send
+            data = b""
+            try:
+                while chunk := await asyncio.wait_for(reader.read(1 << 16), 1):
+                    data = data[-64:] + chunk
+                    if b"event: reset" in data:
+                        resets += 1
+                        break
+            except asyncio.TimeoutError:
+                pass
+            writer.close()
+        self.stdout.write(f"Slow streams reset: {resets}/{len(slow)}")
+        for stream in streams:
+            stream.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+
+    @staticmethod
+    async def open(port, rcvbuf=None):
+        sock = socket.socket()
+        if rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+        reader, writer = await asyncio.open_connection(sock=sock)
+        # HTTP/1.0, the events are not chunked
+        writer.write(f"GET {EVENTS_PATH} HTTP/1.0\r\n\r\n".encode())
+        return reader, writer
+
+    async def listen(self, port, connected, sent_at, delivered):
+        reader, writer = await self.open(port)
+        try:
+            while await reader.readline() not in (b"\r\n", b""):
+                pass
+            connected.release()
+            while line := await reader.readline():
+                if line.startswith(b"data: "):
+                    place = json.loads(line[6:])["place"] or {}
+                    name = place.get("name")
+                    if name in sent_at:
+                        delivered.append((time.perf_counter() - sent_at[name]) * 1000)
+        finally:
+            writer.close()
+
+    @staticmethod
+    def write(port, uuids, label, options, sent_at=None):
+        """Renames places at `--rate`, returns the latency of each write."""
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        samples = []
+        start = time.perf_counter()
+        for i in range(options["writes"]):
+            time.sleep(max(0, start + i / options["rate"] - time.perf_counter()))
+            name = f"{label} {i}"
+            sent = time.perf_counter()
+            if sent_at is not None:
+                sent_at[name] = sent
+            connection.request(
+                "PATCH",
+                f"/api/place/{uuids[i % len(uuids)]}",
+                json.dumps({"name": name}),
+                {"Content-Type": "application/json"},
+            )
+            connection.getresponse().read()
+            samples.append((time.perf_counter() - sent) * 1000)
+        connection.close()
+        return samples
+
+    @staticmethod
+    def server_pids(pid):
+        """The gunicorn arbiter and its workers, on Linux."""
+        children = Path(f"/proc/{pid}/task/{pid}/children")
+        return [pid, *(children.read_text().split() if children.exists() else [])]
+
+    def rss_mb(self, pid):
+        kilobytes = 0
+        for process in self.server_pids(pid):
+            status = Path(f"/proc/{process}/status")
+            if status.exists():
+                for line in status.read_text().splitlines():
+                    if line.startswith("VmRSS:"):
+                        kilobytes += int(line.split()[1])
+        return kilobytes / 1024
+
+    def cpu_seconds(self, pid):
+        ticks = 0
+        for process in self.server_pids(pid):
+            stat = Path(f"/proc/{process}/stat")
+            if stat.exists():
+                # utime and stime, after the parenthesized command name
+                fields = stat.read_text().rsplit(")", 1)[1].split()
+                ticks += int(fields[11]) + int(fields[12])
+        return ticks / os.sysconf("SC_CLK_TCK")
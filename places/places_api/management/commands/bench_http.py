@@ -0,0 +1,195 @@
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from places_api import search
+from places_api.benchmarking import NAME_WORDS
+from places_api.benchmarking import PLACE_TYPES
+from places_api.benchmarking import benchmark_database
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import generate_places
+from places_api.benchmarking import summarize
+from places_api.benchmarking import timed
+from places_api.models import Place
+
+SERVERS = ["runserver", "gunicorn"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load tests the place API served by runserver, as the Docker image used "
+        "to, and by gunicorn with uvicorn workers, over real HTTP connections."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--places", type=int, default=100_000)
+        parser.add_argument(
+            "--duration", type=float, default=10, help="Seconds per scenario."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Concurrent clients."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Gunicorn worker processes.",
+        )
+        parser.add_argument("--servers", nargs="+", choices=SERVERS, default=SERVERS)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            with benchmark_database(name=directory / "db.sqlite3"):
+                self.run(directory, options)
+
+    def run(self, directory, options):
+        _, ms = timed(generate_places, options["places"])
+        self.stdout.write(f"Generated {options['places']} places in {ms / 1000:.1f}s")
+        search.rebuild()
+
+        rng = random.Random(1)
+        uuids = list(Place.objects.values_list("uuid", flat=True)[:1000])
+        scenarios = {
+            # Details of a working set of places, mostly served from the cache
+            "detail": [f"/api/place/{place_uuid}" for place_uuid in uuids],
+            "list": [f"/api/place?type={place_type}" for place_type in PLACE_TYPES],
+            # Searches are rarely repeated, every one of them reads the index
+            "search": [
+                f"/api/place?q={rng.choice(NAME_WORDS)}+{rng.choice(NAME_WORDS)[:3]}"
+                for _ in range(1000)
+            ],
+        }
+
+        for server in options["servers"]:
+            self.stdout.write(f"{server}:")
+            with self.serve(server, directory, options["workers"]) as port:
+                for name, paths in scenarios.items():
+                    samples, errors, elapsed = self.load(
+                        port, paths, options["duration"], options["concurrency"]
+                    )
+                    self.stdout.write(
+                        f"{format_summary(name, summarize(samples))} "
+                        f"{len(samples) / elapsed:8.1f} req/s errors={errors}"
+                    )
+
+    def serve(self, server, directory, workers):
+        env = dict(
+            os.environ,
+            DB_PATH=str(directory),
+            DJANGO_SETTINGS_MODULE="places.settings",
+            PYTHONPATH=os.pathsep.join(
+                filter(None, [str(settings.BASE_DIR), os.environ.get("PYTHONPATH")])
+            ),
+        )
+        port = self.free_port()
+        if server == "runserver":
+            # As the Docker image ran it before gunicorn: DEBUG on, and the
+            # default per-process response cache
+            env["DJANGO_DEBUG"] = "1"
+            command = ["manage.py", "runserver", "--noreload", f"127.0.0.1:{port}"]
+        else:
+            env.update(
+                BIND=f"127.0.0.1:{port}",
+                WEB_CONCURRENCY=str(workers),
+                PLACES_CACHE_DIR=str(directory / "cache"),
+            )
+            command = ["-m", "gunicorn", "-c", "gunicorn.conf.py"]
+            command.append("places.asgi:application")
+        process = subprocess.Popen(
+            [sys.executable, *command],
+            cwd=Path(settings.BASE_DIR) / "places",
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return ServerProcess(process, port)
+
+    @staticmethod
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    @staticmethod
+    def load(port, paths, duration, concurrency):
+        """
+        Requests random paths from `concurrency` keep-alive connections for
+        `duration` seconds, returns the latencies, errors and elapsed seconds.
+        """
+        samples, errors = [], []
+        deadline = time.perf_counter() + duration
+
+        def client(seed):
+            rng = random.Random(seed)
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            client_samples, client_errors = [], 0
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    connection.request(
+                        "GET", rng.choice(paths), headers={"Accept": "application/json"}
+                    )
+                    response = connection.getresponse()
+                    response.read()
+                except (http.client.HTTPException, OSError):
+                    connection.close()
+                    client_errors += 1
+                    continue
+                client_samples.append((time.perf_counter() - start) * 1000)
+                client_errors += response.status != 200
+            connection.close()
+            samples.extend(client_samples)
+            errors.append(client_errors)
+
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=client, args=(seed,)) for seed in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, sum(errors), time.perf_counter() - start
+
+
+class ServerProcess:
+    """Waits for the server to answer on entry, stops it gracefully on exit."""
+
+    def __init__(self, process, port, timeout=60):
+        self.process, self.port, self.timeout = process, port, timeout
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"The server exited with {self.process.returncode}")
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", self.port)
+                connection.request("GET", "/api/place?page_size=1")
+                if connection.getresponse().status == 200:
+                    return self.port
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.__exit__()
+        raise CommandError("The server did not start in time")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
@@ -0,0 +1,125 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.test import Client
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from places_api import search
+from places_api.benchmarking import NAME_WORDS
+from places_api.benchmarking import STREET_NAMES
+from places_api.benchmarking import benchmark_database
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import generate_places
+from places_api.benchmarking import summarize
+from places_api.benchmarking import timed
+from places_api.filters import FullTextSearchFilter
+from places_api.models import Place
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks full-text ?q= searches against the ?search= icontains scan "
+        "on a synthetic place table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--places", type=int, default=1_000_000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument(
+            "--scan-queries",
+            type=int,
+            default=20,
+            help="?search= queries to run as a baseline, 0 to skip.",
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.run(options)
+
+    def run(self, options):
+        rng = random.Random(1)
+
+        # generate_places() bulk inserts without signals, index afterwards
+        _, ms = timed(generate_places, options["places"])
+        self.stdout.write(f"Generated {options['places']} places in {ms / 1000:.1f}s")
+        _, ms = timed(search.rebuild)
+        self.stdout.write(f"Indexed them in {ms / 1000:.1f}s")
+
+        client = Client()
+        url = reverse("place-list")
+        terms = [self.random_terms(rng) for _ in range(options["queries"])]
+
+        # Single words match a large share of the synthetic places and have to
+        # rank all of them, longer queries are far more selective
+        fts_samples, results = {}, 0
+        for term in terms:
+            response, ms = timed(client.get, url, {"q": term})
+            fts_samples.setdefault(len(term.split()), []).append(ms)
+            results += len(response.json()["results"])
+        for words, samples in sorted(fts_samples.items()):
+            self.stdout.write(
+                format_summary(f"q (fts, {words} words)", summarize(samples))
+            )
+        self.stdout.write(f"  avg results per page: {results / len(terms):.1f}")
+
+        request = Request(APIRequestFactory().get(url, {"q": terms[0]}))
+        queryset = FullTextSearchFilter().filter_queryset(
+            request, Place.objects.all(), None
+        )
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            for row in cursor.fetchall():
+                self.stdout.write(f"  plan: {row[-1]}")
+
+        scan_samples = []
+        for term in terms[: options["scan_queries"]]:
+            _, ms = timed(client.get, url, {"search": term})
+            scan_samples.append(ms)
+        if scan_samples:
+            self.stdout.write(
+                format_summary("search (icontains)", summarize(scan_samples))
+            )
+
+        # Counting every match shows the cost of the whole result set, which
+        # pages of the ?search= scan can hide when matches are frequent
+        fts_counts, scan_counts = [], []
+        for term in terms[: options["scan_queries"]]:
+            fts = Place.objects.filter(
+                search_document__document=search.match_query(term)
+            )
+            _, ms = timed(fts.count)
+            fts_counts.append(ms)
+            _, ms = timed(self.icontains(term).count)
+            scan_counts.append(ms)
+        if scan_counts:
+            self.stdout.write(format_summary("count (fts)", summarize(fts_counts)))
+            self.stdout.write(
+                format_summary("count (icontains)", summarize(scan_counts))
+            )
+
+    @staticmethod
+    def icontains(term):
+        """What a ?q= search costs without the index: a LIKE per word and field."""
+        queryset = Place.objects.all()
+        for word in term.split():
+            queryset = queryset.filter(
+                Q(name__icontains=word)
+                | Q(address__icontains=word)
+                | Q(type__icontains=word)
+            )
+        return queryset
+
+    @staticmethod
+    def random_terms(rng):
+        """A name word, a partial one, and a street name, like users type them."""
+        words = [
+            rng.choice(NAME_WORDS),
+            rng.choice(NAME_WORDS)[:3],
+            rng.choice(STREET_NAMES),
+        ]
+        return " ".join(words[: rng.randint(1, 3)])
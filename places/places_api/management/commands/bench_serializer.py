@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from places_api import renderers
+from places_api.benchmarking import benchmark_database
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import generate_places
+from places_api.benchmarking import generate_tags
+from places_api.benchmarking import summarize
+from places_api.benchmarking import timed
+from places_api.models import Place
+from places_api.renderers import FastJSONRenderer
+from places_api.serializers import PlaceSerializer
+from places_api.serializers import place_representations
+from places_api.serializers import place_values
+
+
+class Command(BaseCommand):
+    help = (
+        "Reads and renders pages of places as JSON the way the list did with "
+        "PlaceSerializer, and the way it does now, and reports objects/s."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--places", type=int, default=10_000)
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--rounds", type=int, default=3)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            generate_places(options["places"])
+            generate_tags()
+            self.run(options)
+
+    def run(self, options):
+        codes = list(Place.objects.order_by("code").values_list("code", flat=True))
+        size = options["page_size"]
+        pages = [
+            Place.objects.filter(code__range=(codes[i], codes[i + len(chunk) - 1]))
+            .order_by("code")
+            .prefetch_related("tags")
+            for i in range(0, len(codes), size)
+            if (chunk := codes[i : i + size])
+        ]
+
+        variants = {
+            "serializer": self.serializer_page,
+            "representations": self.representations_page,
+        }
+        if renderers.orjson is None:
+            self.stdout.write("orjson is not installed, JSONRenderer renders both.")
+        throughput = {}
+        for name, render_page in variants.items():
+            samples = []
+            for _ in range(options["rounds"]):
+                for queryset in pages:
+                    _, ms = timed(render_page, queryset)
+                    samples.append(ms)
+            throughput[name] = len(codes) * options["rounds"] / (sum(samples) / 1000)
+            self.stdout.write(
+                f"{format_summary(name, summarize(samples))} "
+                f"{throughput[name]:9.0f} objects/s"
+            )
+        self.stdout.write(
+            f"Speedup: {throughput['representations'] / throughput['serializer']:.2f}x"
+        )
+
+    @staticmethod
+    def serializer_page(queryset):
+        # A copy, the queryset keeps the places it read
+        return JSONRenderer().render(PlaceSerializer(queryset.all(), many=True).data)
+
+    @staticmethod
+    def representations_page(queryset):
+        return FastJSONRenderer().render(
+            place_representations(list(place_values(queryset)))
+        )
@@ -0,0 +1,88 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from places_api.benchmarking import benchmark_database
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import generate_places
+from places_api.benchmarking import random_point
+from places_api.benchmarking import summarize
+from places_api.benchmarking import timed
+from places_api.filters import GeoFilter
+from places_api.geo import haversine_m
+from places_api.models import Place
+
+
+class Command(BaseCommand):
+    help = "Benchmarks ?near= and ?bbox= queries against a synthetic place table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--places", type=int, default=1_000_000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--radius", type=float, default=1000)
+        parser.add_argument(
+            "--scan-queries",
+            type=int,
+            default=3,
+            help="Full table scans to run as a baseline, 0 to skip.",
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.run(options)
+
+    def run(self, options):
+        rng = random.Random(1)
+        radius = options["radius"]
+
+        _, ms = timed(generate_places, options["places"])
+        self.stdout.write(f"Generated {options['places']} places in {ms / 1000:.1f}s")
+
+        client = Client()
+        url = reverse("place-list")
+        points = [random_point(rng) for _ in range(options["queries"])]
+
+        near_samples, results = [], 0
+        for lat, lon in points:
+            response, ms = timed(
+                client.get, url, {"near": f"{lat},{lon}", "radius_m": radius}
+            )
+            near_samples.append(ms)
+            results += len(response.json()["results"])
+        self.stdout.write(format_summary("near (api)", summarize(near_samples)))
+        self.stdout.write(f"  avg results per query: {results / len(points):.1f}")
+
+        bbox_samples = []
+        for lat, lon in points:
+            bbox = f"{lon - 0.01},{lat - 0.01},{lon + 0.01},{lat + 0.01}"
+            _, ms = timed(client.get, url, {"bbox": bbox})
+            bbox_samples.append(ms)
+        self.stdout.write(format_summary("bbox (api)", summarize(bbox_samples)))
+
+        lat, lon = points[0]
+        queryset = GeoFilter.filter_bbox(Place.objects.all(), lat, lon, lat, lon)
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            for row in cursor.fetchall():
+                self.stdout.write(f"  plan: {row[-1]}")
+
+        scan_samples = []
+        for lat, lon in points[: options["scan_queries"]]:
+            _, ms = timed(self.scan, lat, lon, radius)
+            scan_samples.append(ms)
+        if scan_samples:
+            self.stdout.write(format_summary("full scan", summarize(scan_samples)))
+
+    @staticmethod
+    def scan(lat, lon, radius):
+        rows = Place.objects.values_list("uuid", "location_lat", "location_lon")
+        return sorted(
+            (distance, uuid)
+            for uuid, place_lat, place_lon in rows.iterator()
+            if (distance := haversine_m(lat, lon, float(place_lat), float(place_lon)))
+            <= radius
+        )
@@ -0,0 +1,164 @@
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.db import OperationalError
+from django.db import connections
+from django.db import transaction
+from django.db.models import F
+from django.db.utils import load_backend
+
+from places_api.benchmarking import benchmark_database
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import generate_places
+from places_api.benchmarking import summarize
+from places_api.benchmarking import timed
+from places_api.models import Place
+
+CONFIGURATIONS = ["stock", "tuned"]
+PAGE_SIZE = 100
+
+
+class Command(BaseCommand):
+    help = (
+        "Stress tests SQLite with concurrent readers and writers, configured "
+        "as Django configures it by default and as the places database is, "
+        "and reports their throughput and lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--places", type=int, default=10_000)
+        parser.add_argument(
+            "--duration", type=float, default=10, help="Seconds per configuration."
+        )
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--writes", type=float, default=0.2, help="Share of the transactions."
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            name = directory / "db.sqlite3"
+            with benchmark_database(name=name):
+                _, ms = timed(generate_places, options["places"])
+                self.stdout.write(
+                    f"Generated {options['places']} places in {ms / 1000:.1f}s"
+                )
+                self.uuids = list(Place.objects.values_list("uuid", flat=True))
+                # Closing the last connection checkpoints the WAL into the file
+                connections.close_all()
+
+                results = {}
+                for configuration in CONFIGURATIONS:
+                    copy = directory / f"{configuration}.sqlite3"
+                    shutil.copyfile(name, copy)
+                    results[configuration] = self.run(configuration, copy, options)
+
+        stock, tuned = results["stock"], results["tuned"]
+        self.stdout.write(
+            f"Tuned throughput: {tuned / stock:.2f}x stock"
+            if stock
+            else "Stock SQLite completed no transaction."
+        )
+
+    def databases(self, configuration, name):
+        """Settings of the (write, read) connections of a configuration."""
+        if configuration == "stock":
+            # Django's defaults, with the journal mode SQLite creates files in
+            with sqlite3.connect(name) as conn:
+                conn.execute("PRAGMA journal_mode = delete")
+            stock = {"ENGINE": "django.db.backends.sqlite3", "NAME": name}
+            return stock, stock
+        tuned = {"ENGINE": "places_api.backends.sqlite3", "NAME": name}
+        return tuned, dict(tuned, OPTIONS={"read_only": True})
+
+    def run(self, configuration, name, options):
+        write_settings, read_settings = (
+            connections.configure_settings({DEFAULT_DB_ALIAS: database})[
+                DEFAULT_DB_ALIAS
+            ]
+            for database in self.databases(configuration, name)
+        )
+        reads, writes, errors = [], [], []
+        deadline = time.perf_counter() + options["duration"]
+
+        def worker(seed):
+            rng = random.Random(seed)
+            # Connections of this thread, as the request threads of a server
+            # keep theirs, the stock ones sharing one for reads and writes
+            write_alias, read_alias = f"bench_{seed}_write", f"bench_{seed}_read"
+            connections[write_alias] = load_backend(
+                write_settings["ENGINE"]
+            ).DatabaseWrapper(write_settings, write_alias)
+            connections[read_alias] = (
+                connections[write_alias]
+                if read_settings is write_settings
+                else load_backend(read_settings["ENGINE"]).DatabaseWrapper(
+                    read_settings, read_alias
+                )
+            )
+            worker_reads, worker_writes, worker_errors = [], [], 0
+            while time.perf_counter() < deadline:
+                is_write = rng.random() < options["writes"]
+                start = time.perf_counter()
+                try:
+                    if is_write:
+                        self.write(write_alias, rng.choice(self.uuids))
+                    else:
+                        self.read(read_alias, rng)
+                except OperationalError:
+                    worker_errors += 1
+                    continue
+                ms = (time.perf_counter() - start) * 1000
+                (worker_writes if is_write else worker_reads).append(ms)
+            connections[write_alias].close()
+            connections[read_alias].close()
+            reads.extend(worker_reads)
+            writes.extend(worker_writes)
+            errors.append(worker_errors)
+
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=worker, args=(seed,))
+            for seed in range(options["threads"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f"{configuration}:")
+        for operation, samples in (("read", reads), ("write", writes)):
+            if samples:
+                self.stdout.write(
+                    f"{format_summary(operation, summarize(samples))} "
+                    f"{len(samples) / elapsed:8.1f} tx/s"
+                )
+        self.stdout.write(f"lock errors: {sum(errors)}")
+        return (len(reads) + len(writes)) / elapsed
+
+    @staticmethod
+    def write(alias, place_uuid):
+        # Reads before writing, as an update through the API does, which is
+        # when a deferred transaction has to upgrade its lock
+        with transaction.atomic(using=alias):
+            places = Place.objects.using(alias).filter(uuid=place_uuid)
+            version = places.values_list("version", flat=True).get()
+            places.filter(version=version).update(version=F("version") + 1)
+
+    @staticmethod
+    def read(alias, rng):
+        offset = rng.randrange(0, 1000)
+        list(
+            Place.objects.using(alias)
+            .order_by("code")
+            .values_list("uuid", "code", "name", "address")[offset : offset + PAGE_SIZE]
+        )
@@ -0,0 +1,144 @@
+import os
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import summarize
+from places_api.benchmarking import timed
+
+# The directory of manage.py
+PROJECT_DIR = Path(__file__).resolve().parents[3]
+# Python arguments of each scenario
+SCENARIOS = {
+    "python": ["-c", "pass"],
+    "setup": ["-c", "import django; django.setup()"],
+    # What each worker of gunicorn.conf.py imports
+    "asgi": ["-c", "import places.asgi"],
+    "check": ["manage.py", "check"],
+    "migrate": ["manage.py", "migrate"],
+    # What the Docker image runs at every start
+    "migrate_if_needed": ["manage.py", "migrate", "--if-needed"],
+}
+CONFIGURATIONS = {
+    "full": {},
+    "lean": {"PLACES_ADMIN": "off", "PLACES_BROWSABLE_API": "off"},
+}
+
+
+def package(module):
+    """The package imports are summed up by, Django's by subpackage."""
+    parts = module.split(".")
+    if parts[:2] == ["django", "contrib"]:
+        return ".".join(parts[:3])
+    if parts[0] == "django":
+        return ".".join(parts[:2])
+    return parts[0]
+
+
+def parse_importtime(output):
+    """(module, self µs, cumulative µs) of the lines `-X importtime` writes."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        # The header
+        if not self_us.strip().isdigit():
+            continue
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Times processes starting Django in the ways the project starts it, "
+        "with the admin and the browsable API enabled (full) and disabled "
+        "(lean), and reports what the imports of one of them spend their "
+        "time on, from `python -X importtime`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=10)
+        parser.add_argument(
+            "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+        )
+        parser.add_argument(
+            "--configurations",
+            nargs="+",
+            choices=CONFIGURATIONS,
+            default=list(CONFIGURATIONS),
+        )
+        parser.add_argument(
+            "--report",
+            choices=SCENARIOS,
+            default="asgi",
+            help="The scenario whose imports are reported.",
+        )
+        parser.add_argument("--top", type=int, default=15)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            # A throwaway SQLite database, migrated once, whatever the
+            # settings point to
+            self.env = {
+                **os.environ,
+                "DB_ENGINE": "sqlite",
+                "DB_PATH": directory,
+                "PYTHONPATH": os.pathsep.join(
+                    filter(
+                        None, [str(PROJECT_DIR.parent), os.environ.get("PYTHONPATH")]
+                    )
+                ),
+            }
+            # Bytecode is written by the first run of each scenario, which
+            # is not timed, as the image compiles it at build time
+            self.env.pop("PYTHONDONTWRITEBYTECODE", None)
+            self.python(["manage.py", "migrate"], {})
+            for configuration in options["configurations"]:
+                for name in options["scenarios"]:
+                    self.time(name, configuration, options["runs"])
+            for configuration in options["configurations"]:
+                self.report(options["report"], configuration, options["top"])
+
+    def python(self, args, env, *options):
+        process = subprocess.run(
+            [sys.executable, *options, *args],
+            cwd=PROJECT_DIR,
+            env={**self.env, **env},
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode:
+            raise CommandError(f"{' '.join(args)} failed:\n{process.stderr}")
+        return process
+
+    def time(self, name, configuration, runs):
+        env = CONFIGURATIONS[configuration]
+        self.python(SCENARIOS[name], env)
+        samples = [timed(self.python, SCENARIOS[name], env)[1] for _ in range(runs)]
+        self.stdout.write(format_summary(f"{configuration} {name}", summarize(samples)))
+
+    def report(self, name, configuration, top):
+        process = self.python(
+            SCENARIOS[name], CONFIGURATIONS[configuration], "-X", "importtime"
+        )
+        rows = parse_importtime(process.stderr)
+        packages = Counter()
+        for module, self_us, _ in rows:
+            packages[package(module)] += self_us
+        self.stdout.write(
+            f"\n{configuration} {name}: {len(rows)} modules imported in "
+            f"{sum(packages.values()) / 1000:.0f}ms\n"
+            f"  {'self ms':>8}  package"
+        )
+        for package_name, self_us in packages.most_common(top):
+            self.stdout.write(f"  {self_us / 1000:8.1f}  {package_name}")
+        self.stdout.write(f"  {'cumul. ms':>8}  module")
+        for module, _, cumulative_us in sorted(rows, key=lambda row: -row[2])[:top]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f}  {module}")
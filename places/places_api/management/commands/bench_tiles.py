@@ -0,0 +1,69 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from places_api import caching
+from places_api import clusters
+from places_api.benchmarking import benchmark_database
+from places_api.benchmarking import format_summary
+from places_api.benchmarking import generate_places
+from places_api.benchmarking import random_point
+from places_api.benchmarking import summarize
+from places_api.benchmarking import timed
+from places_api.geo import point_tile
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the map tiles on a synthetic place table: rebuilds the "
+        "clusters, then times tiles computed from them and served from the "
+        "response cache, at every zoom."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--places", type=int, default=1_000_000)
+        parser.add_argument(
+            "--tiles", type=int, default=100, help="Tiles per zoom level."
+        )
+        parser.add_argument(
+            "--zooms", type=int, nargs="+", default=list(range(0, 17, 2))
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.stdout.write(f"Generating {options['places']} places...")
+            generate_places(options["places"])
+            count, ms = timed(clusters.rebuild)
+            self.stdout.write(f"Rebuilt {count} clusters in {ms / 1000:.1f}s")
+
+            client = Client()
+            rng = random.Random(0)
+            for zoom in options["zooms"]:
+                # Tiles around places, where maps are looked at
+                tiles = [
+                    point_tile(*random_point(rng), zoom)
+                    for _ in range(options["tiles"])
+                ]
+                samples, sizes = [], []
+                for x, y in tiles:
+                    result, ms = timed(clusters.tile, zoom, x, y)
+                    samples.append(ms)
+                    sizes.append(len(result["clusters"] or result["places"] or ()))
+                self.stdout.write(
+                    format_summary(f"zoom {zoom:>2} computed", summarize(samples))
+                    + f" items={sum(sizes) / len(sizes):.0f}"
+                )
+
+                urls = [
+                    reverse("place-tiles", kwargs={"zoom": zoom, "x": x, "y": y})
+                    for x, y in tiles
+                ]
+                caching.invalidate()
+                for url in urls:
+                    client.get(url)
+                samples = [timed(client.get, url)[1] for url in urls]
+                self.stdout.write(
+                    format_summary(f"zoom {zoom:>2} cached", summarize(samples))
+                )
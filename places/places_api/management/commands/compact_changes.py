@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from places_api import changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the changes of the place change feed that later ones "
+        "supersede, and the tombstones of deleted places older than the "
+        "retention. Clients with tokens from before pruned tombstones have to "
+        "sync from the start again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tombstone-days",
+            type=float,
+            default=changes.TOMBSTONE_RETENTION.days,
+            help="Days tombstones are kept for.",
+        )
+
+    def handle(self, *args, **options):
+        superseded, tombstones = changes.compact(
+            timedelta(days=options["tombstone_days"])
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {superseded} superseded changes and {tombstones} tombstones"
+            )
+        )
@@ -0,0 +1,139 @@
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+from django.db import transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.utils import load_backend
+from taggit.models import Tag
+
+from places_api import caching
+from places_api.benchmarking import timed
+from places_api.models import Place
+from places_api.models import UUIDTaggedItem
+from places_api.signals import places_bulk_changed
+
+SOURCE_ALIAS = "copy_source"
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the places and their tags of an SQLite database file into the "
+        "configured database, e.g. a new PostgreSQL one, in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="SQLite database file to copy from.")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.is_file():
+            raise CommandError(f"{path} does not exist.")
+        using = options["database"]
+        if Place.objects.using(using).exists():
+            raise CommandError("The places table of the target database is not empty.")
+
+        source = self.open_source(path)
+        try:
+            self.check_migrated(source)
+            with transaction.atomic(using=using):
+                counts, ms = timed(self.copy, using, options["batch_size"])
+                self.reset_sequences(using)
+        finally:
+            source.close()
+            del connections[SOURCE_ALIAS]
+
+        if connections[using].vendor == "postgresql":
+            with connections[using].cursor() as cursor:
+                cursor.execute("ANALYZE")
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Copied {} places, {} tags and {} tagged items in {:.1f}s".format(
+                    *counts, ms / 1000
+                )
+            )
+        )
+
+    @staticmethod
+    def open_source(path):
+        settings_dict = connections.configure_settings(
+            {
+                DEFAULT_DB_ALIAS: {
+                    "ENGINE": "django.db.backends.sqlite3",
+                    "NAME": path,
+                }
+            }
+        )[DEFAULT_DB_ALIAS]
+        # Available to the ORM in this thread only, as the source is not in
+        # the settings
+        connections[SOURCE_ALIAS] = load_backend(
+            settings_dict["ENGINE"]
+        ).DatabaseWrapper(settings_dict, SOURCE_ALIAS)
+        return connections[SOURCE_ALIAS]
+
+    @staticmethod
+    def check_migrated(source):
+        """The columns of both databases only match at the same migration."""
+        applied = MigrationRecorder(source).applied_migrations()
+        latest = MigrationLoader(None).graph.leaf_nodes("places_api")
+        missing = [node for node in latest if node not in applied]
+        if missing:
+            raise CommandError(
+                f"Migrate the SQLite database to {missing[0][1]} first, "
+                "with DB_PATH pointing at its directory."
+            )
+
+    def copy(self, using, batch_size):
+        """Copies rows with their primary keys, so tagged items keep theirs."""
+        tag_count = 0
+        for batch in self.batches(Tag.objects.using(SOURCE_ALIAS), batch_size):
+            Tag.objects.using(using).bulk_create(batch)
+            tag_count += len(batch)
+
+        # Content types are numbered by each database as it was migrated
+        source_type = ContentType.objects.db_manager(SOURCE_ALIAS).get_for_model(Place)
+        target_type = ContentType.objects.db_manager(using).get_for_model(Place)
+        items = UUIDTaggedItem.objects.using(SOURCE_ALIAS).filter(
+            content_type=source_type
+        )
+        item_count = 0
+        for batch in self.batches(items, batch_size):
+            for item in batch:
+                item.content_type_id = target_type.pk
+            UUIDTaggedItem.objects.using(using).bulk_create(batch)
+            item_count += len(batch)
+
+        # Copied after their tags, which the full-text index reads when the
+        # signal tells it about the places, as for any bulk write
+        place_count = 0
+        for batch in self.batches(Place.objects.using(SOURCE_ALIAS), batch_size):
+            Place.objects.using(using).bulk_create(batch)
+            places_bulk_changed.send(sender=Place, created=batch, updated=[])
+            place_count += len(batch)
+        caching.invalidate(tags=True)
+        return place_count, tag_count, item_count
+
+    @staticmethod
+    def batches(queryset, batch_size):
+        rows = queryset.order_by("pk").iterator(chunk_size=batch_size)
+        while batch := list(islice(rows, batch_size)):
+            yield batch
+
+    @staticmethod
+    def reset_sequences(using):
+        # Rows were inserted with their ids, the next ones must follow them
+        connection = connections[using]
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Tag, UUIDTaggedItem]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
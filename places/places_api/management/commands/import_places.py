@@ -0,0 +1,270 @@
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from places_api import bulk
+from places_api.models import Place
+from places_api.serializers import PlaceSerializer
+
+FORMATS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".geojson": "geojson",
+}
+
+
+def read_csv(stream):
+    yield from csv.DictReader(stream)
+
+
+def read_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            yield line
+
+
+def read_geojson(stream, buffer_size=1 << 16):
+    """
+    Yields the features of a FeatureCollection one at a time, decoding them
+    straight from a sliding buffer so the document is never held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while '"features"' not in buffer:
+        chunk = stream.read(buffer_size)
+        if not chunk:
+            return
+        buffer = buffer[-len('"features"') :] + chunk
+    buffer = buffer[buffer.index('"features"') + len('"features"') :]
+
+    position, in_array = 0, False
+    while True:
+        # Skip separators, refilling the buffer whenever it runs dry
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n:,[":
+                in_array = in_array or buffer[position] == "["
+                position += 1
+            if position < len(buffer):
+                break
+            buffer, position = stream.read(buffer_size), 0
+            if not buffer:
+                return
+        if not in_array or buffer[position] == "]":
+            return
+
+        while True:
+            try:
+                feature, end = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError:
+                chunk = stream.read(buffer_size)
+                if not chunk:
+                    raise
+                buffer, position = buffer[position:] + chunk, 0
+        yield feature
+        position = end
+
+
+def parse_csv(row):
+    return {
+        "address": row.get("address") or None,
+        "code": row.get("code"),
+        "location": {"lat": row.get("location_lat"), "lon": row.get("location_lon")},
+        "name": row.get("name") or None,
+        "reward_checkin_points": row.get("reward_checkin_points"),
+        "tags": [tag for tag in (row.get("tags") or "").split(",") if tag],
+        "type": row.get("type"),
+    }
+
+
+def parse_ndjson(line):
+    return parse_feature(json.loads(line))
+
+
+def parse_feature(record):
+    """Converts a GeoJSON point feature to the API representation."""
+    if not isinstance(record, dict) or record.get("type") != "Feature":
+        return record
+    data = dict(record.get("properties") or {})
+    coordinates = (record.get("geometry") or {}).get("coordinates") or [None, None]
+    data["location"] = {"lat": coordinates[1], "lon": coordinates[0]}
+    return data
+
+
+# Readers only split the input into records, the matching parser runs in
+# the workers along with the validation
+READERS = {"csv": read_csv, "ndjson": read_ndjson, "geojson": read_geojson}
+PARSERS = {"csv": parse_csv, "ndjson": parse_ndjson, "geojson": parse_feature}
+
+
+def init_worker():
+    django.setup()
+
+
+def validate_batch(file_format, records):
+    """
+    Parses a batch of records and runs the `PlaceSerializer` validation over
+    them. Returns (validated rows, errors), errors being (offset, detail) pairs.
+    """
+    parse = PARSERS[file_format]
+    serializer = PlaceSerializer()
+    rows, errors = [], []
+    for offset, record in enumerate(records):
+        try:
+            rows.append(serializer.run_validation(parse(record)))
+        except ValidationError as exc:
+            errors.append((offset, json.loads(json.dumps(exc.detail))))
+        except ValueError as exc:
+            errors.append((offset, {"non_field_errors": [str(exc)]}))
+    return rows, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports places from a CSV, NDJSON or GeoJSON file in constant memory, "
+        "creating new places and updating existing ones by code."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or - for stdin.")
+        parser.add_argument("--format", choices=sorted(READERS))
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Processes that parse and validate batches, 0 to do it inline.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording progress; an existing one resumes the import.",
+        )
+        parser.add_argument("--max-errors-shown", type=int, default=10)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        self.source = os.path.abspath(path)
+        file_format = options["format"] or FORMATS.get(os.path.splitext(path)[1])
+        if file_format is None:
+            raise CommandError("Cannot tell the input format, pass --format.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        self.checkpoint_path = options["checkpoint"]
+        self.progress = self.load_checkpoint()
+        self.max_errors_shown = options["max_errors_shown"]
+        self.started = time.perf_counter()
+        self.processed_now = 0
+
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            records = READERS[file_format](stream)
+            skipped = self.progress["records"]
+            if skipped:
+                self.stdout.write(f"Resuming after {skipped} records")
+                records = islice(records, skipped, None)
+            batches = self.batches(records, options["batch_size"])
+            if options["workers"] > 0:
+                self.run_parallel(file_format, batches, options["workers"])
+            else:
+                for batch in batches:
+                    self.write(batch, validate_batch(file_format, batch))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {self.progress['records']} records: "
+                f"{self.progress['created']} created, "
+                f"{self.progress['updated']} updated, "
+                f"{self.progress['invalid']} invalid"
+            )
+        )
+
+    @staticmethod
+    def batches(records, size):
+        while batch := list(islice(records, size)):
+            yield batch
+
+    def run_parallel(self, file_format, batches, workers):
+        with ProcessPoolExecutor(workers, initializer=init_worker) as pool:
+            # Keep a bounded number of batches in flight so memory stays flat,
+            # and write them back in input order so the checkpoint is exact
+            pending = []
+            for batch in batches:
+                pending.append((batch, pool.submit(validate_batch, file_format, batch)))
+                if len(pending) >= workers * 2:
+                    batch, future = pending.pop(0)
+                    self.write(batch, future.result())
+            for batch, future in pending:
+                self.write(batch, future.result())
+
+    def write(self, batch, validated):
+        rows, errors = validated
+        first_record = self.progress["records"]
+        for offset, detail in errors:
+            if self.progress["invalid"] < self.max_errors_shown:
+                self.stderr.write(f"Record {first_record + offset + 1}: {detail}")
+            self.progress["invalid"] += 1
+
+        # The last occurrence of a code within a batch wins
+        rows = list({row["code"]: row for row in rows}.values())
+        existing = {}
+        for place in Place.objects.filter(code__in=[row["code"] for row in rows]):
+            existing.setdefault(place.code, place)
+
+        with transaction.atomic():
+            created = bulk.create_places(
+                [row for row in rows if row["code"] not in existing]
+            )
+            updated = bulk.update_places(
+                [
+                    (existing[row["code"]], row)
+                    for row in rows
+                    if row["code"] in existing
+                ]
+            )
+
+        self.progress["created"] += len(created)
+        self.progress["updated"] += len(updated)
+        self.progress["records"] += len(batch)
+        self.processed_now += len(batch)
+        self.save_checkpoint()
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f"{self.progress['records']} records, "
+            f"{self.processed_now / elapsed:.0f} rows/s"
+        )
+
+    def load_checkpoint(self):
+        progress = {"records": 0, "created": 0, "updated": 0, "invalid": 0}
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                saved = json.load(f)
+            if saved.get("source") != self.source:
+                raise CommandError(
+                    f"Checkpoint {self.checkpoint_path} belongs to {saved.get('source')}."
+                )
+            progress.update(saved["progress"])
+        return progress
+
+    def save_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        temporary = f"{self.checkpoint_path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"source": self.source, "progress": self.progress}, f)
+        os.replace(temporary, self.checkpoint_path)
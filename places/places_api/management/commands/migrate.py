@@ -0,0 +1,27 @@
+from django.core.management.commands import migrate
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+
+
+class Command(migrate.Command):
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--if-needed",
+            action="store_true",
+            help=(
+                "Returns straight away when every migration is applied, "
+                "without running the system checks, which import every view "
+                "of the project. Containers run it at each start."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["if_needed"] and not options["app_label"]:
+            connection = connections[options["database"]]
+            executor = MigrationExecutor(connection)
+            if not executor.migration_plan(executor.loader.graph.leaf_nodes()):
+                if options["verbosity"] >= 1:
+                    self.stdout.write("No migrations to apply.")
+                return
+        super().handle(*args, **options)
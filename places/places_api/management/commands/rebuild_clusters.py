@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from places_api import caching
+from places_api import clusters
+from places_api.benchmarking import timed
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the map clusters of places from the place table, e.g. "
+        "after writes that bypassed the model signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        count, ms = timed(clusters.rebuild, using=options["database"])
+        # Cached tiles were computed from the previous clusters
+        caching.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {count} clusters in {ms / 1000:.1f}s")
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from places_api import caching
+from places_api import search
+from places_api.benchmarking import timed
+
+
+class Command(BaseCommand):
+    help = "Recreates the full-text search index of places from the place table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--chunk-size", type=int, default=search.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        if not search.is_available(using):
+            raise CommandError(
+                "The full-text index needs SQLite, searches on this database "
+                "use icontains lookups instead."
+            )
+
+        indexed, ms = timed(
+            search.rebuild, using=using, chunk_size=options["chunk_size"]
+        )
+        # Cached ?q= pages were computed from the previous index
+        caching.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {indexed} places in {ms / 1000:.1f}s")
+        )
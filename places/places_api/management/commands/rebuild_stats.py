@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from places_api import caching
+from places_api import clusters
+from places_api import stats
+from places_api.benchmarking import timed
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the summary tables behind the place statistics, the tag "
+        "summaries and the map clusters the type statistics read, from the "
+        "places and their tags."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        tags, tags_ms = timed(stats.rebuild, using=using)
+        cells, cells_ms = timed(clusters.rebuild, using=using)
+        # Cached statistics were computed from the previous summaries
+        caching.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Summed up {tags} tags in {tags_ms / 1000:.1f}s and rebuilt "
+                f"{cells} clusters in {cells_ms / 1000:.1f}s"
+            )
+        )
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from places_api import checkins
+
+
+class Command(BaseCommand):
+    help = (
+        "Records the check-ins of the log that no running process holds, "
+        "those of processes that stopped before recording them, and deletes "
+        "their segments. Check-ins already recorded are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--log-dir", default=settings.PLACES_CHECKIN_LOG_DIR)
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        segments, recorded = checkins.replay(
+            options["log_dir"], using=options["database"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recorded {recorded} check-ins from {segments} segments"
+            )
+        )
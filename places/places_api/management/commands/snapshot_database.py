@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db import close_old_connections
+from django.db import connections
+
+from places_api import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Replaces the read replicas of PLACES_REPLICAS with snapshots of the "
+        "database, once or every --interval seconds, which has to be below "
+        "PLACES_REPLICA_MAX_STALENESS for the replicas to stay in use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Seconds between snapshots, 0 takes one and returns.",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if connections[options["database"]].vendor != "sqlite":
+            raise CommandError("Replicas are snapshots of a SQLite database.")
+        aliases = replicas.replica_aliases()
+        if not aliases:
+            raise CommandError("No replica in PLACES_REPLICAS.")
+        while True:
+            start = time.monotonic()
+            for alias in aliases:
+                taken = time.monotonic()
+                position = replicas.take_snapshot(
+                    connections[alias].settings_dict["NAME"], options["database"]
+                )
+                if options["verbosity"] >= 1:
+                    self.stdout.write(
+                        f"Took a snapshot at position {position} for {alias} in "
+                        f"{(time.monotonic() - taken) * 1000:.0f}ms"
+                    )
+            if not options["interval"]:
+                return
+            # As between requests, the connection is kept for CONN_MAX_AGE
+            close_old_connections()
+            time.sleep(max(0, options["interval"] - (time.monotonic() - start)))
@@ -0,0 +1,337 @@
+"""
+Request metrics, in the Prometheus text format at `/metrics`.
+
+`MetricsMiddleware` times every request and labels it with the view that
+served it, e.g. `PlaceViewSet.list`. Per endpoint and method, it keeps
+histograms of the latency, the number and duration of database queries, the
+time spent serializing and rendering places, and the response size, and adds
+them to the response as a `Server-Timing` header.
+
+Queries are counted by a wrapper every database connection gets when it
+opens. It finds the metrics of the request through a context variable, which
+follows the request into the threads of the async views.
+
+Metrics are kept by each process, as the response cache statistics are. With
+several workers, each scrape reads the worker that answers it.
+
+Requests slower than `PLACES_SLOW_REQUEST_MS` are logged with their SQL, and a
+share `PLACES_PROFILE_SAMPLE_RATE` of requests is profiled with cProfile so
+slow ones are logged with their profile too. Both are off by default, only
+the counters and timers then run.
+"""
+import contextvars
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+# Statements kept for the slow request log, bulk requests run thousands
+MAX_STATEMENTS = 100
+PROFILE_LINES = 30
+
+HISTOGRAMS = {
+    "places_http_request_duration_seconds": (
+        "Time to answer requests, streamed bodies excluded.",
+        DURATION_BUCKETS,
+    ),
+    "places_http_request_db_queries": (
+        "Database queries run by requests.",
+        QUERY_BUCKETS,
+    ),
+    "places_http_request_db_duration_seconds": (
+        "Time requests spent in database queries.",
+        DURATION_BUCKETS,
+    ),
+    "places_http_request_serialize_duration_seconds": (
+        "Time requests spent serializing and rendering places.",
+        DURATION_BUCKETS,
+    ),
+    "places_http_response_size_bytes": (
+        "Size of the response bodies, streamed ones excluded.",
+        SIZE_BUCKETS,
+    ),
+}
+
+_current = contextvars.ContextVar("places_request_metrics", default=None)
+_requests = {}
+_histograms = {}
+_lock = threading.Lock()
+# One profiler at a time, Python cannot run two in a thread
+_profile_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """What a request spent, filled in while it runs."""
+
+    __slots__ = ("queries", "db_seconds", "serialize_seconds", "statements")
+
+    def __init__(self, capture_sql=False):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.statements = [] if capture_sql else None
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Per bucket, the last one for values above every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+@receiver(connection_created)
+def install_query_wrapper(sender, connection, **kwargs):
+    # Kept by the connection object, which may reconnect
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_seconds += time.perf_counter() - start
+        metrics.queries += 1
+        if metrics.statements is not None and len(metrics.statements) < MAX_STATEMENTS:
+            metrics.statements.append(sql)
+
+
+@contextmanager
+def serializing():
+    """Adds the time spent in the block to the serialization time of the request."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_seconds += time.perf_counter() - start
+
+
+def endpoint(request):
+    """
+    Names the view that served the request, by the viewset action for DRF
+    views. Views standing in for others name them with `metrics_view`.
+    """
+    match = request.resolver_match
+    if match is None:
+        return "unmatched"
+    view = getattr(match.func, "metrics_view", match.func)
+    cls = getattr(view, "cls", None)
+    if cls is None:
+        return f"{view.__module__}.{getattr(view, '__qualname__', type(view).__name__)}"
+    actions = getattr(view, "actions", None) or {}
+    method = request.method.lower()
+    # DRF answers HEAD with the GET action
+    action = actions.get(method) or (method == "head" and actions.get("get"))
+    return f"{cls.__name__}.{action}" if action else cls.__name__
+
+
+def record(endpoint, method, status, seconds, metrics, size):
+    method = method if method in METHODS else "OTHER"
+    observations = [
+        ("places_http_request_duration_seconds", seconds),
+        ("places_http_request_db_queries", metrics.queries),
+        ("places_http_request_db_duration_seconds", metrics.db_seconds),
+        ("places_http_request_serialize_duration_seconds", metrics.serialize_seconds),
+    ]
+    if size is not None:
+        observations.append(("places_http_response_size_bytes", size))
+    with _lock:
+        key = (endpoint, method, str(status))
+        _requests[key] = _requests.get(key, 0) + 1
+        for name, value in observations:
+            key = (name, endpoint, method)
+            histogram = _histograms.get(key)
+            if histogram is None:
+                histogram = _histograms[key] = Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+
+def clear():
+    with _lock:
+        _requests.clear()
+        _histograms.clear()
+
+
+def label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def labels(**values):
+    return ",".join(f'{name}="{label_value(value)}"' for name, value in values.items())
+
+
+def exposition():
+    """The metrics of this process in the Prometheus text format."""
+    with _lock:
+        requests = sorted(_requests.items())
+        histograms = sorted(
+            (key, list(histogram.counts), histogram.sum, histogram.count)
+            for key, histogram in _histograms.items()
+        )
+
+    lines = [
+        "# HELP places_http_requests_total Requests answered by this process.",
+        "# TYPE places_http_requests_total counter",
+    ]
+    for (endpoint, method, status), count in requests:
+        lines.append(
+            f"places_http_requests_total"
+            f"{{{labels(endpoint=endpoint, method=method, status=status)}}} {count}"
+        )
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (metric, endpoint, method), counts, total, count in histograms:
+            if metric != name:
+                continue
+            common = labels(endpoint=endpoint, method=method)
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{common},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{common}}} {total}")
+            lines.append(f"{name}_count{{{common}}} {count}")
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_view(request):
+    # Async, the scrapes do not queue behind the sync views
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
+
+
+def server_timing(metrics, seconds):
+    return (
+        f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.queries} queries", '
+        f"serialize;dur={metrics.serialize_seconds * 1000:.1f}, "
+        f"total;dur={seconds * 1000:.1f}"
+    )
+
+
+class MetricsMiddleware:
+    """
+    Records the metrics of every request and adds its `Server-Timing`
+    header. Listed first in `MIDDLEWARE`, it times the others too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_request_ms = getattr(settings, "PLACES_SLOW_REQUEST_MS", None)
+        self.profile_sample_rate = getattr(settings, "PLACES_PROFILE_SAMPLE_RATE", 0)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics, token, profiler, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            seconds = self.stop(token, profiler, start)
+        return self.finish(request, response, metrics, seconds, profiler)
+
+    async def __acall__(self, request):
+        metrics, token, profiler, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            seconds = self.stop(token, profiler, start)
+        return self.finish(request, response, metrics, seconds, profiler)
+
+    def start(self):
+        metrics = RequestMetrics(capture_sql=self.slow_request_ms is not None)
+        token = _current.set(metrics)
+        profiler = None
+        if (
+            self.slow_request_ms is not None
+            and self.profile_sample_rate
+            and random.random() < self.profile_sample_rate
+            and _profile_lock.acquire(blocking=False)
+        ):
+            # Profiles the thread the request starts on, with async views
+            # the event loop, which serves other requests meanwhile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return metrics, token, profiler, time.perf_counter()
+
+    @staticmethod
+    def stop(token, profiler, start):
+        seconds = time.perf_counter() - start
+        _current.reset(token)
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+        return seconds
+
+    def finish(self, request, response, metrics, seconds, profiler):
+        size = None if response.streaming else len(response.content)
+        record(
+            endpoint(request),
+            request.method,
+            response.status_code,
+            seconds,
+            metrics,
+            size,
+        )
+        if self.slow_request_ms is not None and seconds * 1000 >= self.slow_request_ms:
+            self.log_slow_request(request, response, metrics, seconds, profiler)
+        response["Server-Timing"] = server_timing(metrics, seconds)
+        return response
+
+    @staticmethod
+    def log_slow_request(request, response, metrics, seconds, profiler):
+        sections = [
+            f"Slow request {request.method} {request.get_full_path()} "
+            f"{response.status_code}: {seconds * 1000:.1f}ms, {metrics.queries} "
+            f"queries in {metrics.db_seconds * 1000:.1f}ms, serialization "
+            f"{metrics.serialize_seconds * 1000:.1f}ms",
+            "SQL:",
+            *metrics.statements,
+        ]
+        if metrics.queries > len(metrics.statements):
+            sections.append(f"... {metrics.queries - len(metrics.statements)} more")
+        if profiler is not None:
+            stream = io.StringIO()
+            stats = pstats.Stats(profiler, stream=stream)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_LINES)
+            sections += ["Profile:", stream.getvalue()]
+        logger.warning("\n".join(sections))
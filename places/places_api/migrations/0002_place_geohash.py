@@ -0,0 +1,63 @@
+from django.db import migrations, models
+
+# Frozen from `places_api.geo` as of this migration
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            rng, value = lon_range, lon
+        else:
+            rng, value = lat_range, lat
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def populate_geohash(apps, schema_editor):
+    Place = apps.get_model("places_api", "Place")
+    db_alias = schema_editor.connection.alias
+    places = list(Place.objects.using(db_alias).only("location_lat", "location_lon"))
+    for place in places:
+        place.geohash = geohash_encode(
+            float(place.location_lat), float(place.location_lon)
+        )
+    Place.objects.using(db_alias).bulk_update(places, ["geohash"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("places_api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="place",
+            name="geohash",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=12
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_geohash, migrations.RunPython.noop),
+    ]
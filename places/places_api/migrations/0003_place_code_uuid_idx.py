@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("places_api", "0002_place_geohash"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="place",
+            index=models.Index(fields=["code", "uuid"], name="place_code_uuid_idx"),
+        ),
+    ]
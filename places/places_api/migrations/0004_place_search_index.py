@@ -0,0 +1,93 @@
+import uuid
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen from `places_api.search` as of this migration
+TABLE = "places_api_place_fts"
+CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE {TABLE} USING fts5("
+    "uuid UNINDEXED, name, address, type, tags, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+)
+WEIGHTS = "bm25(0.0, 10.0, 2.0, 4.0, 4.0)"
+
+
+def search_rowid(place_uuid):
+    return place_uuid.int & (2**63 - 1)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        cursor.execute(
+            f"INSERT INTO {TABLE} ({TABLE}, rank) VALUES ('rank', %s)", [WEIGHTS]
+        )
+        cursor.execute(
+            "SELECT i.object_id, t.name FROM places_api_uuidtaggeditem i "
+            "JOIN taggit_tag t ON t.id = i.tag_id"
+        )
+        tags = {}
+        for object_id, name in cursor.fetchall():
+            tags.setdefault(object_id, []).append(name)
+
+        cursor.execute("SELECT uuid, name, address, type FROM places_api_place")
+        rows = [
+            (
+                search_rowid(uuid.UUID(place_uuid)),
+                place_uuid,
+                name or "",
+                address or "",
+                place_type,
+                " ".join(tags.get(place_uuid, [])),
+            )
+            for place_uuid, name, address, place_type in cursor.fetchall()
+        ]
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, uuid, name, address, type, tags) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("places_api", "0003_place_code_uuid_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlaceSearchDocument",
+            fields=[
+                (
+                    "place",
+                    models.OneToOneField(
+                        db_column="uuid",
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="places_api.place",
+                    ),
+                ),
+                ("document", models.TextField(db_column="places_api_place_fts")),
+                ("rank", models.FloatField()),
+            ],
+            options={
+                "db_table": "places_api_place_fts",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
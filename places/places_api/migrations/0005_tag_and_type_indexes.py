@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("places_api", "0004_place_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="uuidtaggeditem",
+            index=models.Index(
+                fields=["tag", "content_type", "object_id"],
+                name="tagged_item_tag_object_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="place",
+            index=models.Index(
+                fields=["type", "code", "uuid"], name="place_type_code_uuid_idx"
+            ),
+        ),
+    ]
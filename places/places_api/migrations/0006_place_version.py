@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("places_api", "0005_tag_and_type_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="place",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="place",
+            name="version",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,87 @@
+import logging
+
+from django.db import DatabaseError, migrations, transaction
+
+# Frozen from `places_api.postgres` as of this migration, see its docstring
+logger = logging.getLogger("places_api.postgres")
+
+TRIGRAM_COLUMNS = ["name", "address"]
+
+
+def create_extension(connection, name):
+    """Creates the extension if possible, and tells whether it exists."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = %s", [name])
+        if cursor.fetchone():
+            return True
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = %s", [name])
+        if not cursor.fetchone():
+            logger.warning("The %s extension is not installed on the server.", name)
+            return False
+    try:
+        # In a savepoint, the migration goes on without it on failure
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE EXTENSION IF NOT EXISTS {name}")
+    except DatabaseError as e:
+        logger.warning("The %s extension could not be created: %s", name, e)
+        return False
+    return True
+
+
+def create_geography(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "ALTER TABLE places_api_place ADD COLUMN location geography(Point, 4326) "
+            "GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint("
+            "location_lon::float8, location_lat::float8), 4326)::geography) STORED"
+        )
+        cursor.execute(
+            "CREATE INDEX place_location_gist_idx ON places_api_place "
+            "USING gist (location)"
+        )
+
+
+def create_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'ALTER TABLE places_api_place ALTER COLUMN geohash TYPE varchar(12) COLLATE "C"'
+        )
+
+    if create_extension(connection, "pg_trgm"):
+        with connection.cursor() as cursor:
+            for column in TRIGRAM_COLUMNS:
+                cursor.execute(
+                    f"CREATE INDEX place_{column}_trgm_idx ON places_api_place "
+                    f"USING gin (UPPER({column}::text) gin_trgm_ops)"
+                )
+
+    if create_extension(connection, "postgis"):
+        create_geography(connection)
+
+
+def drop_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("ALTER TABLE places_api_place DROP COLUMN IF EXISTS location")
+        for column in TRIGRAM_COLUMNS:
+            cursor.execute(f"DROP INDEX IF EXISTS place_{column}_trgm_idx")
+        cursor.execute(
+            "ALTER TABLE places_api_place ALTER COLUMN geohash TYPE varchar(12)"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("places_api", "0006_place_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
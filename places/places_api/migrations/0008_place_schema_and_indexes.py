@@ -0,0 +1,99 @@
+import logging
+
+from django.db import DatabaseError, migrations, models, transaction
+
+# Frozen from `places_api.postgres` as of this migration
+logger = logging.getLogger("places_api.postgres")
+
+
+def create_extension(connection, name):
+    """Creates the extension if possible, and tells whether it exists."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = %s", [name])
+        if cursor.fetchone():
+            return True
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = %s", [name])
+        if not cursor.fetchone():
+            logger.warning("The %s extension is not installed on the server.", name)
+            return False
+    try:
+        # In a savepoint, the migration goes on without it on failure
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE EXTENSION IF NOT EXISTS {name}")
+    except DatabaseError as e:
+        logger.warning("The %s extension could not be created: %s", name, e)
+        return False
+    return True
+
+
+def drop_geography(apps, schema_editor):
+    # PostgreSQL cannot change the type of columns a generated column uses
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "ALTER TABLE places_api_place DROP COLUMN IF EXISTS location"
+        )
+
+
+def create_geography(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql" or not create_extension(connection, "postgis"):
+        return
+    schema_editor.execute(
+        "ALTER TABLE places_api_place ADD COLUMN location geography(Point, 4326) "
+        "GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint("
+        "location_lon::float8, location_lat::float8), 4326)::geography) STORED"
+    )
+    schema_editor.execute(
+        "CREATE INDEX place_location_gist_idx ON places_api_place "
+        "USING gist (location)"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("places_api", "0007_postgres_indexes"),
+    ]
+
+    # Brings the schema in line with `Place`, which always declared the
+    # coordinates as decimals while 0001 created floats. The name and address
+    # stay nullable, blank only changes validation
+    operations = [
+        migrations.AlterField(
+            model_name="place",
+            name="address",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name="place",
+            name="name",
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.RunPython(drop_geography, create_geography),
+        migrations.AlterField(
+            model_name="place",
+            name="location_lat",
+            field=models.DecimalField(decimal_places=6, max_digits=9),
+        ),
+        migrations.AlterField(
+            model_name="place",
+            name="location_lon",
+            field=models.DecimalField(decimal_places=6, max_digits=9),
+        ),
+        migrations.RunPython(create_geography, drop_geography),
+        # Serves bounding boxes too large for geohash prefixes
+        migrations.AddIndex(
+            model_name="place",
+            index=models.Index(
+                fields=["location_lat", "location_lon"], name="place_lat_lon_idx"
+            ),
+        ),
+        # Loads the tags of a page of places
+        migrations.AddIndex(
+            model_name="uuidtaggeditem",
+            index=models.Index(
+                fields=["content_type", "object_id"], name="tagged_item_object_idx"
+            ),
+        ),
+    ]
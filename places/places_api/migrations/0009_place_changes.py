@@ -0,0 +1,86 @@
+from itertools import islice
+
+from django.db import migrations, models
+import django.utils.timezone
+
+BATCH_SIZE = 5000
+
+
+def record_existing_places(apps, schema_editor):
+    # Clients syncing from the start of the feed get the places written
+    # before it existed too, oldest first
+    Place = apps.get_model("places_api", "Place")
+    PlaceChange = apps.get_model("places_api", "PlaceChange")
+    using = schema_editor.connection.alias
+    rows = (
+        Place.objects.using(using)
+        .order_by("updated_at", "uuid")
+        .values_list("uuid", "updated_at")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    while batch := list(islice(rows, BATCH_SIZE)):
+        PlaceChange.objects.using(using).bulk_create(
+            [
+                PlaceChange(place_uuid=place_uuid, created_at=updated_at)
+                for place_uuid, updated_at in batch
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("places_api", "0008_place_schema_and_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeFeedCompaction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("horizon", models.BigIntegerField()),
+                (
+                    "compacted_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PlaceChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("place_uuid", models.UUIDField()),
+                ("deleted", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="placechange",
+            index=models.Index(
+                fields=["place_uuid", "id"], name="place_change_place_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="placechange",
+            index=models.Index(
+                fields=["deleted", "created_at"], name="place_change_tombstone_idx"
+            ),
+        ),
+        migrations.RunPython(record_existing_places, migrations.RunPython.noop),
+    ]
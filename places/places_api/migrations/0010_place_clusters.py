@@ -0,0 +1,95 @@
+from django.db import migrations, models
+
+# Frozen from `clusters.rebuild()` as of this migration
+MAX_PRECISION = 7
+MICRO = 1_000_000
+
+
+def cluster_existing_places(apps, schema_editor):
+    quote_name = schema_editor.connection.ops.quote_name
+    table, place_table = (
+        quote_name(name) for name in ("places_api_placecluster", "places_api_place")
+    )
+    columns = ", ".join(
+        quote_name(column)
+        for column in (
+            "precision",
+            "cell",
+            "type",
+            "count",
+            "lat_sum",
+            "lon_sum",
+            "points_sum",
+        )
+    )
+    precision, cell, place_type, geohash, lat, lon, points = (
+        quote_name(column)
+        for column in (
+            "precision",
+            "cell",
+            "type",
+            "geohash",
+            "location_lat",
+            "location_lon",
+            "reward_checkin_points",
+        )
+    )
+    sums = ", ".join(
+        f"SUM({quote_name(column)})"
+        for column in ("count", "lat_sum", "lon_sum", "points_sum")
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) "
+            f"SELECT %s, SUBSTR({geohash}, 1, %s), {place_type}, COUNT(*), "
+            f"SUM(CAST(ROUND({lat} * {MICRO}) AS BIGINT)), "
+            f"SUM(CAST(ROUND({lon} * {MICRO}) AS BIGINT)), SUM({points}) "
+            f"FROM {place_table} GROUP BY SUBSTR({geohash}, 1, %s), {place_type}",
+            [MAX_PRECISION, MAX_PRECISION, MAX_PRECISION],
+        )
+        for coarser in range(MAX_PRECISION - 1, 0, -1):
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT %s, SUBSTR({cell}, 1, %s), {place_type}, {sums} "
+                f"FROM {table} WHERE {precision} = %s "
+                f"GROUP BY SUBSTR({cell}, 1, %s), {place_type}",
+                [coarser, coarser, coarser + 1, coarser],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("places_api", "0009_place_changes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlaceCluster",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("precision", models.PositiveSmallIntegerField()),
+                ("cell", models.CharField(max_length=12)),
+                ("type", models.CharField(max_length=50)),
+                ("count", models.IntegerField()),
+                ("lat_sum", models.BigIntegerField()),
+                ("lon_sum", models.BigIntegerField()),
+                ("points_sum", models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="placecluster",
+            constraint=models.UniqueConstraint(
+                fields=("precision", "cell", "type"), name="place_cluster_cell_uniq"
+            ),
+        ),
+        migrations.RunPython(cluster_existing_places, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def summarize_existing_tags(apps, schema_editor):
+    # Frozen from `stats.rebuild()` as of this migration
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    using = schema_editor.connection.alias
+    content_type = (
+        ContentType.objects.using(using)
+        .filter(app_label="places_api", model="place")
+        .first()
+    )
+    if content_type is None:
+        # Created once migrated, a database without it holds no tagged place
+        return
+    quote_name = schema_editor.connection.ops.quote_name
+    table, place_table, item_table = (
+        quote_name(name)
+        for name in (
+            "places_api_placetagsummary",
+            "places_api_place",
+            "places_api_uuidtaggeditem",
+        )
+    )
+    tag, count, points_sum, uuid, points, object_id, item_type = (
+        quote_name(column)
+        for column in (
+            "tag_id",
+            "count",
+            "points_sum",
+            "uuid",
+            "reward_checkin_points",
+            "object_id",
+            "content_type_id",
+        )
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({tag}, {count}, {points_sum}) "
+            f"SELECT {item_table}.{tag}, COUNT(*), SUM({place_table}.{points}) "
+            f"FROM {item_table} JOIN {place_table} "
+            f"ON {place_table}.{uuid} = {item_table}.{object_id} "
+            f"WHERE {item_table}.{item_type} = %s "
+            f"GROUP BY {item_table}.{tag}",
+            [content_type.pk],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("taggit", "0005_auto_20220424_2025"),
+        ("places_api", "0010_place_clusters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlaceTagSummary",
+            fields=[
+                (
+                    "tag",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="place_summary",
+                        serialize=False,
+                        to="taggit.tag",
+                    ),
+                ),
+                ("count", models.IntegerField()),
+                ("points_sum", models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="place",
+            index=models.Index(
+                fields=["-reward_checkin_points", "code", "uuid"],
+                name="place_points_code_uuid_idx",
+            ),
+        ),
+        migrations.RunPython(summarize_existing_tags, migrations.RunPython.noop),
+    ]
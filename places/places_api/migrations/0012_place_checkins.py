@@ -0,0 +1,52 @@
+# Generated by Django 4.1.13 on 2026-10-18 13:40
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("places_api", "0011_place_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlaceCheckin",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("place_uuid", models.UUIDField()),
+                ("user", models.CharField(max_length=150)),
+                ("points", models.IntegerField()),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PlaceCheckinSummary",
+            fields=[
+                ("place_uuid", models.UUIDField(primary_key=True, serialize=False)),
+                ("count", models.IntegerField()),
+                ("points_sum", models.BigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="UserCheckinSummary",
+            fields=[
+                (
+                    "user",
+                    models.CharField(max_length=150, primary_key=True, serialize=False),
+                ),
+                ("count", models.IntegerField()),
+                ("points_sum", models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -1,11 +1,24 @@
 import uuid as uuid
+from contextlib import contextmanager
 
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db import router
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from taggit.managers import TaggableManager
+from taggit.managers import _TaggableManager
 from taggit.models import GenericUUIDTaggedItemBase
+from taggit.models import Tag
 from taggit.models import TaggedItemBase
 
+from .geo import geohash_encode
+
 
 class UUIDTaggedItem(GenericUUIDTaggedItemBase, TaggedItemBase):
     # This is used so that taggit can work with UUID primary key
@@ -13,18 +26,349 @@ class UUIDTaggedItem(GenericUUIDTaggedItemBase, TaggedItemBase):
     class Meta:
         verbose_name = _("Tag")
         verbose_name_plural = _("Tags")
+        indexes = [
+            # Covers the tag filters and tag counts, which look items up by
+            # tag within the place content type and only need the object ids
+            models.Index(
+                fields=["tag", "content_type", "object_id"],
+                name="tagged_item_tag_object_idx",
+            ),
+            # Loads the tags of a page of places, the content type index taggit
+            # creates alone makes SQLite read the items of every place
+            models.Index(
+                fields=["content_type", "object_id"], name="tagged_item_object_idx"
+            ),
+        ]
+
+
+class PlaceTagManager(_TaggableManager):
+    """
+    Changes the tags of a place in one transaction, with the row of the place
+    locked first, which taggit does not: the tag summaries of `stats.py` move
+    the points it has in the database, which no other write changes until
+    the tags are.
+    """
+
+    @contextmanager
+    def locking(self):
+        using = router.db_for_write(self.through, instance=self.instance)
+        with transaction.atomic(using=using):
+            # Places can be tagged before they are first saved
+            if not self.instance._state.adding:
+                lock_saved_values([self.instance], using)
+            yield
+
+    def add(self, *args, **kwargs):
+        with self.locking():
+            return super().add(*args, **kwargs)
+
+    def remove(self, *args, **kwargs):
+        with self.locking():
+            return super().remove(*args, **kwargs)
+
+    def clear(self, *args, **kwargs):
+        with self.locking():
+            return super().clear(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        with self.locking():
+            return super().set(*args, **kwargs)
 
 
 class Place(models.Model):
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    address = models.CharField(max_length=100, blank=True)
+    address = models.CharField(max_length=100, blank=True, null=True)
     code = models.CharField(max_length=20)
     location_lat = models.DecimalField(max_digits=9, decimal_places=6)
     location_lon = models.DecimalField(max_digits=9, decimal_places=6)
-    name = models.CharField(max_length=50, blank=True)
+    name = models.CharField(max_length=50, blank=True, null=True)
     reward_checkin_points = models.IntegerField()
     type = models.CharField(max_length=50)
-    tags = TaggableManager(through=UUIDTaggedItem, blank=True)
+    tags = TaggableManager(through=UUIDTaggedItem, blank=True, manager=PlaceTagManager)
+    geohash = models.CharField(max_length=12, editable=False, db_index=True)
+    # Incremented whenever the representation of the place changes, including
+    # its tags, it makes the ETag of the place and guards concurrent writes
+    version = models.PositiveIntegerField(default=1, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination over the default (code, uuid) ordering
+            models.Index(fields=["code", "uuid"], name="place_code_uuid_idx"),
+            # Serves ?type= together with the default keyset ordering
+            models.Index(
+                fields=["type", "code", "uuid"], name="place_type_code_uuid_idx"
+            ),
+            # Serves bounding boxes too large for geohash prefixes
+            models.Index(
+                fields=["location_lat", "location_lon"], name="place_lat_lon_idx"
+            ),
+            # Serves the leaderboard, most rewarding places first
+            models.Index(
+                fields=["-reward_checkin_points", "code", "uuid"],
+                name="place_points_code_uuid_idx",
+            ),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Field values as last read from or written to the database, by
+        # attname, which the summaries of `clusters.py` and `stats.py`
+        # subtract when the place changes. Empty for new instances
+        self.saved_values = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.saved_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.update_geohash()
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            self.remember_saved_values()
+            return
+
+        using = kwargs.get("using") or router.db_for_write(Place, instance=self)
+        with transaction.atomic(using=using):
+            # The receivers subtract what the write replaces, not what this
+            # instance was loaded with
+            lock_saved_values([self], using)
+            # Incremented in the database, two concurrent saves must not both
+            # produce the same version from the one they read
+            self.version = models.F("version") + 1
+            super().save(*args, **kwargs)
+            self.refresh_from_db(fields=["version"])
+        self.remember_saved_values()
+
+    def remember_saved_values(self):
+        """
+        Records the field values as saved, after the receivers of the write
+        saw the previous ones. Called by save(), bulk writers must call it
+        themselves.
+        """
+        self.saved_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+        }
+
+    def update_geohash(self):
+        """
+        Keeps the spatial index column in sync with the coordinates.
+        Called by save(), bulk writers must call it themselves.
+        """
+        self.geohash = geohash_encode(
+            float(self.location_lat), float(self.location_lon)
+        )
 
     def __str__(self):
         return f"{self.code} @ '{self.address}', coords: '{self.location_lat}-{self.location_lon}'"
+
+
+class PlaceSearchDocument(models.Model):
+    """
+    Read-only view of the `places_api_place_fts` full-text index, which
+    `search.py` maintains. Filtering on `document` runs an FTS5 MATCH, and
+    `rank` is the bm25 relevance of the match (lower is better).
+    """
+
+    place = models.OneToOneField(
+        Place,
+        primary_key=True,
+        db_column="uuid",
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name="search_document",
+    )
+    # FTS5 exposes a hidden column named after the table, comparing it to a
+    # query is the same as `places_api_place_fts MATCH query`
+    document = models.TextField(db_column="places_api_place_fts")
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "places_api_place_fts"
+
+
+class PlaceChange(models.Model):
+    """
+    A write to a place, its fields, its tags or its deletion, in the change
+    feed `changes.py` keeps. The ids order the feed and are its tokens.
+    """
+
+    place_uuid = models.UUIDField()
+    # Tombstones of deleted places, until compaction prunes them
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Finds the later changes of a place, which supersede its earlier
+            # ones in the feed
+            models.Index(fields=["place_uuid", "id"], name="place_change_place_idx"),
+            models.Index(
+                fields=["deleted", "created_at"], name="place_change_tombstone_idx"
+            ),
+        ]
+
+
+class ChangeFeedCompaction(models.Model):
+    """A compaction of the change feed, which expired the tokens before `horizon`."""
+
+    horizon = models.BigIntegerField()
+    compacted_at = models.DateTimeField(default=timezone.now)
+
+
+class PlaceCluster(models.Model):
+    """
+    The places of a type within a geohash cell, summed up for the map tiles
+    `clusters.py` serves. There is a row for every cell prefix of the places,
+    from one character to `clusters.MAX_PRECISION`.
+    """
+
+    precision = models.PositiveSmallIntegerField()
+    cell = models.CharField(max_length=12)
+    type = models.CharField(max_length=50)
+    count = models.IntegerField()
+    # Sums of the coordinates in millionths of a degree, the precision of the
+    # place columns, so adding and subtracting places is exact
+    lat_sum = models.BigIntegerField()
+    lon_sum = models.BigIntegerField()
+    points_sum = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            # Also serves the cells of a tile, a range of prefixes at a precision
+            models.UniqueConstraint(
+                fields=["precision", "cell", "type"], name="place_cluster_cell_uniq"
+            ),
+        ]
+
+
+class PlaceTagSummary(models.Model):
+    """
+    The places carrying a tag, summed up for the statistics `stats.py` serves.
+    """
+
+    tag = models.OneToOneField(
+        Tag, primary_key=True, on_delete=models.CASCADE, related_name="place_summary"
+    )
+    count = models.IntegerField()
+    points_sum = models.BigIntegerField()
+
+
+class PlaceCheckin(models.Model):
+    """
+    A check-in of a user at a place, which awarded them the check-in points
+    the place had then. `checkins.py` records them in batches, under ids the
+    clients may choose so that retrying or replaying one records it once.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    place_uuid = models.UUIDField()
+    user = models.CharField(max_length=150)
+    points = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    # The summaries below are what is read, no other index slows the inserts
+
+
+class PlaceCheckinSummary(models.Model):
+    """The check-ins of a place, summed up by `checkins.py`."""
+
+    place_uuid = models.UUIDField(primary_key=True)
+    count = models.IntegerField()
+    points_sum = models.BigIntegerField()
+
+
+class UserCheckinSummary(models.Model):
+    """The check-ins of a user and the points they were awarded."""
+
+    user = models.CharField(max_length=150, primary_key=True)
+    count = models.IntegerField()
+    points_sum = models.BigIntegerField()
+
+
+def tag_names(place_uuids):
+    """
+    The names of the tags of each place, loaded with a single query and
+    grouped by place uuid, in the order the tags were added.
+    """
+    names = {place_uuid: [] for place_uuid in place_uuids}
+    rows = UUIDTaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Place),
+        object_id__in=list(names),
+    ).values_list("pk", "object_id", "tag__name")
+    # Sorted here, ordering by the primary key would make SQLite read the
+    # items in its order, those of every place
+    for _, object_id, name in sorted(rows):
+        names[object_id].append(name)
+    return names
+
+
+def tag_ids(place_uuids, using=None):
+    """The ids of the tags of each place, by place uuid, with a single query."""
+    ids = {place_uuid: set() for place_uuid in place_uuids}
+    rows = UUIDTaggedItem.objects.using(using).filter(
+        content_type=ContentType.objects.db_manager(using).get_for_model(Place),
+        object_id__in=list(ids),
+    )
+    for object_id, tag_id in rows.values_list("object_id", "tag_id"):
+        ids[object_id].add(tag_id)
+    return ids
+
+
+def lock_saved_values(places, using=None):
+    """
+    Reads the `saved_values` of places from the database, in the transaction
+    writing them, and locks their rows until it ends: concurrent writes to
+    the same places wait, then read what this one wrote, so the summaries
+    subtract the values each write replaces. SQLite serializes the writers
+    anyway. Places no longer in the database get empty `saved_values`.
+    """
+    # Not the read database the router sends queries to by default
+    using = using or router.db_for_write(Place)
+    attnames = [field.attname for field in Place._meta.concrete_fields]
+    rows = (
+        Place._base_manager.using(using)
+        .select_for_update()
+        .filter(pk__in=[place.pk for place in places])
+        # Locked in the same order by every writer
+        .order_by("pk")
+        .values(*attnames)
+    )
+    saved = {row["uuid"]: row for row in rows}
+    for place in places:
+        place.saved_values = saved.get(place.pk, {})
+
+
+def bump_versions(places):
+    """Marks places whose representation changed without saving them."""
+    return places.update(version=models.F("version") + 1, updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=UUIDTaggedItem)
+def place_tags_changed(sender, instance, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        # Places can be tagged before they are first saved
+        if bump_versions(Place.objects.filter(pk=instance.pk)):
+            instance.refresh_from_db(fields=["version", "updated_at"])
+
+
+@receiver(pre_delete, sender=Place)
+def place_deleting(sender, instance, using, **kwargs):
+    # In the transaction deleting the place, before the receivers of the
+    # summaries, connected after this one, subtract what it is deleted with
+    lock_saved_values([instance], using)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(sender, instance, created=False, **kwargs):
+    # Renaming or deleting a tag changes every place carrying it
+    if not created:
+        bump_versions(
+            Place.objects.filter(
+                uuid__in=UUIDTaggedItem.objects.filter(tag=instance).values("object_id")
+            )
+        )
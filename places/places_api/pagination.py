@@ -0,0 +1,155 @@
+import json
+from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64encode
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on every ordering column instead of the first
+    one only, so pages cost the same regardless of how deep they are.
+
+    The ordering is whatever the filter backends applied to the queryset
+    (e.g. `?ordering=-code` or the distance ordering of `GeoFilter`), with the
+    primary key appended as a tie-breaker. Ordering columns must not be null.
+    """
+
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    default_ordering = ("code",)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        cursor = self.decode_cursor(request)
+        position, reverse = cursor if cursor else (None, False)
+
+        ordering = self.invert(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.seek(ordering, position))
+            except (DjangoValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else position is not None
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = [
+            field for field in queryset.query.order_by if isinstance(field, str)
+        ] or list(self.default_ordering)
+        pk_name = queryset.model._meta.pk.name
+        if not {pk_name, "pk"} & {field.lstrip("-") for field in ordering}:
+            ordering.append(pk_name)
+        return tuple(ordering)
+
+    @staticmethod
+    def invert(ordering):
+        return tuple(
+            field[1:] if field.startswith("-") else f"-{field}" for field in ordering
+        )
+
+    @staticmethod
+    def seek(ordering, position):
+        """
+        Builds the row-value comparison `(a, b, ...) > (x, y, ...)` honouring the
+        direction of each column. The leading bound lets the database range
+        scan an index on the first ordering column.
+        """
+        condition = None
+        for field, value in reversed(list(zip(ordering, position))):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            beyond = Q(**{f"{name}__{lookup}": value})
+            if condition is not None:
+                beyond |= Q(**{name: value}) & condition
+            condition = beyond
+
+        first = ordering[0].lstrip("-")
+        lookup = "lte" if ordering[0].startswith("-") else "gte"
+        return Q(**{f"{first}__{lookup}": position[0]}) & condition
+
+    def get_position(self, instance):
+        return position_of(instance, self.ordering)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            return decode_cursor(encoded, self.ordering)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            encode_cursor(position, reverse, self.ordering),
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+
+def position_of(instance, ordering):
+    """Reads the ordering columns of a model instance or `.values()` row."""
+    position = []
+    for field in ordering:
+        name = field.lstrip("-")
+        value = (
+            instance[name] if isinstance(instance, dict) else getattr(instance, name)
+        )
+        if isinstance(value, (Decimal, UUID)):
+            value = str(value)
+        position.append(value)
+    return position
+
+
+def encode_cursor(position, reverse, ordering):
+    token = {"p": position, "r": int(reverse), "o": ordering}
+    return urlsafe_b64encode(json.dumps(token).encode("ascii")).decode("ascii")
+
+
+def decode_cursor(encoded, ordering):
+    """
+    The (position, reverse) pair of a cursor, raising ValueError if it is
+    malformed or was issued for another ordering.
+    """
+    try:
+        token = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+        position, reverse, token_ordering = token["p"], bool(token["r"]), token["o"]
+    except (TypeError, ValueError, KeyError):
+        raise ValueError("Invalid cursor")
+
+    # A cursor only makes sense for the ordering it was issued for
+    if list(token_ordering) != list(ordering) or len(position) != len(ordering):
+        raise ValueError("Invalid cursor")
+    return position, reverse
@@ -0,0 +1,66 @@
+"""
+Indexes of places on PostgreSQL, and their PostGIS geography column.
+
+Migrations 0007 and 0008 create them on PostgreSQL only, SQLite keeps its
+own FTS5 index and geohash ranges:
+
+- Trigram GIN indexes on the name and address, for the `icontains` lookups
+  `FullTextSearchFilter` falls back to, whatever the position of the words.
+  They index `UPPER(column::text)`, the expression Django compares.
+- The geohash column in the "C" collation, so prefix ranges such as
+  `geohash < 'sx{'` compare characters by code point, as on SQLite, rather
+  than by the linguistic rules of the database's default collation.
+- With PostGIS, a `location` geography column generated from `location_lat`
+  and `location_lon`, so every writer keeps it in sync, and its GiST index,
+  which `GeoFilter` uses for `?near=` queries.
+
+Extensions are created when the server has them and the database user may
+create them, otherwise their indexes are skipped: after installing one,
+rerun the migration with `migrate places_api 0006 && migrate`.
+"""
+from django.db import connections
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from .models import Place
+
+GEOGRAPHY_COLUMN = "location"
+
+_has_geography = {}
+
+
+@receiver(post_migrate)
+def migrated(sender, using, **kwargs):
+    # Migrations 0007 and 0008 add and drop the column
+    _has_geography.clear()
+
+
+def has_geography(using):
+    """Whether the places table has the PostGIS column, checked once."""
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return False
+    key = (using, connection.settings_dict["NAME"])
+    if key not in _has_geography:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_schema = current_schema() "
+                "AND table_name = %s AND column_name = %s",
+                [Place._meta.db_table, GEOGRAPHY_COLUMN],
+            )
+            _has_geography[key] = cursor.fetchone() is not None
+    return _has_geography[key]
+
+
+def within_sql(using, lat, lon, radius_m):
+    """
+    SQL and params of a condition on places within `radius_m` meters of the
+    point, on the spheroid, which the GiST index answers.
+    """
+    table = connections[using].ops.quote_name(Place._meta.db_table)
+    return (
+        f"ST_DWithin({table}.{GEOGRAPHY_COLUMN}, "
+        "ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)",
+        (lon, lat, radius_m),
+    )
@@ -0,0 +1,149 @@
+import json
+import math
+import re
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+from . import metrics
+
+try:
+    import orjson
+except ImportError:  # Optional, installed by the fast-json extra
+    orjson = None
+
+# Floats orjson writes differently from `json`, which uses repr(): those under
+# 1e-4 positionally, e.g. 0.00005 for 5e-05, and exponents without padding or
+# sign, e.g. 1e16 for 1e+16. Output matching it, strings included, is left
+# to `json`: coordinates only match within about 11m of the equator or the
+# prime meridian
+FLOAT_MISMATCH = re.compile(rb"0\.0000|\de")
+LINE_SEPARATORS = [(b"\xe2\x80\xa8", b"\\u2028"), (b"\xe2\x80\xa9", b"\\u2029")]
+
+encode_default = encoders.JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders compact JSON with orjson when it is installed, byte for byte the
+    output of `JSONRenderer`, and with it otherwise, e.g. for indented JSON,
+    floats orjson writes differently and those that are not finite, which
+    `JSONRenderer` refuses.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with metrics.serializing():
+            return self.render_json(data, accepted_media_type, renderer_context)
+
+    def render_json(self, data, accepted_media_type, renderer_context):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson_dumps(data, self.encoder_class().default)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, or objects the encoder rejects,
+            # which json reports the same way
+            content = None
+        if content is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped by JSONRenderer as they end lines in JavaScript
+        for separator, escaped in LINE_SEPARATORS:
+            content = content.replace(separator, escaped)
+        return content
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON. Exports stream their rows themselves, this is
+    used for content negotiation and to render error responses.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return ndjson_line(data).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Comma-separated values. Exports stream their rows themselves, errors are
+    rendered as a single JSON document.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return ndjson_line(data).encode(self.charset)
+
+
+def orjson_dumps(data, default):
+    """
+    Compact JSON of `data` as `json.dumps(data, ensure_ascii=False,
+    allow_nan=False)` writes it, with `default` encoding what json's encoder
+    class would, or None when only json can: for floats orjson writes
+    differently, and those that are not finite, which orjson writes as null
+    where json raises ValueError.
+    """
+    content = orjson.dumps(
+        data,
+        default=default,
+        option=orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_PASSTHROUGH_DATETIME,
+    )
+    if FLOAT_MISMATCH.search(content):
+        return None
+    # Only looked for when there is a null they could have been written as
+    if b"null" in content and has_non_finite_float(data):
+        return None
+    return content
+
+
+def has_non_finite_float(data):
+    pending = [data]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+    return False
+
+
+def ndjson_line(data):
+    if orjson is not None:
+        try:
+            content = orjson_dumps(data, encode_default)
+        except orjson.JSONEncodeError:
+            content = None
+        if content is not None:
+            return content.decode("utf-8") + "\n"
+    return (
+        json.dumps(
+            data,
+            cls=encoders.JSONEncoder,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        )
+        + "\n"
+    )
@@ -0,0 +1,175 @@
+"""
+Read replicas of the SQLite database, which serve the reads of the place
+list and details, `PlaceViewSet.list()` and `retrieve()`, while everything
+else, writes included, goes to the database.
+
+Replicas are snapshots: `take_snapshot()` copies the database with SQLite's
+online backup, which neither waits for the writers nor blocks them, into a
+new file it renames over the replica, and records in it when it started and
+the last change of the change feed it holds, its position. Connections open
+replicas as immutable files, without locking them, and the next request
+reopens them once a new snapshot replaced theirs. `manage.py
+snapshot_database --interval 5` keeps them up to date. Being files, they can
+be copied to the containers that serve the reads, as long as they are
+renamed into place.
+
+A request reads from a replica picked at random among those that are
+- fresh, taken at most `PLACES_REPLICA_MAX_STALENESS` seconds ago, so that
+  they hold every write committed before then, and
+- caught up with the client: the responses to writes set the position of
+  the database in a cookie, and replicas behind it are skipped until it
+  expires, after the staleness bound, when every fresh replica holds them.
+When none is, it reads from the database. Cached responses are kept per
+replica position, as the content of each replica is.
+"""
+import math
+import os
+import random
+import sqlite3
+import time
+from contextlib import closing
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+from django.db.models import Max
+
+from . import routers
+from .backends.sqlite3.base import file_id
+from .models import PlaceChange
+
+COOKIE = "places_position"
+# The table of a snapshot holding its position and when it was taken
+TABLE = "places_snapshot"
+
+# (file_id(), (position, taken at)) of the snapshots read, by path
+_snapshots = {}
+
+
+def replica_aliases():
+    return [
+        alias
+        for alias, settings_dict in settings.DATABASES.items()
+        if settings_dict.get("OPTIONS", {}).get("snapshot")
+    ]
+
+
+def take_snapshot(path, using=DEFAULT_DB_ALIAS):
+    """
+    Copies the database into the replica at `path`, replacing it, and
+    returns the position of the snapshot.
+    """
+    path = os.fspath(path)
+    connection = connections[using]
+    connection.ensure_connection()
+    # Before the copy starts, every write committed by then is in it
+    taken_at = time.time()
+    # Renamed once written, readers never open a partial copy
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with closing(sqlite3.connect(temporary)) as snapshot:
+            connection.connection.backup(snapshot)
+            # A file of its own, without the WAL of the database
+            snapshot.execute("PRAGMA journal_mode = delete")
+            (position,) = snapshot.execute(
+                f"SELECT coalesce(max(id), 0) FROM {PlaceChange._meta.db_table}"
+            ).fetchone()
+            snapshot.execute(f"CREATE TABLE {TABLE} (position integer, taken_at real)")
+            snapshot.execute(f"INSERT INTO {TABLE} VALUES (?, ?)", [position, taken_at])
+            snapshot.commit()
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+    return position
+
+
+def snapshot_state(alias):
+    """
+    The (position, taken at) of the replica, None when it has no snapshot,
+    read once per snapshot.
+    """
+    path = os.fspath(connections[alias].settings_dict["NAME"])
+    snapshot_id = file_id(path)
+    if snapshot_id is None:
+        return None
+    cached = _snapshots.get(path)
+    if cached is not None and cached[0] == snapshot_id:
+        return cached[1]
+    try:
+        with closing(
+            sqlite3.connect(f"file:{quote(path)}?mode=ro&immutable=1", uri=True)
+        ) as snapshot:
+            state = snapshot.execute(
+                f"SELECT position, taken_at FROM {TABLE}"
+            ).fetchone()
+    except sqlite3.DatabaseError:
+        # Not a snapshot, or one being replaced
+        state = None
+    _snapshots[path] = (snapshot_id, state)
+    return state
+
+
+def client_position(request):
+    """The position of the last write of the client that it has to read."""
+    try:
+        return int(request.COOKIES.get(COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+def choose(request):
+    """
+    The (alias, position) of the replica the request reads from, None for
+    the database. Chosen once per request.
+    """
+    request = getattr(request, "_request", request)
+    if not hasattr(request, "places_replica"):
+        max_staleness = settings.PLACES_REPLICA_MAX_STALENESS
+        oldest = -math.inf if max_staleness is None else time.time() - max_staleness
+        position = client_position(request)
+        fresh = []
+        for alias in replica_aliases():
+            state = snapshot_state(alias)
+            if state is not None and state[0] >= position and state[1] >= oldest:
+                fresh.append((alias, state[0]))
+        request.places_replica = random.choice(fresh) if fresh else None
+    return request.places_replica
+
+
+def source(request):
+    """What the request reads from, part of the keys of cached responses."""
+    replica = choose(request)
+    return "db" if replica is None else f"snapshot{replica[1]}"
+
+
+@contextmanager
+def reading(request):
+    """Sends the reads of the request to its replica, if it has one."""
+    replica = choose(request)
+    alias = None if replica is None else replica[0]
+    # Connections are only reopened between the reads of requests, which
+    # never leave a cursor open across them
+    if alias is not None and connections[alias].snapshot_replaced():
+        connections[alias].close()
+    with routers.reading_from(alias):
+        yield
+
+
+def remember_writes(request, response):
+    """Has the client read the replicas holding its writes, once they wrote."""
+    if not replica_aliases() or response.status_code >= 400:
+        return
+    position = PlaceChange.objects.using(DEFAULT_DB_ALIAS).aggregate(
+        position=Max("id")
+    )["position"]
+    max_age = settings.PLACES_REPLICA_MAX_STALENESS
+    response.set_cookie(
+        COOKIE,
+        str(position or 0),
+        max_age=math.ceil(max_age) if max_age is not None else None,
+        httponly=True,
+        samesite="Lax",
+    )
@@ -0,0 +1,55 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+
+READ_DB_ALIAS = "read"
+
+_replica = contextvars.ContextVar("places_replica", default=None)
+
+
+@contextmanager
+def reading_from(alias):
+    """Sends the reads `ReadWriteRouter` routes to the `alias` replica, if any."""
+    token = _replica.set(alias)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReadWriteRouter:
+    """
+    Sends reads to the `read` database, read-only connections to the same
+    SQLite file, and writes to the default one.
+
+    Reads inside a transaction stay on the default database, to see the
+    transaction's own writes, and under the row lock it may hold. Those of
+    the place list and details go to the read replica chosen for the
+    request, see places_api/replicas.py.
+    """
+
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replica = _replica.get()
+        if replica is not None:
+            return replica
+        if READ_DB_ALIAS not in settings.DATABASES:
+            return DEFAULT_DB_ALIAS
+        return READ_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Places read from the `read` database are saved to the default one
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == READ_DB_ALIAS:
+            return False
+        # Replicas are snapshots of the migrated database
+        return not connections[db].settings_dict["OPTIONS"].get("snapshot")
@@ -0,0 +1,147 @@
+"""
+The test runner, which creates the test databases from templates of the
+migrated schema instead of migrating new ones at every run.
+
+A template is migrated by the first run after the migrations change, and
+named after a digest of them: the SQLite ones are files of
+`PLACES_TEST_TEMPLATE_DIR`, copied into the in-memory test database when it
+is opened, the PostgreSQL ones databases next to the test database, which it
+is created from. The migrate command then finds every migration applied.
+`manage.py test --no-template` migrates as Django does.
+"""
+import hashlib
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.migrations.loader import MigrationLoader
+from django.test.runner import DiscoverRunner
+
+
+def migrations_digest(connection):
+    """A digest of the migration files of the installed apps."""
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    digest = hashlib.sha256(f"{django.__version__} {connection.vendor}".encode())
+    for key, migration in sorted(loader.disk_migrations.items()):
+        digest.update(f"{key}\n".encode())
+        digest.update(Path(sys.modules[migration.__module__].__file__).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+class TestRunner(DiscoverRunner):
+    def __init__(self, *args, template=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.template = template
+        # SQLite templates to copy into the test databases, by alias
+        self.restores = {}
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--no-template",
+            action="store_false",
+            dest="template",
+            help="Migrates the test databases instead of copying a template.",
+        )
+
+    def setup_databases(self, **kwargs):
+        if not self.template or self.keepdb:
+            return super().setup_databases(**kwargs)
+
+        saves = {}
+        for alias in kwargs["aliases"]:
+            connection = connections[alias]
+            if connection.settings_dict["TEST"]["MIRROR"]:
+                continue
+            if connection.vendor == "sqlite":
+                creation = connection.creation
+                if not creation.is_in_memory_db(creation._get_test_db_name()):
+                    continue
+                path = self.sqlite_template(connection)
+                if path.exists():
+                    self.restores[alias] = path
+                else:
+                    saves[alias] = path
+            elif connection.vendor == "postgresql":
+                self.postgresql_template(connection)
+
+        connection_created.connect(self.restore)
+        try:
+            old_config = super().setup_databases(**kwargs)
+        finally:
+            connection_created.disconnect(self.restore)
+        for alias, path in saves.items():
+            self.save_sqlite_template(connections[alias], path)
+        return old_config
+
+    def sqlite_template(self, connection):
+        """The template file of the digest, deleting those of others."""
+        directory = Path(settings.PLACES_TEST_TEMPLATE_DIR)
+        path = directory / f"{connection.alias}-{migrations_digest(connection)}.sqlite3"
+        for other in directory.glob(f"{connection.alias}-*.sqlite3"):
+            if other != path:
+                other.unlink(missing_ok=True)
+        return path
+
+    def restore(self, sender, connection, **kwargs):
+        path = self.restores.pop(connection.alias, None)
+        if path is None:
+            return
+        if self.verbosity >= 1:
+            self.log(f"Copying the test database template {path}...")
+        with closing(sqlite3.connect(path)) as template:
+            template.backup(connection.connection)
+
+    def save_sqlite_template(self, connection, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Renamed once written, another run never reads a partial copy
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        connection.ensure_connection()
+        with closing(sqlite3.connect(temporary)) as template:
+            connection.connection.backup(template)
+        os.replace(temporary, path)
+
+    def postgresql_template(self, connection):
+        """
+        Has the test database created from the template database of the
+        digest, migrating it first if it does not exist, and drops those of
+        other digests.
+        """
+        creation = connection.creation
+        test_name = creation._get_test_db_name()
+        template = f"{test_name}_template_{migrations_digest(connection)}"
+        with connection._nodb_cursor() as cursor:
+            cursor.execute(
+                "SELECT datname FROM pg_database WHERE datname LIKE %s",
+                [f"{test_name}\\_template\\_%"],
+            )
+            existing = {name for name, in cursor.fetchall()}
+            for name in existing - {template}:
+                cursor.execute(f"DROP DATABASE {connection.ops.quote_name(name)}")
+
+        test_settings = connection.settings_dict["TEST"]
+        if template not in existing:
+            if self.verbosity >= 1:
+                self.log(f"Migrating the test database template {template}...")
+            old_name, old_test_name = (
+                connection.settings_dict["NAME"],
+                test_settings["NAME"],
+            )
+            test_settings["NAME"] = template
+            try:
+                creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            finally:
+                # The test database is created from the template once every
+                # connection to it is closed
+                connection.close()
+                settings.DATABASES[connection.alias]["NAME"] = old_name
+                connection.settings_dict["NAME"] = old_name
+                test_settings["NAME"] = old_test_name
+        test_settings["TEMPLATE"] = template
@@ -0,0 +1,258 @@
+"""
+Full-text search over places, backed by an SQLite FTS5 table.
+
+`places_api_place_fts` holds one document per place with its name, address,
+type and tag names. The receivers below keep it in sync with `Place` and its
+tags, and `rebuild()` recreates it from scratch. On other databases the index
+is absent and `FullTextSearchFilter` falls back to `icontains` lookups.
+"""
+import re
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from taggit.models import Tag
+
+from .models import Place
+from .models import UUIDTaggedItem
+from .signals import places_bulk_changed
+
+TABLE = "places_api_place_fts"
+COLUMNS = ["name", "address", "type", "tags"]
+# bm25() weights for (uuid, name, address, type, tags)
+WEIGHTS = "bm25(0.0, 10.0, 2.0, 4.0, 4.0)"
+MAX_TERMS = 10
+CHUNK_SIZE = 1000
+
+CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE {TABLE} USING fts5("
+    f"uuid UNINDEXED, {', '.join(COLUMNS)}, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+)
+
+
+def is_available(using):
+    return connections[using].vendor == "sqlite"
+
+
+def search_words(terms):
+    return re.findall(r"\w+", terms)[:MAX_TERMS]
+
+
+def match_query(terms):
+    """
+    Turns free text into an FTS5 query that matches places containing every
+    word, each one as a prefix, so that "blu caf" finds "Blue Café".
+    """
+    return " ".join(f'"{word}"*' for word in search_words(terms))
+
+
+def search_rowid(place_uuid):
+    """
+    FTS5 rows are addressed by an integer rowid, derived here from the uuid
+    so updates and deletes are point lookups instead of scans of the table.
+    """
+    return place_uuid.int & (2**63 - 1)
+
+
+def search_rowid_sql(column):
+    """
+    `search_rowid()` in SQL, of a uuid column holding 32 hex digits as Django
+    stores uuids on SQLite: the last 16 digits, the first one cut to 3 bits.
+    """
+    digits = [
+        f"(INSTR('0123456789abcdef', SUBSTR({column}, {position}, 1)) - 1)"
+        for position in range(17, 33)
+    ]
+    sql = f"({digits[0]} & 7)"
+    for digit in digits[1:]:
+        sql = f"({sql} * 16 + {digit})"
+    return sql
+
+
+def count_matches(terms, limit, using):
+    """The number of places matching the search, counted up to `limit`."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM (SELECT rowid FROM {TABLE} "
+            f"WHERE {TABLE} MATCH %s LIMIT %s)",
+            [match_query(terms), limit],
+        )
+        return cursor.fetchone()[0]
+
+
+def match_condition(terms, using):
+    """
+    A condition on places matching the search, checked place by place: the
+    rowids of the matches are read from the index once, without their
+    documents, and looked up with the rowid of each place. For queries that
+    read the places in the order of another index and stop after a page,
+    when the matches are too many to read and sort them all.
+    """
+    quote_name = connections[using].ops.quote_name
+    column = f"{quote_name(Place._meta.db_table)}.{quote_name('uuid')}"
+    return RawSQL(
+        f"{search_rowid_sql(column)} IN "
+        f"(SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s)",
+        [match_query(terms)],
+        output_field=BooleanField(),
+    )
+
+
+def create_index(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        cursor.execute(
+            f"INSERT INTO {TABLE} ({TABLE}, rank) VALUES ('rank', %s)", [WEIGHTS]
+        )
+
+
+def index_places(places, using=None):
+    """Writes the search documents of the places, replacing existing ones."""
+    index_rows(
+        [(place.uuid, place.name, place.address, place.type) for place in places],
+        using,
+    )
+
+
+def index_rows(rows, using=None, replace=True):
+    """
+    Writes search documents from (uuid, name, address, type) rows. Without
+    `replace` the places must not be indexed yet, which saves a delete each.
+    """
+    using = using or router.db_for_write(Place)
+    if not rows or not is_available(using):
+        return
+
+    # Tags are read back from the database rather than from the instances,
+    # whose prefetched tags may predate the change being indexed
+    tags = tag_names([row[0] for row in rows], using)
+    documents = [
+        (
+            search_rowid(place_uuid),
+            place_uuid.hex,
+            name or "",
+            address or "",
+            place_type,
+            " ".join(tags.get(place_uuid, [])),
+        )
+        for place_uuid, name, address, place_type in rows
+    ]
+    with connections[using].cursor() as cursor:
+        if replace:
+            cursor.executemany(
+                f"DELETE FROM {TABLE} WHERE rowid = %s",
+                [(document[0],) for document in documents],
+            )
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, uuid, {', '.join(COLUMNS)}) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            documents,
+        )
+
+
+def unindex_places(uuids, using=None):
+    using = using or router.db_for_write(Place)
+    if not uuids or not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {TABLE} WHERE rowid = %s",
+            [(search_rowid(place_uuid),) for place_uuid in uuids],
+        )
+
+
+def reindex_uuids(uuids, using=None):
+    index_places(list(Place.objects.using(using).filter(uuid__in=list(uuids))), using)
+
+
+def tag_names(uuids, using):
+    names = {}
+    rows = UUIDTaggedItem.objects.using(using).filter(
+        content_type=ContentType.objects.db_manager(using).get_for_model(Place),
+        object_id__in=uuids,
+    )
+    for object_id, name in rows.values_list("object_id", "tag__name"):
+        names.setdefault(object_id, []).append(name)
+    return names
+
+
+def rebuild(using=None, chunk_size=CHUNK_SIZE):
+    """
+    Recreates the whole index and returns the number of indexed places.
+    Runs in one transaction, FTS5 writes a new segment on every commit and
+    committing per chunk makes the rebuild an order of magnitude slower.
+    """
+    using = using or router.db_for_write(Place)
+    if not is_available(using):
+        return 0
+
+    indexed = 0
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE}")
+        rows = (
+            Place.objects.using(using)
+            .values_list("uuid", "name", "address", "type")
+            .iterator(chunk_size=chunk_size)
+        )
+        while chunk := list(islice(rows, chunk_size)):
+            index_rows(chunk, using, replace=False)
+            indexed += len(chunk)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+@receiver(post_save, sender=Place)
+def place_saved(sender, instance, using, **kwargs):
+    index_places([instance], using)
+
+
+@receiver(post_delete, sender=Place)
+def place_deleted(sender, instance, using, **kwargs):
+    unindex_places([instance.uuid], using)
+
+
+@receiver(m2m_changed, sender=UUIDTaggedItem)
+def place_tags_changed(sender, instance, action, using, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        index_places([instance], using)
+
+
+@receiver(places_bulk_changed, sender=Place)
+def places_bulk_saved(sender, created, updated, **kwargs):
+    index_places(created + updated)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, using, **kwargs):
+    if not created:
+        reindex_uuids(tagged_uuids(instance, using), using)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, using, **kwargs):
+    instance._tagged_place_uuids = tagged_uuids(instance, using)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, using, **kwargs):
+    reindex_uuids(getattr(instance, "_tagged_place_uuids", []), using)
+
+
+def tagged_uuids(tag, using):
+    return list(
+        UUIDTaggedItem.objects.using(using)
+        .filter(tag=tag)
+        .values_list("object_id", flat=True)
+    )
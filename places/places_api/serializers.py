@@ -1,13 +1,46 @@
+from django.db.backends.utils import format_number
 from rest_framework import serializers
+from taggit.models import Tag
 from taggit.serializers import TagListSerializerField
 from taggit.serializers import TaggitSerializer
 
+from . import metrics
 from .models import Place
+from .models import PlaceCheckin
+from .models import tag_names
+
+# Columns place_representations() reads
+PLACE_VALUES = [
+    "uuid",
+    "address",
+    "code",
+    "location_lat",
+    "location_lon",
+    "name",
+    "reward_checkin_points",
+    "type",
+]
+
+
+class CoordinateField(serializers.FloatField):
+    """
+    The coordinate as stored, rounded to the decimal places of `Place` as
+    the database rounds those received, so that the responses to writes show
+    the floats the reads, through `place_representations()`, do.
+    """
+
+    def to_representation(self, value):
+        field = Place._meta.get_field(self.source)
+        return float(
+            format_number(
+                field.to_python(value), field.max_digits, field.decimal_places
+            )
+        )
 
 
 class LocationSerializer(serializers.Serializer):
-    lat = serializers.FloatField(source="location_lat")
-    lon = serializers.FloatField(source="location_lon")
+    lat = CoordinateField(source="location_lat")
+    lon = CoordinateField(source="location_lon")
 
 
 class PlaceSerializer(TaggitSerializer, serializers.ModelSerializer):
@@ -29,3 +62,74 @@ class PlaceSerializer(TaggitSerializer, serializers.ModelSerializer):
             "tags",
             "type",
         ]
+
+    def to_representation(self, instance):
+        with metrics.serializing():
+            return super().to_representation(instance)
+
+
+class CheckinSerializer(serializers.Serializer):
+    """
+    Validates check-ins, `checkin_representation()` represents them without
+    building the fields of a model serializer for each.
+    """
+
+    # Chosen by clients that retry, a check-in with the same id counts once
+    id = serializers.UUIDField(required=False)
+    user = serializers.CharField(
+        max_length=PlaceCheckin._meta.get_field("user").max_length
+    )
+
+
+def place_values(queryset):
+    """
+    Reads the places of `queryset` as the rows `place_representations()`
+    takes, with the annotations the filters may order them by.
+    """
+    return queryset.prefetch_related(None).values(
+        *PLACE_VALUES, *queryset.query.annotation_select
+    )
+
+
+def place_representations(rows):
+    """
+    Builds what `PlaceSerializer` represents the places of `place_values()`
+    rows as, for the read paths: plain dicts, the same once rendered, without
+    going through every field of the serializer for each place.
+    """
+    tags = tag_names({row["uuid"] for row in rows})
+    with metrics.serializing():
+        return [
+            {
+                "uuid": str(row["uuid"]),
+                "address": row["address"],
+                "code": row["code"],
+                "location": {
+                    "lat": float(row["location_lat"]),
+                    "lon": float(row["location_lon"]),
+                },
+                "name": row["name"],
+                "reward_checkin_points": row["reward_checkin_points"],
+                "tags": tags[row["uuid"]],
+                "type": row["type"],
+            }
+            for row in rows
+        ]
+
+
+class TagCountSerializer(serializers.ModelSerializer):
+    count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Tag
+        fields = ["name", "slug", "count"]
+
+
+def checkin_representation(checkin):
+    return {
+        "id": str(checkin.id),
+        "place": str(checkin.place_uuid),
+        "user": checkin.user,
+        "points": checkin.points,
+        "created_at": checkin.created_at,
+    }
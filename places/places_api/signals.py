@@ -0,0 +1,13 @@
+from django.dispatch import Signal
+
+# Sent by the writers in `bulk.py`, which bypass the per-instance `post_save`
+# and `m2m_changed` signals, once their transaction has written a batch.
+# Arguments: `created` and `updated`, lists of Place instances whose fields
+# and tags may both have changed. Updated places carry the ids of their
+# previous tags in `replaced_tag_ids`, None if their tags were kept. Deletions
+# still send `post_delete`.
+places_bulk_changed = Signal()
+
+# Sent by `changes.record()` once it appended changes to the feed, in the
+# transaction writing them. Arguments: `using`, the database alias.
+place_changes_recorded = Signal()
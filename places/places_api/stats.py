@@ -0,0 +1,242 @@
+"""
+Aggregate statistics of places, read from summary tables.
+
+The statistics per type sum up the one-character cells of the map clusters,
+which `clusters.py` keeps, and those per tag read `PlaceTagSummary`: the
+number of places carrying each tag and the sum of their check-in points. The
+receivers below keep it in step with the places and their tags, so both cost
+a query over a row per group, whatever the number of places. They move the
+points a place has in the database, which its writes, tag changes included
+through `PlaceTagManager`, read with its row locked in their transaction.
+`rebuild()` recomputes the tag summaries from the tagged places, for writes
+that bypass the signals.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.db.models import Subquery
+from django.db.models import Sum
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .bulk import add_to_summaries
+from .models import Place
+from .models import PlaceCluster
+from .models import PlaceTagSummary
+from .models import UUIDTaggedItem
+from .models import tag_ids
+from .serializers import place_representations
+from .serializers import place_values
+from .signals import places_bulk_changed
+
+COLUMNS = ["tag_id", "count", "points_sum"]
+LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
+LEADERBOARD_ORDER = ["-reward_checkin_points", "code", "uuid"]
+LEADERBOARD_SCAN = 1000
+
+
+def points_stats(count, total):
+    return {"total": total, "average": round(total / count, 2)}
+
+
+def type_stats():
+    """The number of places and their check-in points per type, most first."""
+    rows = (
+        PlaceCluster.objects.filter(precision=1)
+        .values("type")
+        .annotate(places=Sum("count"), points=Sum("points_sum"))
+        .filter(places__gt=0)
+        .order_by("-places", "type")
+    )
+    return [
+        {
+            "type": row["type"],
+            "count": row["places"],
+            "reward_checkin_points": points_stats(row["places"], row["points"]),
+        }
+        for row in rows
+    ]
+
+
+def tag_stats(limit=None):
+    """
+    The number of places and their check-in points per tag, most first, of
+    the `limit` most common tags if given.
+    """
+    rows = (
+        PlaceTagSummary.objects.filter(count__gt=0)
+        .order_by("-count", "tag__name")
+        .values_list("tag__name", "tag__slug", "count", "points_sum")
+    )[:limit]
+    return [
+        {
+            "name": name,
+            "slug": slug,
+            "count": count,
+            "reward_checkin_points": points_stats(count, points),
+        }
+        for name, slug, count, points in rows
+    ]
+
+
+def type_count(place_type):
+    """The number of places of a type."""
+    places = PlaceCluster.objects.filter(precision=1, type=place_type).aggregate(
+        places=Sum("count")
+    )["places"]
+    return places or 0
+
+
+def tag_count(slug):
+    """The number of places carrying the tag with that slug."""
+    return (
+        PlaceTagSummary.objects.filter(tag__slug=slug)
+        .values_list("count", flat=True)
+        .first()
+        or 0
+    )
+
+
+def leaderboard(queryset, limit=LEADERBOARD_SIZE):
+    """
+    The most rewarding places of `queryset`, ties by code. They are looked for
+    among the `LEADERBOARD_SCAN` most rewarding places first, read along the
+    (-reward_checkin_points, code, uuid) index: in areas holding many places
+    that finds them without sorting every place of the area, the databases
+    pick the index of the area instead. Smaller areas fall back to sorting
+    theirs.
+    """
+    top = Place.objects.order_by(*LEADERBOARD_ORDER).values("pk")[:LEADERBOARD_SCAN]
+    rows = list(
+        place_values(
+            queryset.filter(pk__in=Subquery(top)).order_by(*LEADERBOARD_ORDER)
+        )[:limit]
+    )
+    if len(rows) < limit:
+        rows = list(place_values(queryset.order_by(*LEADERBOARD_ORDER))[:limit])
+    return place_representations(rows)
+
+
+def tag_deltas(changes):
+    """
+    The changes of the tag summaries, by tag id, for (tag ids, points) pairs
+    of places before and after a write, None for creations and deletions.
+    """
+    deltas = {}
+    for old, new in changes:
+        if old == new:
+            continue
+        for sign, values in ((-1, old), (1, new)):
+            if values is None:
+                continue
+            tags, points = values
+            for tag_id in tags:
+                delta = deltas.setdefault((tag_id,), [0, 0])
+                delta[0] += sign
+                delta[1] += sign * points
+    return deltas
+
+
+def apply(deltas, using=None):
+    add_to_summaries(PlaceTagSummary, COLUMNS, deltas, using)
+
+
+def saved_points(place):
+    """The check-in points the place has in the database."""
+    return place.saved_values.get("reward_checkin_points", place.reward_checkin_points)
+
+
+def rebuild(using=None):
+    """
+    Recomputes the tag summaries from the tagged places, in one transaction,
+    and returns the number of tags summed up.
+    """
+    using = using or router.db_for_write(PlaceTagSummary)
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    place_meta, item_meta = Place._meta, UUIDTaggedItem._meta
+    table = quote_name(PlaceTagSummary._meta.db_table)
+    columns = ", ".join(quote_name(column) for column in COLUMNS)
+    place_table, item_table = (
+        quote_name(place_meta.db_table),
+        quote_name(item_meta.db_table),
+    )
+    uuid, points = (
+        quote_name(place_meta.get_field(field).column)
+        for field in ("uuid", "reward_checkin_points")
+    )
+    tag, object_id, content_type = (
+        quote_name(item_meta.get_field(field).column)
+        for field in ("tag", "object_id", "content_type")
+    )
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) "
+            f"SELECT {item_table}.{tag}, COUNT(*), SUM({place_table}.{points}) "
+            f"FROM {item_table} JOIN {place_table} "
+            f"ON {place_table}.{uuid} = {item_table}.{object_id} "
+            f"WHERE {item_table}.{content_type} = %s "
+            f"GROUP BY {item_table}.{tag}",
+            [ContentType.objects.db_manager(using).get_for_model(Place).pk],
+        )
+        return cursor.rowcount
+
+
+@receiver(post_save, sender=Place)
+def place_saved(sender, instance, created, using, **kwargs):
+    points = instance.reward_checkin_points
+    if created:
+        # Places can be tagged before they are first saved
+        tags = tag_ids([instance.uuid], using)[instance.uuid]
+        apply(tag_deltas([(None, (tags, points))]), using)
+    elif saved_points(instance) != points:
+        tags = tag_ids([instance.uuid], using)[instance.uuid]
+        apply(tag_deltas([((tags, saved_points(instance)), (tags, points))]), using)
+
+
+@receiver(pre_delete, sender=Place)
+def place_deleting(sender, instance, using, **kwargs):
+    # In the transaction deleting the place, while its tagged items still exist
+    tags = tag_ids([instance.uuid], using)[instance.uuid]
+    apply(tag_deltas([((tags, saved_points(instance)), None)]), using)
+
+
+@receiver(m2m_changed, sender=UUIDTaggedItem)
+def place_tags_changed(sender, instance, action, pk_set, using, **kwargs):
+    # Tags of unsaved places are summed up once they are saved
+    if instance._state.adding:
+        return
+    points = saved_points(instance)
+    if action == "pre_clear":
+        instance._cleared_tag_ids = tag_ids([instance.uuid], using)[instance.uuid]
+    elif action == "post_clear":
+        tags = getattr(instance, "_cleared_tag_ids", set())
+        apply(tag_deltas([((tags, points), None)]), using)
+    elif action == "post_add":
+        apply(tag_deltas([(None, (pk_set, points))]), using)
+    elif action == "post_remove":
+        apply(tag_deltas([((pk_set, points), None)]), using)
+
+
+@receiver(places_bulk_changed, sender=Place)
+def places_bulk_saved(sender, created, updated, **kwargs):
+    tags = tag_ids([place.uuid for place in created + updated])
+    changes = [
+        (None, (tags[place.uuid], place.reward_checkin_points)) for place in created
+    ]
+    for place in updated:
+        old_tags = getattr(place, "replaced_tag_ids", None)
+        if old_tags is None:
+            old_tags = tags[place.uuid]
+        changes.append(
+            (
+                (old_tags, saved_points(place)),
+                (tags[place.uuid], place.reward_checkin_points),
+            )
+        )
+    apply(tag_deltas(changes))
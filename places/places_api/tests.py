@@ -1,10 +1,99 @@
+import ast
+import asyncio
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
 import uuid
+from base64 import urlsafe_b64encode
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
+from urllib.parse import parse_qsl
 
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.checks import run_checks
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db import OperationalError
+from django.db import connection
+from django.db import connections
+from django.db import router
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.db.utils import load_backend
+from django.test import Client
+from django.test import RequestFactory
+from django.test import SimpleTestCase
+from django.test import TestCase as DjangoTestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.translation import gettext_lazy
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from taggit.models import Tag
 
+from . import async_views
+from . import benchmarking
+from . import bulk
+from . import caching
+from . import checkins
+from . import clusters
+from . import events
+from . import handlers
+from . import metrics
+from . import postgres
+from . import replicas
+from . import search
+from . import stats
+from .admin import PlaceAdmin
+from .backends.sqlite3.base import write_lock
+from .checks import check_migrations
+from .geo import geohash_cover
+from .geo import geohash_encode
+from .geo import point_tile
+from .geo import tile_bbox
+from .management.commands import bench_startup
+from .management.commands import copy_from_sqlite
+from .management.commands import import_places
+from .management.commands import migrate
 from .models import Place
+from .models import PlaceChange
+from .models import PlaceCheckin
+from .models import PlaceCheckinSummary
+from .models import PlaceCluster
+from .models import PlaceTagSummary
+from .models import UUIDTaggedItem
+from .models import UserCheckinSummary
+from .pagination import encode_cursor
+from .renderers import FastJSONRenderer
+from .renderers import ndjson_line
+from .routers import READ_DB_ALIAS
+from .serializers import PlaceSerializer
+from .serializers import place_representations
+from .serializers import place_values
+from .signals import places_bulk_changed
+
+
+class TestCase(DjangoTestCase):
+    def setUp(self):
+        super().setUp()
+        # Cached responses outlive the data the previous test rolled back
+        caching.get_cache().clear()
+        caching.get_versions_cache().clear()
 
 
 class TestPlaceModel(TestCase):
@@ -81,7 +170,7 @@ class TestPlaceGetAll(TestCase):
 
     def test_get_all_places(self):
         response = self.client.get(reverse("place-list"))
-        res_body = response.json()
+        res_body = response.json()["results"]
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res_body), len(self.sample_codes))
@@ -90,7 +179,7 @@ class TestPlaceGetAll(TestCase):
         response = self.client.get(
             reverse("place-list") + f"?search={self.sample_addresses[0]}"
         )
-        res_body = response.json()
+        res_body = response.json()["results"]
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res_body), 1)
@@ -98,7 +187,7 @@ class TestPlaceGetAll(TestCase):
 
     def test_get_all_places_reverse_order_on_code(self):
         response = self.client.get(reverse("place-list") + f"?ordering=-code")
-        res_body = response.json()
+        res_body = response.json()["results"]
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res_body), 3)
@@ -307,3 +396,3138 @@ class TestPlaceDelete(TestCase):
     def test_delete_place_non_existing_uuid(self):
         response = self.client.delete(reverse("place-detail", args=[uuid.uuid4()]))
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestPlaceGeoQueries(TestCase):
+    # Distances from Syntagma square: 0m, ~0.9km, ~1.4km and ~310km
+    sample_places = {
+        "syntagma": (37.975500, 23.734800),
+        "acropolis": (37.971500, 23.725700),
+        "lycabettus": (37.983800, 23.746500),
+        "thessaloniki": (40.640100, 22.944400),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        for code, (lat, lon) in cls.sample_places.items():
+            Place(
+                code=code,
+                address="sample_address",
+                location_lat=lat,
+                location_lon=lon,
+                name="sample_name",
+                reward_checkin_points=1,
+                type="office",
+            ).save()
+
+    def get_codes(self, **params):
+        response = self.client.get(reverse("place-list"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item["code"] for item in response.json()["results"]]
+
+    def test_geohash_kept_in_sync(self):
+        place = Place.objects.get(code="syntagma")
+        self.assertEqual(place.geohash, geohash_encode(37.9755, 23.7348))
+
+        place.location_lat = 40.6401
+        place.location_lon = 22.9444
+        place.save()
+        self.assertEqual(
+            Place.objects.get(code="syntagma").geohash,
+            Place.objects.get(code="thessaloniki").geohash,
+        )
+
+    def test_near_sorted_by_distance(self):
+        codes = self.get_codes(near="37.9755,23.7348", radius_m=3000)
+        self.assertEqual(codes, ["syntagma", "acropolis", "lycabettus"])
+
+    def test_near_default_radius(self):
+        codes = self.get_codes(near="37.9755,23.7348")
+        self.assertEqual(codes, ["syntagma", "acropolis"])
+
+    def test_near_ordering_overridden(self):
+        codes = self.get_codes(near="37.9755,23.7348", radius_m=3000, ordering="-code")
+        self.assertEqual(codes, ["syntagma", "lycabettus", "acropolis"])
+
+    def test_bbox(self):
+        codes = self.get_codes(bbox="23.72,37.97,23.74,37.98")
+        self.assertEqual(sorted(codes), ["acropolis", "syntagma"])
+
+    def test_near_within_bbox(self):
+        codes = self.get_codes(
+            near="37.9755,23.7348", radius_m=3000, bbox="23.73,37.97,23.75,37.99"
+        )
+        self.assertEqual(codes, ["syntagma", "lycabettus"])
+
+    def test_invalid_parameters(self):
+        for params in [
+            {"near": "37.9755"},
+            {"near": "abc,def"},
+            {"near": "95,23"},
+            {"near": "37.9755,23.7348", "radius_m": "-1"},
+            {"bbox": "23.74,37.97,23.72,37.98"},
+        ]:
+            response = self.client.get(reverse("place-list"), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_geohash_cover_contains_points(self):
+        for lat, lon in self.sample_places.values():
+            cells = geohash_cover(lat - 0.01, lon - 0.01, lat + 0.01, lon + 0.01)
+            self.assertTrue(cells)
+            self.assertTrue(
+                any(geohash_encode(lat, lon).startswith(cell) for cell in cells)
+            )
+
+
+class TestPlacePagination(TestCase):
+    # Duplicate codes exercise the uuid tie-breaker
+    sample_codes = ["A", "B", "B", "B", "C", "D", "E"]
+
+    @classmethod
+    def setUpTestData(cls):
+        for code in cls.sample_codes:
+            Place(
+                code=code,
+                address="sample_address",
+                location_lat=1.23,
+                location_lon=2.34,
+                name="sample_name",
+                reward_checkin_points=1,
+                type="office",
+            ).save()
+
+    def walk(self, url, link="next"):
+        items = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            res_body = response.json()
+            self.assertLessEqual(len(res_body["results"]), 2)
+            items.extend(res_body["results"])
+            url = res_body[link]
+        return items
+
+    def test_pages_cover_all_places_once(self):
+        items = self.walk(reverse("place-list") + "?page_size=2")
+
+        self.assertEqual([item["code"] for item in items], self.sample_codes)
+        self.assertEqual(len({item["uuid"] for item in items}), len(items))
+
+    def test_pages_follow_ordering(self):
+        items = self.walk(reverse("place-list") + "?page_size=2&ordering=-code")
+
+        self.assertEqual(
+            [item["code"] for item in items], sorted(self.sample_codes, reverse=True)
+        )
+
+    def test_previous_link(self):
+        forward = self.walk(reverse("place-list") + "?page_size=2")
+
+        response = self.client.get(reverse("place-list") + "?page_size=2")
+        url = response.json()["next"]
+        while url:
+            last = self.client.get(url).json()
+            url = last["next"]
+        backward = self.walk(last["previous"], link="previous")
+
+        self.assertEqual(len(backward), len(forward) - len(last["results"]))
+        self.assertCountEqual(
+            [item["uuid"] for item in backward],
+            [item["uuid"] for item in forward[: len(backward)]],
+        )
+
+    def test_first_page_has_no_previous(self):
+        res_body = self.client.get(reverse("place-list") + "?page_size=2").json()
+
+        self.assertIsNone(res_body["previous"])
+        self.assertIsNotNone(res_body["next"])
+
+    def test_cursor_with_search(self):
+        Place(
+            code="F",
+            address="patra",
+            location_lat=1.23,
+            location_lon=2.34,
+            name="sample_name",
+            reward_checkin_points=1,
+            type="office",
+        ).save()
+        items = self.walk(reverse("place-list") + "?page_size=2&search=sample")
+
+        self.assertEqual([item["code"] for item in items], self.sample_codes)
+
+    def test_invalid_cursor(self):
+        tampered = urlsafe_b64encode(
+            json.dumps(
+                {"p": ["A", "not-a-uuid"], "r": 0, "o": ["code", "uuid"]}
+            ).encode()
+        ).decode()
+        for cursor in ["garbage", "eyJwIjogWzFdfQ==", tampered]:
+            response = self.client.get(reverse("place-list") + f"?cursor={cursor}")
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_rejected_for_other_ordering(self):
+        next_url = self.client.get(reverse("place-list") + "?page_size=2").json()[
+            "next"
+        ]
+        response = self.client.get(next_url + "&ordering=-code")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestPlaceTagQueries(TestCase):
+    @staticmethod
+    def store_places(count, tags_per_place):
+        for i in range(count):
+            p = Place(
+                code=f"code_{i}",
+                address="sample_address",
+                location_lat=1.23,
+                location_lon=2.34,
+                name="sample_name",
+                reward_checkin_points=1,
+                type="office",
+            )
+            p.save()
+            p.tags.add(*[f"tag_{i}_{j}" for j in range(tags_per_place)])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_list_queries_constant(self):
+        self.store_places(2, 1)
+        small = self.count_queries(reverse("place-list"))
+        self.store_places(10, 5)
+        large = self.count_queries(reverse("place-list"))
+
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 2)
+
+    def test_retrieve_queries(self):
+        self.store_places(1, 5)
+        place = Place.objects.get()
+        self.assertLessEqual(
+            self.count_queries(reverse("place-detail", args=[place.uuid])), 2
+        )
+
+    def test_admin_changelist_queries_constant(self):
+        user = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(user)
+        url = reverse("admin:places_api_place_changelist")
+
+        self.store_places(2, 1)
+        small = self.count_queries(url)
+        self.store_places(10, 5)
+        large = self.count_queries(url)
+
+        self.assertEqual(small, large)
+
+
+class TestPlaceBulk(TestCase):
+    @staticmethod
+    def create_place_data(code, tags=None):
+        data = {
+            "address": "Voutadon 29-23, Athina 118 54",
+            "code": code,
+            "location": {"lat": 37.978693, "lon": 23.712884},
+            "name": "HQ",
+            "reward_checkin_points": 1,
+            "type": "office",
+        }
+        if tags is not None:
+            data["tags"] = tags
+        return data
+
+    def post_bulk(self, body):
+        return self.client.post(
+            reverse("place-bulk"), body, content_type="application/json"
+        )
+
+    def test_bulk_url(self):
+        self.assertEqual(reverse("place-bulk"), "/api/place/bulk")
+
+    def test_bulk_create(self):
+        places = [
+            self.create_place_data(f"code_{i}", tags=["popular", f"tag_{i}"])
+            for i in range(20)
+        ]
+        response = self.post_bulk({"create": places})
+        res_body = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res_body["create"]), 20)
+        self.assertTrue(
+            all(
+                item["status"] == status.HTTP_201_CREATED for item in res_body["create"]
+            )
+        )
+        self.assertEqual(Place.objects.count(), 20)
+
+        place = Place.objects.get(uuid=res_body["create"][3]["uuid"])
+        self.assertEqual(place.code, "code_3")
+        self.assertEqual(place.geohash, geohash_encode(37.978693, 23.712884))
+        self.assertCountEqual(place.tags.names(), ["popular", "tag_3"])
+        self.assertEqual(Place.objects.filter(tags__name="popular").count(), 20)
+
+    def test_bulk_create_reports_item_errors(self):
+        invalid = self.create_place_data("very loooooooooooooong code")
+        response = self.post_bulk(
+            {"create": [self.create_place_data("A"), invalid, "garbage"]}
+        )
+        results = response.json()["create"]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(results[0]["status"], status.HTTP_201_CREATED)
+        self.assertEqual(results[1]["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertIn("code", results[1]["errors"])
+        self.assertEqual(results[2]["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Place.objects.count(), 1)
+
+    def test_bulk_update(self):
+        created = self.post_bulk(
+            {"create": [self.create_place_data("A", tags=["old"])] * 2}
+        ).json()["create"]
+
+        renamed = dict(
+            self.create_place_data("B", tags=["new"]), uuid=created[0]["uuid"]
+        )
+        untagged = dict(self.create_place_data("C"), uuid=created[1]["uuid"])
+        missing = dict(self.create_place_data("D"), uuid=str(uuid.uuid4()))
+        response = self.post_bulk({"update": [renamed, untagged, missing, {}]})
+        results = response.json()["update"]
+
+        self.assertEqual(
+            [item["status"] for item in results],
+            [
+                status.HTTP_200_OK,
+                status.HTTP_200_OK,
+                status.HTTP_404_NOT_FOUND,
+                status.HTTP_400_BAD_REQUEST,
+            ],
+        )
+        first = Place.objects.get(uuid=created[0]["uuid"])
+        self.assertEqual(first.code, "B")
+        self.assertEqual(list(first.tags.names()), ["new"])
+        second = Place.objects.get(uuid=created[1]["uuid"])
+        self.assertEqual(second.code, "C")
+        self.assertEqual(list(second.tags.names()), ["old"])
+
+    def test_bulk_update_reports_uuid_and_field_errors(self):
+        invalid = dict(
+            self.create_place_data("very loooooooooooooong code"), uuid="garbage"
+        )
+        response = self.post_bulk({"update": [invalid, "garbage"]})
+        results = response.json()["update"]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(results[0]["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(results[0]["errors"]), {"code", "uuid"})
+        self.assertEqual(results[1]["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(results[1]["errors"]), {"non_field_errors", "uuid"})
+
+    def test_bulk_delete(self):
+        created = self.post_bulk(
+            {"create": [self.create_place_data("A", tags=["old"])] * 2}
+        ).json()["create"]
+
+        response = self.post_bulk(
+            {"delete": [created[0]["uuid"], str(uuid.uuid4()), "garbage"]}
+        )
+        results = response.json()["delete"]
+
+        self.assertEqual(
+            [item["status"] for item in results],
+            [
+                status.HTTP_204_NO_CONTENT,
+                status.HTTP_404_NOT_FOUND,
+                status.HTTP_400_BAD_REQUEST,
+            ],
+        )
+        self.assertEqual(Place.objects.count(), 1)
+        self.assertEqual(UUIDTaggedItem.objects.count(), 1)
+
+    def test_bulk_delete_reports_chunk_errors(self):
+        created = self.post_bulk({"create": [self.create_place_data("A")]}).json()
+        place_uuid = created["create"][0]["uuid"]
+
+        with patch(
+            "places_api.bulk.delete_places", side_effect=OperationalError("locked")
+        ):
+            response = self.post_bulk(
+                {"create": [self.create_place_data("B")], "delete": [place_uuid]}
+            )
+        body = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The creates committed before the deletes failed
+        self.assertEqual(body["create"][0]["status"], status.HTTP_201_CREATED)
+        self.assertEqual(
+            body["delete"],
+            [
+                {
+                    "uuid": place_uuid,
+                    "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    "errors": {"non_field_errors": ["locked"]},
+                }
+            ],
+        )
+        self.assertEqual(Place.objects.count(), 2)
+
+    def test_bulk_queries_not_per_item(self):
+        def count_queries(count):
+            places = [
+                self.create_place_data(f"code_{i}", tags=[f"tag_{i}"])
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                self.post_bulk({"create": places})
+            return len(queries)
+
+        self.assertLess(count_queries(200), 20)
+
+    def test_bulk_sends_signal(self):
+        received = []
+
+        def receiver(sender, created, updated, **kwargs):
+            received.append((len(created), len(updated)))
+
+        places_bulk_changed.connect(receiver)
+        self.addCleanup(places_bulk_changed.disconnect, receiver)
+        self.post_bulk({"create": [self.create_place_data("A")] * 3})
+
+        self.assertEqual(received, [(3, 0)])
+
+    def test_bulk_bad_request(self):
+        for body in [[], {"create": {}}]:
+            response = self.post_bulk(body)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestPlaceExport(TestCase):
+    sample_codes = ["A", "B", "C"]
+    sample_addresses = ["athens", "patra", "naxos"]
+
+    @classmethod
+    def setUpTestData(cls):
+        for code, address in zip(cls.sample_codes, cls.sample_addresses):
+            p = Place(
+                code=code,
+                address=address,
+                location_lat=1.23,
+                location_lon=2.34,
+                name="sample_name",
+                reward_checkin_points=1,
+                type="office",
+            )
+            p.save()
+            p.tags.add("sample_tag_1", "sample_tag_2")
+
+    def export(self, query=""):
+        response = self.client.get(reverse("place-export") + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_export_url(self):
+        self.assertEqual(reverse("place-export"), "/api/place/export")
+
+    def test_export_ndjson(self):
+        response, content = self.export()
+        rows = [json.loads(line) for line in content.splitlines()]
+
+        self.assertEqual(
+            response["Content-Type"], "application/x-ndjson; charset=utf-8"
+        )
+        self.assertEqual([row["code"] for row in rows], self.sample_codes)
+        detail = self.client.get(reverse("place-detail", args=[rows[0]["uuid"]]))
+        expected = detail.json()
+        for row in (rows[0], expected):
+            row["tags"].sort()
+        self.assertEqual(rows[0], expected)
+
+    def test_export_csv(self):
+        response, content = self.export("?format=csv")
+        rows = list(csv.DictReader(io.StringIO(content)))
+
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual([row["code"] for row in rows], self.sample_codes)
+        self.assertEqual(rows[0]["address"], "athens")
+        self.assertEqual(float(rows[0]["location_lat"]), 1.23)
+        self.assertCountEqual(
+            rows[0]["tags"].split(","), ["sample_tag_1", "sample_tag_2"]
+        )
+
+    def test_export_honours_search_and_ordering(self):
+        _, content = self.export("?ordering=-code")
+        codes = [json.loads(line)["code"] for line in content.splitlines()]
+        self.assertEqual(codes, list(reversed(self.sample_codes)))
+
+        _, content = self.export("?search=patra")
+        codes = [json.loads(line)["code"] for line in content.splitlines()]
+        self.assertEqual(codes, ["B"])
+
+    def test_export_batches_tags_per_chunk(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.export()
+        self.assertEqual(len(queries), 2)
+
+    def test_export_bad_request(self):
+        response = self.client.get(reverse("place-export") + "?near=garbage")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestPlaceExportASGI(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        for code in ["A", "B"]:
+            Place.objects.create(
+                code=code,
+                location_lat=1.23,
+                location_lon=2.34,
+                reward_checkin_points=1,
+                type="office",
+            )
+
+    async def request(self, application, path, query=""):
+        """The status and body the application answers a GET with."""
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": query.encode(),
+            "headers": [(b"host", b"testserver")],
+        }
+        received = asyncio.Queue()
+        await received.put({"type": "http.request", "body": b""})
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await application(scope, received.get, send)
+        self.assertFalse(sent[-1].get("more_body", False))
+        return sent[0]["status"], b"".join(m.get("body", b"") for m in sent[1:])
+
+    async def test_streams_from_the_orm_thread(self):
+        status_code, body = await self.request(
+            handlers.ASGIHandler(), reverse("place-export"), "format=csv"
+        )
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([row["code"] for row in rows], ["A", "B"])
+
+    async def test_project_application_streams_exports(self):
+        from places.asgi import application
+
+        status_code, body = await self.request(application, reverse("place-export"))
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([row["code"] for row in rows], ["A", "B"])
+
+
+class TestImportPlacesCommand(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    @staticmethod
+    def place_data(code, name="HQ"):
+        return {
+            "address": "Voutadon 29-23, Athina 118 54",
+            "code": code,
+            "location": {"lat": 37.978693, "lon": 23.712884},
+            "name": name,
+            "reward_checkin_points": 1,
+            "tags": ["popular", f"tag_{code}"],
+            "type": "office",
+        }
+
+    def run_import(self, path, **options):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("import_places", path, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_ndjson(self):
+        lines = [json.dumps(self.place_data(f"code_{i}")) for i in range(5)]
+        stdout, _ = self.run_import(self.write_file("places.ndjson", "\n".join(lines)))
+
+        self.assertIn("5 created", stdout)
+        self.assertIn("rows/s", stdout)
+        place = Place.objects.get(code="code_3")
+        self.assertCountEqual(place.tags.names(), ["popular", "tag_code_3"])
+        self.assertEqual(place.geohash, geohash_encode(37.978693, 23.712884))
+
+    def test_import_csv_round_trip(self):
+        self.run_import(
+            self.write_file(
+                "places.ndjson",
+                "\n".join(json.dumps(self.place_data(f"code_{i}")) for i in range(3)),
+            )
+        )
+        response = self.client.get(reverse("place-export") + "?format=csv")
+        exported = b"".join(response.streaming_content).decode()
+        Place.objects.all().delete()
+
+        stdout, _ = self.run_import(self.write_file("places.csv", exported))
+
+        self.assertIn("3 created", stdout)
+        place = Place.objects.get(code="code_1")
+        self.assertEqual(place.name, "HQ")
+        self.assertCountEqual(place.tags.names(), ["popular", "tag_code_1"])
+
+    def test_import_geojson(self):
+        features = []
+        for i in range(50):
+            data = self.place_data(f"code_{i}")
+            location = data.pop("location")
+            features.append(
+                {
+                    "type": "Feature",
+                    "geometry": {
+                        "type": "Point",
+                        "coordinates": [location["lon"], location["lat"]],
+                    },
+                    "properties": data,
+                }
+            )
+        path = self.write_file(
+            "places.geojson",
+            json.dumps({"type": "FeatureCollection", "features": features}, indent=2),
+        )
+
+        with open(path) as f:
+            self.assertEqual(
+                len(list(import_places.read_geojson(f, buffer_size=64))), 50
+            )
+
+        stdout, _ = self.run_import(path)
+        self.assertIn("50 created", stdout)
+        self.assertEqual(
+            float(Place.objects.get(code="code_7").location_lon), 23.712884
+        )
+
+    def test_import_upserts_on_code(self):
+        Place(
+            code="code_0",
+            address="old",
+            location_lat=1.23,
+            location_lon=2.34,
+            name="old",
+            reward_checkin_points=1,
+            type="office",
+        ).save()
+        lines = [
+            json.dumps(self.place_data("code_0", name="first")),
+            json.dumps(self.place_data("code_1")),
+            json.dumps(self.place_data("code_0", name="second")),
+        ]
+        stdout, _ = self.run_import(self.write_file("places.ndjson", "\n".join(lines)))
+
+        self.assertIn("1 created, 1 updated", stdout)
+        self.assertEqual(Place.objects.count(), 2)
+        self.assertEqual(Place.objects.get(code="code_0").name, "second")
+
+    def test_import_reports_invalid_records(self):
+        lines = [
+            json.dumps(self.place_data("code_0")),
+            json.dumps(self.place_data("very loooooooooooooong code")),
+            "{not json",
+        ]
+        stdout, stderr = self.run_import(
+            self.write_file("places.ndjson", "\n".join(lines))
+        )
+
+        self.assertIn("1 created, 0 updated, 2 invalid", stdout)
+        self.assertIn("Record 2", stderr)
+        self.assertIn("Record 3", stderr)
+
+    def test_import_resumes_from_checkpoint(self):
+        lines = [json.dumps(self.place_data(f"code_{i}")) for i in range(10)]
+        path = self.write_file("places.ndjson", "\n".join(lines))
+        checkpoint = os.path.join(self.directory, "import.checkpoint")
+        with open(checkpoint, "w") as f:
+            json.dump(
+                {
+                    "source": os.path.abspath(path),
+                    "progress": {
+                        "records": 6,
+                        "created": 6,
+                        "updated": 0,
+                        "invalid": 0,
+                    },
+                },
+                f,
+            )
+
+        stdout, _ = self.run_import(path, checkpoint=checkpoint, batch_size=3)
+
+        self.assertIn("Resuming after 6 records", stdout)
+        self.assertEqual(
+            sorted(Place.objects.values_list("code", flat=True)),
+            [f"code_{i}" for i in range(6, 10)],
+        )
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)["progress"]["records"], 10)
+
+    def test_import_with_workers(self):
+        lines = [json.dumps(self.place_data(f"code_{i}")) for i in range(25)]
+        stdout, _ = self.run_import(
+            self.write_file("places.ndjson", "\n".join(lines)), workers=2, batch_size=4
+        )
+
+        self.assertIn("25 created", stdout)
+        self.assertEqual(Place.objects.count(), 25)
+
+
+class TestPlaceFullTextSearch(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.places = {}
+        for code, name, address, place_type, tags in [
+            ("A", "Blue Café", "Ermou 10", "cafe", ["coffee"]),
+            ("B", "Acropolis Museum", "Dionysiou Areopagitou 15", "museum", []),
+            ("C", "Green Park", "Blue street 3", "park", ["outdoors"]),
+            ("D", "Harbour Office", "Akti 1", "office", ["blue"]),
+        ]:
+            p = Place(
+                code=code,
+                address=address,
+                location_lat=1.23,
+                location_lon=2.34,
+                name=name,
+                reward_checkin_points=1,
+                type=place_type,
+            )
+            p.save()
+            p.tags.add(*tags)
+            cls.places[code] = p
+
+    def search(self, params):
+        response = self.client.get(reverse("place-list"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [place["code"] for place in response.json()["results"]]
+
+    def test_search_ranks_name_matches_first(self):
+        codes = self.search({"q": "blue"})
+        self.assertEqual(codes[0], "A")
+        self.assertCountEqual(codes, ["A", "C", "D"])
+
+    def test_search_prefixes_and_diacritics(self):
+        self.assertEqual(self.search({"q": "acro mus"}), ["B"])
+        self.assertEqual(self.search({"q": "cafe"}), ["A"])
+        self.assertEqual(self.search({"q": "CAF ermou"}), ["A"])
+        self.assertEqual(self.search({"q": "outdoors"}), ["C"])
+        self.assertEqual(self.search({"q": "museum blue"}), [])
+
+    def test_search_ignores_query_syntax(self):
+        self.assertEqual(self.search({"q": 'blue" OR "museum'}), [])
+        self.assertEqual(self.search({"q": "NEAR(*) -"}), [])
+        self.assertEqual(len(self.search({"q": "  "})), 4)
+
+    def test_search_follows_changes(self):
+        place = self.places["B"]
+        place.name = "Old Museum"
+        place.save()
+        place.tags.add("history")
+        self.assertEqual(self.search({"q": "old"}), ["B"])
+        self.assertEqual(self.search({"q": "history"}), ["B"])
+        self.assertEqual(self.search({"q": "acropolis"}), [])
+
+        place.tags.clear()
+        self.assertEqual(self.search({"q": "history"}), [])
+
+        self.client.delete(reverse("place-detail", args=[place.uuid]))
+        self.assertEqual(self.search({"q": "museum"}), [])
+
+    def test_search_follows_tag_renames(self):
+        tag = self.places["C"].tags.get()
+        tag.name = "greenery"
+        tag.save()
+        self.assertEqual(self.search({"q": "greenery"}), ["C"])
+        tag.delete()
+        self.assertEqual(self.search({"q": "greenery"}), [])
+
+    def test_search_follows_bulk_writes(self):
+        data = {
+            "code": "E",
+            "location": {"lat": 1.23, "lon": 2.34},
+            "name": "Lighthouse",
+            "reward_checkin_points": 1,
+            "type": "landmark",
+            "tags": ["sea"],
+        }
+        update = dict(data, code="A", uuid=str(self.places["A"].uuid), name="Quay")
+        response = self.client.post(
+            reverse("place-bulk"),
+            {"create": [data], "update": [update]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.search({"q": "light sea"}), ["E"])
+        self.assertEqual(self.search({"q": "quay sea"}), ["A"])
+        self.assertEqual(self.search({"q": "coffee"}), [])
+
+    def test_search_pages_by_relevance(self):
+        codes = []
+        url = reverse("place-list") + "?q=blue&page_size=1"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            codes += [place["code"] for place in response.json()["results"]]
+            url = response.json()["next"]
+        self.assertEqual(codes, self.search({"q": "blue"}))
+
+    def test_search_combines_with_filters(self):
+        self.assertEqual(
+            self.search({"q": "blue", "ordering": "-code"}), ["D", "C", "A"]
+        )
+        self.assertEqual(self.search({"q": "blue", "search": "ermou"}), ["A"])
+        self.assertEqual(self.search({"search": "blue street"}), ["C"])
+
+    @skipUnless(connection.vendor == "sqlite", "The FTS5 index needs SQLite")
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM places_api_place_fts")
+        self.assertEqual(self.search({"q": "blue"}), [])
+
+        out = io.StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("Indexed 4 places", out.getvalue())
+        self.assertCountEqual(self.search({"q": "blue"}), ["A", "C", "D"])
+
+
+class TestPlaceTagFilters(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for code, place_type, tags in [
+            ("A", "cafe", ["wifi", "vegan"]),
+            ("B", "cafe", ["wifi"]),
+            ("C", "bar", ["wifi", "vegan", "terrace"]),
+            ("D", "office", []),
+        ]:
+            p = Place(
+                code=code,
+                address="athens",
+                location_lat=1.23,
+                location_lon=2.34,
+                name="sample_name",
+                reward_checkin_points=1,
+                type=place_type,
+            )
+            p.save()
+            p.tags.add(*tags)
+
+    def list_codes(self, params):
+        response = self.client.get(reverse("place-list"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [place["code"] for place in response.json()["results"]]
+
+    def test_filter_by_all_tags(self):
+        self.assertEqual(self.list_codes({"tags": "wifi"}), ["A", "B", "C"])
+        self.assertEqual(self.list_codes({"tags": "wifi,vegan"}), ["A", "C"])
+        self.assertEqual(self.list_codes({"tags": "vegan,terrace,wifi"}), ["C"])
+        self.assertEqual(self.list_codes({"tags": "wifi,missing"}), [])
+
+    def test_filter_by_any_tag(self):
+        params = {"tags": "terrace,vegan", "tags_match": "any"}
+        self.assertEqual(self.list_codes(params), ["A", "C"])
+        params = {"tags": "missing,wifi", "tags_match": "any"}
+        self.assertEqual(self.list_codes(params), ["A", "B", "C"])
+
+    def test_filter_by_type(self):
+        self.assertEqual(self.list_codes({"type": "cafe"}), ["A", "B"])
+        self.assertEqual(self.list_codes({"type": "bar,office"}), ["C", "D"])
+        self.assertEqual(self.list_codes({"type": "cafe", "tags": "vegan"}), ["A"])
+
+    def test_filters_run_in_the_list_query(self):
+        ContentType.objects.get_for_model(Place)
+        with CaptureQueriesContext(connection) as queries:
+            self.list_codes({"type": "cafe,bar", "tags": "wifi,vegan"})
+        # The filtered page and the tags of its places
+        self.assertEqual(len(queries), 2)
+
+    def test_filter_bad_request(self):
+        response = self.client.get(
+            reverse("place-list"), {"tags": "wifi", "tags_match": "some"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tags_url(self):
+        self.assertEqual(reverse("tag-list"), "/api/tags")
+
+    def test_tag_counts(self):
+        Tag.objects.create(name="unused")
+        ContentType.objects.get_for_model(Place)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("tag-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            response.json(),
+            [
+                {"name": "wifi", "slug": "wifi", "count": 3},
+                {"name": "vegan", "slug": "vegan", "count": 2},
+                {"name": "terrace", "slug": "terrace", "count": 1},
+            ],
+        )
+
+
+class TestPlaceResponseCache(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.places = []
+        for code in ["A", "B"]:
+            p = Place(
+                code=code,
+                address="athens",
+                location_lat=1.23,
+                location_lon=2.34,
+                name="sample_name",
+                reward_checkin_points=1,
+                type="office",
+            )
+            p.save()
+            p.tags.add("sample_tag")
+            cls.places.append(p)
+
+    def get(self, url, expected_cache, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-Cache"], expected_cache)
+        return response.json()
+
+    def detail_url(self, place):
+        return reverse("place-detail", args=[place.uuid])
+
+    def test_list_and_detail_are_cached(self):
+        stats = self.client.get(reverse("cache-stats")).json()
+        first = self.get(reverse("place-list"), "MISS")
+        self.assertEqual(self.get(reverse("place-list"), "HIT"), first)
+        self.get(reverse("place-list"), "MISS", ordering="-code")
+        self.get(self.detail_url(self.places[0]), "MISS")
+        self.get(self.detail_url(self.places[0]), "HIT")
+
+        after = self.client.get(reverse("cache-stats")).json()
+        self.assertEqual(after["hits"] - stats["hits"], 2)
+        self.assertEqual(after["misses"] - stats["misses"], 3)
+
+    def test_writes_invalidate_precisely(self):
+        a, b = self.places
+        self.get(reverse("place-list"), "MISS")
+        self.get(self.detail_url(a), "MISS")
+        self.get(self.detail_url(b), "MISS")
+
+        a.name = "renamed"
+        a.save()
+        self.assertEqual(self.get(self.detail_url(a), "MISS")["name"], "renamed")
+        self.get(self.detail_url(b), "HIT")
+        results = self.get(reverse("place-list"), "MISS")["results"]
+        self.assertEqual(results[0]["name"], "renamed")
+
+        b.tags.add("new_tag")
+        detail = self.get(self.detail_url(b), "MISS")
+        self.assertCountEqual(detail["tags"], ["sample_tag", "new_tag"])
+        self.get(self.detail_url(a), "HIT")
+
+    def test_destroy_invalidates(self):
+        a, _ = self.places
+        self.get(reverse("place-list"), "MISS")
+        self.get(self.detail_url(a), "MISS")
+
+        response = self.client.delete(self.detail_url(a))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.detail_url(a))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        results = self.get(reverse("place-list"), "MISS")["results"]
+        self.assertEqual([place["code"] for place in results], ["B"])
+
+    def test_bulk_and_tag_renames_invalidate(self):
+        a, b = self.places
+        self.get(reverse("place-list"), "MISS")
+        self.get(self.detail_url(b), "MISS")
+        update = self.get(self.detail_url(a), "MISS")
+        update["name"] = "bulk_renamed"
+        self.client.post(
+            reverse("place-bulk"), {"update": [update]}, content_type="application/json"
+        )
+        self.assertEqual(self.get(self.detail_url(a), "MISS")["name"], "bulk_renamed")
+        self.get(self.detail_url(b), "HIT")
+
+        tag = Tag.objects.get(name="sample_tag")
+        tag.name = "renamed_tag"
+        tag.save()
+        self.assertEqual(self.get(self.detail_url(b), "MISS")["tags"], ["renamed_tag"])
+
+    def test_detail_uuid_case_shares_the_version(self):
+        a, _ = self.places
+        url = reverse("place-detail", args=[str(a.uuid).upper()])
+        self.get(url, "MISS")
+        self.get(url, "HIT")
+        a.name = "renamed"
+        a.save()
+        self.assertEqual(self.get(url, "MISS")["name"], "renamed")
+
+    def test_versions_are_bumped_again_on_commit(self):
+        key = caching.place_version_key(self.places[0].uuid)
+        before = caching.get_versions([key])[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.places[0].save()
+            during = caching.get_versions([key])[0]
+        after = caching.get_versions([key])[0]
+        self.assertLess(before, during)
+        self.assertLess(during, after)
+
+    def test_only_json_is_cached(self):
+        response = self.client.get(reverse("place-list"), {"format": "api"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("X-Cache", response)
+
+
+class TestPlaceConditionalRequests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.place = Place(
+            code="A",
+            address="athens",
+            location_lat=1.23,
+            location_lon=2.34,
+            name="sample_name",
+            reward_checkin_points=1,
+            type="office",
+        )
+        cls.place.save()
+        cls.place.tags.add("sample_tag")
+
+    def detail_url(self):
+        return reverse("place-detail", args=[self.place.uuid])
+
+    def get_etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response["ETag"]
+
+    def put(self, **headers):
+        data = self.client.get(self.detail_url()).json()
+        data["name"] = "renamed"
+        return self.client.put(
+            self.detail_url(), data, content_type="application/json", **headers
+        )
+
+    def test_detail_if_none_match(self):
+        etag = self.get_etag(self.detail_url())
+        self.assertEqual(etag, f'"{Place.objects.get().version}"')
+
+        for cached in (False, True):
+            response = self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(response.content, b"")
+            caching.get_cache().clear()
+
+        response = self.client.get(
+            self.detail_url(), HTTP_IF_NONE_MATCH=f'W/{etag}, "0"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cached_detail_not_modified_without_queries(self):
+        etag = self.get_etag(self.detail_url())
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_follows_changes(self):
+        etags = [self.get_etag(self.detail_url())]
+        self.place.tags.add("new_tag")
+        etags.append(self.get_etag(self.detail_url()))
+        tag = Tag.objects.get(name="new_tag")
+        tag.name = "renamed_tag"
+        tag.save()
+        etags.append(self.get_etag(self.detail_url()))
+        response = self.put()
+        etags.append(response["ETag"])
+        self.assertEqual(etags[-1], self.get_etag(self.detail_url()))
+
+        self.assertEqual(len(set(etags)), len(etags))
+        response = self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_update_changes_etag(self):
+        etag = self.get_etag(self.detail_url())
+        data = self.client.get(self.detail_url()).json()
+        self.client.post(
+            reverse("place-bulk"), {"update": [data]}, content_type="application/json"
+        )
+        self.assertNotEqual(self.get_etag(self.detail_url()), etag)
+
+    def test_list_if_none_match(self):
+        url = reverse("place-list")
+        etag = self.get_etag(url)
+        self.assertEqual(self.get_etag(url), etag)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.get_etag(url + "?ordering=-code"), etag)
+
+        self.put()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_if_match_rejects_stale_writes(self):
+        etag = self.get_etag(self.detail_url())
+
+        response = self.put(HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # A second client still holding the old ETag
+        response = self.put(HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.patch(
+            self.detail_url(),
+            {"name": "patched"},
+            content_type="application/json",
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.delete(self.detail_url(), HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Place.objects.get().name, "renamed")
+
+    def test_if_match_allows_current_writes(self):
+        etag = self.get_etag(self.detail_url())
+        response = self.put(HTTP_IF_MATCH=f'"0", {etag}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.put(HTTP_IF_MATCH=f"W/{response['ETag']}")
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        response = self.client.delete(self.detail_url(), HTTP_IF_MATCH="*")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Place.objects.exists())
+
+
+class TestAsyncPlaceReads(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.places = []
+        for i in (1, 257):
+            place = Place(
+                uuid=uuid.UUID(int=i),
+                code=f"code_{i}",
+                address="athens",
+                location_lat=1.23,
+                location_lon=2.34,
+                name=f"name_{i}",
+                reward_checkin_points=1,
+                type="office",
+            )
+            place.save()
+            place.tags.add("sample_tag")
+            cls.places.append(place)
+
+    def detail_url(self, place):
+        return reverse("place-detail", args=[place.uuid])
+
+    async def test_detail_matches_the_viewset(self):
+        url = self.detail_url(self.places[0])
+        viewset_response = await sync_to_async(async_views.viewset_detail)(
+            RequestFactory().get(url), pk=str(self.places[0].uuid)
+        )
+        viewset_response.render()
+        caching.get_cache().clear()
+
+        response = await self.async_client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response["Vary"], "Accept")
+        self.assertEqual(response.content, viewset_response.content)
+        self.assertEqual(response["ETag"], viewset_response["ETag"])
+
+        response = await self.async_client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.content, viewset_response.content)
+
+    async def test_caches_read_off_the_event_loop(self):
+        on_event_loop = []
+
+        def blocking(function):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    pass
+                else:
+                    on_event_loop.append(function.__name__)
+                return function(*args, **kwargs)
+
+            return wrapper
+
+        with patch.object(
+            caching, "get_cache", blocking(caching.get_cache)
+        ), patch.object(
+            caching, "get_versions_cache", blocking(caching.get_versions_cache)
+        ), patch.object(
+            replicas, "snapshot_state", blocking(replicas.snapshot_state)
+        ):
+            for url in (reverse("place-list"), self.detail_url(self.places[0])):
+                await self.async_client.get(url)
+                response = await self.async_client.get(url)
+                self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(on_event_loop, [])
+
+    async def test_list_hits(self):
+        url = reverse("place-list")
+        response = await self.async_client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        response = await self.async_client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_other_requests_reach_the_viewset(self):
+        url = self.detail_url(self.places[0])
+        response = self.client.get(url, HTTP_ACCEPT="text/html")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("text/html", response["Content-Type"])
+        response = self.client.get(url, {"type": "cafe"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse("place-detail", args=[uuid.UUID(int=3)]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse("place-export"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.patch(
+            url, {"name": "patched"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["name"], "patched")
+
+    def test_writes_leave_other_places_cached(self):
+        first, second = self.places
+        for place in self.places:
+            self.client.get(self.detail_url(place))
+        first.name = "renamed"
+        first.save()
+        self.assertEqual(self.client.get(self.detail_url(first))["X-Cache"], "MISS")
+        self.assertEqual(self.client.get(self.detail_url(second))["X-Cache"], "HIT")
+
+
+class TestBenchmarkSuite(TestCase):
+    @staticmethod
+    def results(**scenarios):
+        return {
+            "scale": "10k",
+            "scenarios": {
+                name: {"p50_ms": p50, "p95_ms": p95, "queries": queries}
+                for name, (p50, p95, queries) in scenarios.items()
+            },
+        }
+
+    def test_regressions(self):
+        baseline = self.results(list=(10, 20, 2), retrieve=(5, 8, 2))
+        self.assertEqual(
+            benchmarking.regressions(
+                self.results(
+                    list=(12.9, 25.9, 2), retrieve=(4, 6, 2), create=(9, 9, 9)
+                ),
+                baseline,
+                0.3,
+            ),
+            [],
+        )
+        self.assertEqual(
+            benchmarking.regressions(
+                self.results(list=(13.1, 20, 2), retrieve=(5, 8, 3)), baseline, 0.3
+            ),
+            ["list: p50_ms 10.00 -> 13.10", "retrieve: queries 2.00 -> 3.00"],
+        )
+
+    def test_baseline_of_another_scale(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump(self.results(list=(10, 20, 2)), f)
+            f.flush()
+            with self.assertRaisesMessage(CommandError, "10k scale"):
+                call_command("bench_api", "--scale", "100k", "--baseline", f.name)
+
+    def test_generated_data_is_reproducible(self):
+        runs = []
+        for _ in range(2):
+            Place.objects.all().delete()
+            benchmarking.generate_places(50)
+            benchmarking.generate_tags()
+            runs.append(
+                sorted(
+                    (str(place.uuid), place.name, sorted(place.tags.names()))
+                    for place in Place.objects.all()
+                )
+            )
+        self.assertEqual(runs[0], runs[1])
+        self.assertEqual(len(runs[0]), 50)
+        self.assertTrue(any(tags for _, _, tags in runs[0]))
+
+
+class TestSQLiteBackend(TestCase):
+    @staticmethod
+    def connect(**options):
+        database = {
+            "ENGINE": "places_api.backends.sqlite3",
+            "NAME": ":memory:",
+            "OPTIONS": options,
+        }
+        settings_dict = connections.configure_settings({DEFAULT_DB_ALIAS: database})
+        wrapper = load_backend(database["ENGINE"]).DatabaseWrapper(
+            settings_dict[DEFAULT_DB_ALIAS], "sqlite_backend_test"
+        )
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        wrapper = self.connect(pragmas={"cache_size": -1000})
+        self.addCleanup(wrapper.close)
+        self.assertEqual(self.pragma(wrapper, "busy_timeout"), 5000)
+        self.assertEqual(self.pragma(wrapper, "synchronous"), 1)
+        self.assertEqual(self.pragma(wrapper, "cache_size"), -1000)
+        self.assertEqual(self.pragma(wrapper, "query_only"), 0)
+
+    def test_read_only_connections_refuse_writes(self):
+        wrapper = self.connect(read_only=True)
+        self.addCleanup(wrapper.close)
+        with self.assertRaisesMessage(OperationalError, "readonly"):
+            with wrapper.cursor() as cursor:
+                cursor.execute("CREATE TABLE places_api_test (id integer)")
+
+    def test_write_transactions_take_the_write_lock(self):
+        wrapper = self.connect()
+        self.addCleanup(wrapper.close)
+        lock = write_lock(":memory:")
+        wrapper._start_transaction_under_autocommit()
+        self.assertTrue(lock.locked())
+        wrapper.commit()
+        self.assertFalse(lock.locked())
+
+    def test_reads_in_transactions_use_the_default_database(self):
+        # Test cases run in a transaction
+        self.assertEqual(router.db_for_read(Place), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_write(Place), DEFAULT_DB_ALIAS)
+
+
+@skipUnless(READ_DB_ALIAS in settings.DATABASES, "Only SQLite has a read alias")
+class TestReadWriteRouter(SimpleTestCase):
+    def test_routing(self):
+        self.assertEqual(router.db_for_read(Place), READ_DB_ALIAS)
+        # Places read from the read-only connections are saved to the default
+        place = Place()
+        place._state.db = READ_DB_ALIAS
+        self.assertEqual(router.db_for_write(Place, instance=place), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate(READ_DB_ALIAS, "places_api"))
+
+
+@skipUnless(connection.vendor == "sqlite", "Replicas are SQLite snapshots")
+class TestReadReplicas(TransactionTestCase):
+    databases = "__all__"
+    alias = "replica_test"
+
+    def setUp(self):
+        caching.get_cache().clear()
+        caching.get_versions_cache().clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "replica.sqlite3"
+        settings.DATABASES[self.alias] = connections.configure_settings(
+            {
+                DEFAULT_DB_ALIAS: {
+                    "ENGINE": "places_api.backends.sqlite3",
+                    "NAME": self.path,
+                    "OPTIONS": {"read_only": True, "snapshot": True},
+                }
+            }
+        )[DEFAULT_DB_ALIAS]
+        self.addCleanup(settings.DATABASES.pop, self.alias)
+        self.addCleanup(connections.__delitem__, self.alias)
+        self.addCleanup(lambda: connections[self.alias].close())
+        self.create("A")
+
+    def create(self, code):
+        return Place.objects.create(
+            code=code,
+            location_lat=1.23,
+            location_lon=2.34,
+            reward_checkin_points=1,
+            type="office",
+        )
+
+    def list_codes(self, client):
+        with CaptureQueriesContext(connections[self.alias]) as queries:
+            response = client.get(reverse("place-list"))
+        codes = [item["code"] for item in response.json()["results"]]
+        return codes, len(queries) > 0
+
+    def test_reads_from_fresh_snapshots(self):
+        self.assertEqual(replicas.replica_aliases(), [self.alias])
+        # Without a snapshot, from the database
+        self.assertEqual(self.list_codes(self.client), (["A"], False))
+
+        position = replicas.take_snapshot(self.path)
+        self.assertEqual(position, PlaceChange.objects.latest("id").id)
+        place = self.create("B")
+        self.assertEqual(self.list_codes(self.client), (["A"], True))
+        response = self.client.get(reverse("place-detail", args=[place.uuid]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        with override_settings(PLACES_REPLICA_MAX_STALENESS=0):
+            self.assertEqual(self.list_codes(self.client), (["A", "B"], False))
+        with override_settings(PLACES_REPLICA_MAX_STALENESS=None):
+            # The page cached from the replica
+            self.assertEqual(self.list_codes(self.client), (["A"], False))
+            caching.get_cache().clear()
+            self.assertEqual(self.list_codes(self.client), (["A"], True))
+
+        # The open connection is reopened on the next snapshot
+        replicas.take_snapshot(self.path)
+        self.assertEqual(self.list_codes(self.client), (["A", "B"], True))
+        response = self.client.get(reverse("place-detail", args=[place.uuid]))
+        self.assertEqual(response.json()["code"], "B")
+
+    def test_reads_your_writes(self):
+        replicas.take_snapshot(self.path)
+        other = Client()
+        self.assertEqual(self.list_codes(other), (["A"], True))
+
+        response = self.client.post(
+            reverse("place-list"),
+            {
+                "code": "B",
+                "location": {"lat": 1.23, "lon": 2.34},
+                "reward_checkin_points": 1,
+                "type": "office",
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        cookie = response.cookies[replicas.COOKIE]
+        self.assertEqual(int(cookie.value), PlaceChange.objects.latest("id").id)
+        self.assertEqual(cookie["max-age"], 30)
+
+        # The writer reads from the database, the others from the replica,
+        # neither gets the responses cached for the other
+        self.assertEqual(self.list_codes(self.client), (["A", "B"], False))
+        self.assertEqual(self.list_codes(other), (["A"], True))
+        self.assertEqual(self.list_codes(self.client), (["A", "B"], False))
+
+        # Until a replica holds the write
+        replicas.take_snapshot(self.path)
+        self.assertEqual(self.list_codes(self.client), (["A", "B"], True))
+
+    def test_snapshot_database(self):
+        stdout = io.StringIO()
+        call_command("snapshot_database", stdout=stdout)
+        self.assertIn(f"for {self.alias}", stdout.getvalue())
+        self.assertEqual(
+            replicas.snapshot_state(self.alias)[0],
+            PlaceChange.objects.latest("id").id,
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "Needs PostgreSQL")
+class TestPostgresIndexes(TestCase):
+    def fetch(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_geohash_compares_code_points(self):
+        self.assertEqual(
+            self.fetch(
+                "SELECT collation_name FROM information_schema.columns "
+                "WHERE table_name = 'places_api_place' AND column_name = 'geohash'"
+            ),
+            ["C"],
+        )
+
+    def test_trigram_indexes(self):
+        if not self.fetch("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"):
+            self.skipTest("pg_trgm is not installed")
+        self.assertCountEqual(
+            self.fetch(
+                "SELECT indexname FROM pg_indexes WHERE indexname LIKE %s",
+                ["place_%_trgm_idx"],
+            ),
+            ["place_name_trgm_idx", "place_address_trgm_idx"],
+        )
+
+    def test_geography_follows_the_coordinates(self):
+        if not postgres.has_geography(connection.alias):
+            self.skipTest("PostGIS is not installed")
+        place = Place.objects.create(
+            code="a",
+            location_lat=37.978693,
+            location_lon=23.712884,
+            reward_checkin_points=1,
+            type="office",
+        )
+        Place.objects.filter(pk=place.pk).update(location_lat=38)
+        self.assertEqual(
+            self.fetch(
+                "SELECT ST_Y(location::geometry) FROM places_api_place "
+                "WHERE uuid = %s",
+                [place.uuid],
+            ),
+            [38],
+        )
+
+
+class TestCopyFromSQLite(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "db.sqlite3"
+
+    def create_source(self, migrated=True):
+        alias = copy_from_sqlite.SOURCE_ALIAS
+        source = copy_from_sqlite.Command.open_source(self.path)
+        try:
+            executor = MigrationExecutor(source)
+            targets = executor.loader.graph.leaf_nodes()
+            if not migrated:
+                targets = [("places_api", "0005_tag_and_type_indexes")]
+            executor.migrate(targets)
+            if not migrated:
+                return
+
+            content_type = ContentType.objects.db_manager(alias).get_for_model(Place)
+            tag = Tag.objects.using(alias).create(name="wifi", slug="wifi")
+            for i in range(3):
+                place = Place.objects.using(alias).create(
+                    code=f"code_{i}",
+                    name="Blue Cafe",
+                    location_lat=37.978693,
+                    location_lon=23.712884,
+                    reward_checkin_points=1,
+                    type="cafe",
+                )
+                UUIDTaggedItem.objects.using(alias).create(
+                    tag=tag, content_type=content_type, object_id=place.uuid
+                )
+        finally:
+            source.close()
+
+    def test_copy(self):
+        self.create_source()
+        stdout = io.StringIO()
+        call_command("copy_from_sqlite", str(self.path), stdout=stdout)
+
+        self.assertIn("Copied 3 places, 1 tags and 3 tagged items", stdout.getvalue())
+        self.assertEqual(
+            sorted(
+                Place.objects.filter(tags__name="wifi").values_list("code", flat=True)
+            ),
+            ["code_0", "code_1", "code_2"],
+        )
+        # The full-text index, where there is one, follows
+        response = self.client.get(reverse("place-list"), {"q": "blue wifi"})
+        self.assertEqual(len(response.data["results"]), 3)
+        # Later tags do not collide with the copied ones
+        Place.objects.get(code="code_0").tags.add("terrace")
+
+    def test_unmigrated_source(self):
+        self.create_source(migrated=False)
+        ((_, latest),) = MigrationLoader(None).graph.leaf_nodes("places_api")
+        with self.assertRaisesMessage(CommandError, latest):
+            call_command("copy_from_sqlite", str(self.path))
+
+
+class TestMigrations(TestCase):
+    def test_models_match_migrations(self):
+        self.assertEqual(check_migrations(databases=[DEFAULT_DB_ALIAS]), [])
+
+    def test_drift_is_reported(self):
+        field = Place._meta.get_field("code")
+        self.addCleanup(setattr, field, "max_length", field.max_length)
+        field.max_length = 30
+
+        errors = check_migrations(databases=[DEFAULT_DB_ALIAS])
+        self.assertEqual([error.id for error in errors], ["places_api.E001"])
+        self.assertIn("Alter field code on place", errors[0].msg)
+
+    def test_drift_is_a_database_check(self):
+        field = Place._meta.get_field("code")
+        self.addCleanup(setattr, field, "max_length", field.max_length)
+        field.max_length = 30
+
+        errors = run_checks(databases=[DEFAULT_DB_ALIAS])
+        self.assertIn("places_api.E001", [error.id for error in errors])
+        # makemigrations runs the checks without databases, and fixes it
+        self.assertNotIn("places_api.E001", [error.id for error in run_checks()])
+        stdout = io.StringIO()
+        call_command("makemigrations", "places_api", dry_run=True, stdout=stdout)
+        self.assertIn("Alter field code on place", stdout.getvalue())
+
+    def test_migrations_are_self_contained(self):
+        # Migrations run as written whatever the code of the app becomes
+        for path in sorted((Path(__file__).parent / "migrations").glob("0*.py")):
+            modules = []
+            for node in ast.walk(ast.parse(path.read_text())):
+                if isinstance(node, ast.ImportFrom):
+                    modules.append(node.module or ".")
+                elif isinstance(node, ast.Import):
+                    modules += [alias.name for alias in node.names]
+            self.assertEqual(
+                [
+                    module
+                    for module in modules
+                    if module.startswith(".") or module.split(".")[0] == "places_api"
+                ],
+                [],
+                path.name,
+            )
+
+    def migration_connection(self):
+        """A connection to an empty SQLite database, for migrations to fill."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        alias = "migration_test"
+        settings_dict = connections.configure_settings(
+            {
+                DEFAULT_DB_ALIAS: {
+                    "ENGINE": "django.db.backends.sqlite3",
+                    "NAME": Path(directory.name) / "db.sqlite3",
+                }
+            }
+        )[DEFAULT_DB_ALIAS]
+        connections[alias] = load_backend(settings_dict["ENGINE"]).DatabaseWrapper(
+            settings_dict, alias
+        )
+        source = connections[alias]
+        self.addCleanup(connections.__delitem__, alias)
+        self.addCleanup(source.close)
+        return source
+
+    def test_geohash_migration(self):
+        source = self.migration_connection()
+        executor = MigrationExecutor(source)
+        executor.migrate([("places_api", "0001_initial")])
+        with source.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO places_api_place (uuid, address, code, location_lat, "
+                "location_lon, name, reward_checkin_points, type) VALUES "
+                "(%s, NULL, 'a', 37.978693, 23.712884, NULL, 1, 'office')",
+                [uuid.uuid4().hex],
+            )
+        executor.loader.build_graph()
+        executor.migrate([("places_api", "0002_place_geohash")])
+
+        with source.cursor() as cursor:
+            cursor.execute("SELECT geohash FROM places_api_place")
+            self.assertEqual(
+                cursor.fetchall(), [(geohash_encode(37.978693, 23.712884),)]
+            )
+
+    def test_search_index_migration(self):
+        source = self.migration_connection()
+        executor = MigrationExecutor(source)
+        executor.migrate([("places_api", "0003_place_code_uuid_idx")])
+        place_uuid = uuid.uuid4()
+        with source.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO places_api_place (uuid, address, code, location_lat, "
+                "location_lon, name, reward_checkin_points, type, geohash) VALUES "
+                "(%s, NULL, 'a', 37.978693, 23.712884, 'Blue Café', 1, 'office', '')",
+                [place_uuid.hex],
+            )
+        executor.loader.build_graph()
+        executor.migrate([("places_api", "0004_place_search_index")])
+
+        with source.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, uuid FROM {search.TABLE} WHERE {search.TABLE} MATCH %s",
+                [search.match_query("blu caf")],
+            )
+            self.assertEqual(
+                cursor.fetchall(), [(search.search_rowid(place_uuid), place_uuid.hex)]
+            )
+
+    def test_schema_drift_migration(self):
+        source = self.migration_connection()
+        alias = source.alias
+        executor = MigrationExecutor(source)
+        executor.migrate([("places_api", "0007_postgres_indexes")])
+        with source.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO places_api_place (uuid, address, code, location_lat, "
+                "location_lon, name, reward_checkin_points, type, geohash, version, "
+                "updated_at) VALUES (%s, NULL, 'a', 37.978693, 23.712884, NULL, 1, "
+                "'office', '', 1, '2024-01-01')",
+                [uuid.uuid4().hex],
+            )
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+        place = Place.objects.using(alias).get(code="a")
+        self.assertEqual((place.name, place.address), (None, None))
+        self.assertEqual(place.location_lat, Decimal("37.978693"))
+        with source.cursor() as cursor:
+            columns = {
+                column.name: column
+                for column in source.introspection.get_table_description(
+                    cursor, "places_api_place"
+                )
+            }
+        self.assertEqual(columns["location_lat"].type_code, "decimal")
+
+
+class TestStartup(TestCase):
+    def test_migrate_if_needed_returns_when_applied(self):
+        stdout = io.StringIO()
+        with patch.object(migrate.Command, "check") as check, patch(
+            "django.core.management.commands.migrate.Command.handle"
+        ) as handle:
+            call_command("migrate", if_needed=True, stdout=stdout)
+        self.assertEqual(stdout.getvalue(), "No migrations to apply.\n")
+        check.assert_not_called()
+        handle.assert_not_called()
+
+    def test_migrate_if_needed_migrates_otherwise(self):
+        pending = [
+            (MigrationLoader(None).get_migration("sessions", "0001_initial"), False)
+        ]
+        with patch.object(
+            MigrationExecutor, "migration_plan", return_value=pending
+        ), patch("django.core.management.commands.migrate.Command.handle") as handle:
+            call_command("migrate", if_needed=True, stdout=io.StringIO())
+        handle.assert_called_once()
+
+    def test_lean_settings_leave_the_admin_out(self):
+        code = (
+            "import sys, django; django.setup()\n"
+            "from django.apps import apps\n"
+            "from django.conf import settings\n"
+            "from django.urls import get_resolver\n"
+            "get_resolver().url_patterns\n"
+            # DRF imports modules of the admin, the app is left out
+            "print(apps.is_installed('django.contrib.admin') or "
+            "'places_api.admin' in sys.modules, "
+            "settings.REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'], "
+            "[str(pattern.pattern) for pattern in get_resolver().url_patterns])"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            process = subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=bench_startup.PROJECT_DIR,
+                env={
+                    **os.environ,
+                    "DB_PATH": directory,
+                    "PLACES_ADMIN": "off",
+                    "PLACES_BROWSABLE_API": "off",
+                    "PYTHONPATH": str(bench_startup.PROJECT_DIR.parent),
+                },
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        self.assertEqual(
+            process.stdout.split(" ", 1),
+            [
+                "False",
+                "['places_api.renderers.FastJSONRenderer'] "
+                "['api/', 'metrics', '^static/(?P<path>.*)$']\n",
+            ],
+        )
+
+    def test_importtime_report(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     django.contrib.admin.sites\n"
+            "import time:        80 |        200 |   django.db.models\n"
+            "import time:        50 |        250 | places_api.stats\n"
+        )
+        rows = bench_startup.parse_importtime(output)
+        self.assertEqual(
+            rows,
+            [
+                ("django.contrib.admin.sites", 120, 120),
+                ("django.db.models", 80, 200),
+                ("places_api.stats", 50, 250),
+            ],
+        )
+        self.assertEqual(
+            [bench_startup.package(module) for module, _, _ in rows],
+            ["django.contrib.admin", "django.db", "places_api"],
+        )
+
+
+class TestPlaceRepresentations(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        first = Place.objects.create(
+            code="A",
+            address="Ermou 1 Athens",
+            location_lat=Decimal("0.00005"),
+            location_lon=Decimal("-0.000001"),
+            name=None,
+            reward_checkin_points=1,
+            type="office",
+        )
+        # One at a time, the order in which they are added is the one shown
+        first.tags.add("wifi")
+        first.tags.add("cafe")
+        Place.objects.create(
+            code="B",
+            address="Καλαμάτα",
+            location_lat=Decimal("37.978693"),
+            location_lon=Decimal("23.712884"),
+            name='Blue "Olive"',
+            reward_checkin_points=100,
+            type="cafe",
+        )
+
+    def test_representations_match_serializer(self):
+        places = Place.objects.order_by("code").prefetch_related("tags")
+        expected = JSONRenderer().render(PlaceSerializer(places, many=True).data)
+
+        rows = list(place_values(Place.objects.order_by("code")))
+        with self.assertNumQueries(1):
+            representations = place_representations(rows)
+        self.assertEqual(FastJSONRenderer().render(representations), expected)
+
+    def test_list_matches_serializer(self):
+        places = Place.objects.order_by("code", "uuid").prefetch_related("tags")
+        expected = JSONRenderer().render(
+            {
+                "next": None,
+                "previous": None,
+                "results": PlaceSerializer(places, many=True).data,
+            }
+        )
+
+        response = self.client.get(reverse("place-list"))
+        self.assertEqual(response.content, expected)
+
+    def test_coordinates_have_the_stored_precision(self):
+        serializer = PlaceSerializer(
+            data={
+                "code": "C",
+                "location": {"lat": 37.97869349, "lon": 23.7128841},
+                "reward_checkin_points": 1,
+                "type": "office",
+            }
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        place = serializer.save()
+        self.assertEqual(
+            serializer.data["location"], {"lat": 37.978694, "lon": 23.712884}
+        )
+        [representation] = place_representations(
+            list(place_values(Place.objects.filter(pk=place.pk)))
+        )
+        self.assertEqual(representation["location"], serializer.data["location"])
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            "floats": [0.1, -0.0, 37.978693, -(2**0.5)],
+            "integers": [0, -(2**63), 2**70],
+            "text": 'line\u2028\u2029break \x01 "quoted" é 😀',
+            "decimal": Decimal("0.000010"),
+            "uuid": uuid.UUID(int=1),
+            "lazy": gettext_lazy("Not found."),
+            1: "integer key",
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=4"),
+            JSONRenderer().render(data, "application/json; indent=4"),
+        )
+
+    def test_renderer_floats(self):
+        # Written differently by orjson, e.g. 0.00005 for 5e-05 and 1e16 for
+        # 1e+16, and left to JSONRenderer
+        for data in (
+            [5e-05],
+            {"count": 1, "ratio": 1e16},
+            [1e-07, -1.5e-05, 1.5e300, 0.1],
+            {"digits": "0.00005"},
+        ):
+            self.assertEqual(
+                FastJSONRenderer().render(data), JSONRenderer().render(data)
+            )
+            self.assertEqual(
+                ndjson_line(data).encode(),
+                json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+                + b"\n",
+            )
+
+    def test_renderer_refuses_non_finite_floats(self):
+        for value in (float("nan"), float("inf"), -float("inf")):
+            data = {"results": [{"name": None, "location": {"lat": value}}]}
+            with self.assertRaises(ValueError):
+                JSONRenderer().render(data)
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render(data)
+            with self.assertRaises(ValueError):
+                ndjson_line(data)
+
+
+class TestRequestMetrics(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.place = Place.objects.create(
+            code="A",
+            address="athens",
+            location_lat=1.23,
+            location_lon=2.34,
+            name="sample_name",
+            reward_checkin_points=1,
+            type="office",
+        )
+        cls.place.tags.add("sample_tag")
+
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+
+    def scrape(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_requests_are_recorded_by_action(self):
+        self.client.get(reverse("place-list"))
+        self.client.get(reverse("place-list"))
+        self.client.post(
+            reverse("place-list"),
+            {
+                "code": "B",
+                "location": {"lat": 1.23, "lon": 2.34},
+                "reward_checkin_points": 1,
+                "type": "office",
+            },
+            content_type="application/json",
+        )
+        content = self.scrape()
+
+        self.assertIn(
+            'places_http_requests_total{endpoint="PlaceViewSet.list",method="GET",'
+            'status="200"} 2',
+            content,
+        )
+        self.assertIn(
+            'places_http_requests_total{endpoint="PlaceViewSet.create",method="POST",'
+            'status="201"} 1',
+            content,
+        )
+        labels = 'endpoint="PlaceViewSet.list",method="GET"'
+        self.assertIn(
+            f'places_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+            content,
+        )
+        self.assertIn(
+            f"places_http_request_duration_seconds_count{{{labels}}} 2", content
+        )
+        self.assertIn(f"places_http_response_size_bytes_count{{{labels}}} 2", content)
+        # The second list was a cache hit, which runs no query
+        self.assertIn(
+            f'places_http_request_db_queries_bucket{{{labels},le="0"}} 1', content
+        )
+
+    def test_server_timing_counts_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("tag-list"))
+        self.assertRegex(
+            response["Server-Timing"],
+            rf'^db;dur=[\d.]+;desc="{len(queries)} queries", '
+            r"serialize;dur=[\d.]+, total;dur=[\d.]+$",
+        )
+
+    async def test_async_reads_are_recorded(self):
+        response = await self.async_client.get(
+            reverse("place-detail", args=[self.place.uuid])
+        )
+        self.assertIn("Server-Timing", response)
+        self.assertIn(
+            'places_http_requests_total{endpoint="PlaceViewSet.retrieve",'
+            'method="GET",status="200"} 1',
+            metrics.exposition(),
+        )
+
+    def test_slow_requests_are_logged_off_by_default(self):
+        with self.assertNoLogs("places_api.metrics"):
+            self.client.get(reverse("tag-list"))
+
+    @override_settings(PLACES_SLOW_REQUEST_MS=0, PLACES_PROFILE_SAMPLE_RATE=1)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs("places_api.metrics", "WARNING") as logs:
+            self.client.get(reverse("tag-list"))
+        (message,) = logs.output
+        self.assertIn("Slow request GET /api/tags 200", message)
+        self.assertIn('FROM "taggit_tag"', message)
+        self.assertIn("function calls", message)
+
+
+class TestPlaceChanges(TestCase):
+    url = reverse("place-changes")
+
+    def create_place(self, code, **fields):
+        place = Place(
+            code=code,
+            address="athens",
+            location_lat=1.23,
+            location_lon=2.34,
+            name="sample_name",
+            reward_checkin_points=1,
+            type="office",
+            **fields,
+        )
+        place.save()
+        return place
+
+    def changes(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_changes_url(self):
+        self.assertEqual(self.url, "/api/place/changes")
+
+    def test_sync(self):
+        first = self.create_place("A")
+        first.tags.add("wifi")
+        second = self.create_place("B")
+        feed = self.changes()
+        self.assertEqual(
+            [(change["uuid"], change["deleted"]) for change in feed["changes"]],
+            [(str(first.uuid), False), (str(second.uuid), False)],
+        )
+        self.assertEqual(feed["changes"][0]["place"]["tags"], ["wifi"])
+        self.assertIsNone(feed["next"])
+
+        # Only what changed since, each place once
+        self.assertEqual(self.changes(since=feed["token"])["changes"], [])
+        first.name = "renamed"
+        first.save()
+        first.tags.add("parking")
+        response = self.client.delete(reverse("place-detail", args=[second.uuid]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        feed = self.changes(since=feed["token"])
+        first_change, second_change = feed["changes"]
+        self.assertEqual(first_change["place"]["name"], "renamed")
+        self.assertEqual(first_change["place"]["tags"], ["wifi", "parking"])
+        self.assertEqual(
+            second_change,
+            {
+                "token": feed["token"],
+                "uuid": str(second.uuid),
+                "deleted": True,
+                "place": None,
+            },
+        )
+
+    def test_pages(self):
+        places = [self.create_place(code) for code in "ABC"]
+        feed = self.changes(limit=2)
+        self.assertEqual(len(feed["changes"]), 2)
+        self.assertIn(f"since={feed['token']}", feed["next"])
+
+        response = self.client.get(feed["next"])
+        (change,) = response.json()["changes"]
+        self.assertEqual(change["uuid"], str(places[2].uuid))
+        self.assertIsNone(response.json()["next"])
+
+    def test_bounded_queries(self):
+        for code in "ABCDE":
+            self.create_place(code).tags.add("wifi")
+        token = self.changes(limit=1)["token"]
+        # The expired token check, the changes, their places and their tags
+        with CaptureQueriesContext(connection) as queries:
+            self.changes(since=token)
+        self.assertEqual(len(queries), 4)
+
+    def test_tag_and_bulk_changes(self):
+        place = self.create_place("A")
+        place.tags.add("wifi")
+        token = self.changes()["token"]
+
+        Tag.objects.filter(name="wifi").get().delete()
+        self.client.post(
+            reverse("place-bulk"),
+            {
+                "create": [
+                    {
+                        "code": "B",
+                        "location": {"lat": 1.0, "lon": 2.0},
+                        "reward_checkin_points": 1,
+                        "type": "cafe",
+                    }
+                ]
+            },
+            content_type="application/json",
+        )
+        feed = self.changes(since=token)
+        self.assertEqual(
+            [change["place"]["code"] for change in feed["changes"]], ["A", "B"]
+        )
+        self.assertEqual(feed["changes"][0]["place"]["tags"], [])
+
+    def test_bad_tokens(self):
+        for params in (
+            {"since": "abc"},
+            {"since": "1"},
+            {"since": "-1.0"},
+            {"limit": "x"},
+        ):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_compaction(self):
+        kept = self.create_place("A")
+        kept.save()
+        deleted = self.create_place("B")
+        token = self.changes()["token"]
+        deleted.delete()
+
+        stdout = io.StringIO()
+        call_command("compact_changes", tombstone_days=0, stdout=stdout)
+        # The first save of each place, the deletion supersedes the second
+        self.assertIn(
+            "Deleted 2 superseded changes and 1 tombstones", stdout.getvalue()
+        )
+        self.assertEqual(
+            list(PlaceChange.objects.values_list("place_uuid", flat=True)),
+            [kept.uuid],
+        )
+
+        # The tombstone is gone, clients which did not see it sync again
+        response = self.client.get(self.url, {"since": token})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        feed = self.changes()
+        self.assertEqual(
+            [change["uuid"] for change in feed["changes"]], [str(kept.uuid)]
+        )
+        kept.save()
+        feed = self.changes(since=feed["token"])
+        self.assertEqual(
+            [change["uuid"] for change in feed["changes"]], [str(kept.uuid)]
+        )
+
+
+class TestPlaceEvents(TestCase):
+    def create_place(self, code, lat=1.23, tags=()):
+        place = Place(
+            code=code,
+            address="athens",
+            location_lat=lat,
+            location_lon=2.34,
+            name="sample_name",
+            reward_checkin_points=1,
+            type="office",
+        )
+        place.save()
+        place.tags.add(*tags)
+        return place
+
+    def committed(self, func, *args, **kwargs):
+        # The broadcaster is woken once the writes commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(*args, **kwargs)
+
+    async def write(self, func, *args, **kwargs):
+        return await sync_to_async(self.committed)(func, *args, **kwargs)
+
+    @asynccontextmanager
+    async def open_stream(self, query="", headers=(), method="GET", host="testserver"):
+        sent, received = asyncio.Queue(), asyncio.Queue()
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": events.EVENTS_PATH,
+            "query_string": query.encode(),
+            "headers": [(b"host", host.encode()), *headers],
+        }
+        application = events.EventStreamApplication(None)
+        task = asyncio.ensure_future(application(scope, received.get, sent.put))
+        start = await asyncio.wait_for(sent.get(), 5)
+        try:
+            yield start, sent
+        finally:
+            await self.close_stream(task, received)
+
+    async def close_stream(self, task, received):
+        await received.put({"type": "http.disconnect"})
+        await asyncio.wait_for(task, 5)
+        broadcaster = events.get_broadcaster()
+        if broadcaster.task is not None:
+            # Ends once it sees no subscriptions left
+            running = broadcaster.task
+            broadcaster.wake()
+            await asyncio.wait_for(running, 5)
+
+    async def next_event(self, sent):
+        while True:
+            body = (await asyncio.wait_for(sent.get(), 5))["body"]
+            if not body.startswith((b":", b"retry:")):
+                return body
+
+    def parse_event(self, body):
+        fields = dict(line.split(": ", 1) for line in body.decode().split("\n") if line)
+        return fields.get("id"), fields["event"], json.loads(fields["data"])
+
+    async def test_streams_changes(self):
+        async with self.open_stream() as (start, sent):
+            self.assertEqual(start["status"], status.HTTP_200_OK)
+            self.assertIn(
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                start["headers"],
+            )
+            await events.get_broadcaster().ready.wait()
+
+            place = await self.write(self.create_place, "A", tags=["wifi"])
+            event_id, name, data = self.parse_event(await self.next_event(sent))
+            self.assertEqual(name, "change")
+            self.assertEqual(event_id, data["token"])
+            self.assertEqual(data["uuid"], str(place.uuid))
+            self.assertEqual(data["place"]["tags"], ["wifi"])
+
+            deleted_uuid = str(place.uuid)
+            await self.write(place.delete)
+            _, _, data = self.parse_event(await self.next_event(sent))
+            self.assertEqual((data["uuid"], data["deleted"]), (deleted_uuid, True))
+
+    async def test_filters(self):
+        async with self.open_stream("bbox=2,1,3,2&tags=wifi") as (_, sent):
+            await events.get_broadcaster().ready.wait()
+
+            outside = await self.write(self.create_place, "A", lat=5, tags=["wifi"])
+            await self.write(self.create_place, "B", tags=["parking"])
+            inside = await self.write(self.create_place, "C", tags=["wifi", "parking"])
+            _, _, data = self.parse_event(await self.next_event(sent))
+            self.assertEqual(data["uuid"], str(inside.uuid))
+
+            # Whatever their place was, deletions reach every client
+            deleted_uuid = str(outside.uuid)
+            await self.write(outside.delete)
+            _, _, data = self.parse_event(await self.next_event(sent))
+            self.assertEqual((data["uuid"], data["deleted"]), (deleted_uuid, True))
+
+    async def test_replays_missed_changes(self):
+        await self.write(self.create_place, "A")
+        response = await self.async_client.get(reverse("place-changes"))
+        token = response.json()["token"]
+        missed = await self.write(self.create_place, "B")
+
+        headers = [(b"last-event-id", token.encode())]
+        async with self.open_stream(headers=headers) as (_, sent):
+            _, _, data = self.parse_event(await self.next_event(sent))
+            self.assertEqual(data["uuid"], str(missed.uuid))
+
+            # Changes after the replay come from the broadcaster
+            latest = await self.write(self.create_place, "C")
+            _, _, data = self.parse_event(await self.next_event(sent))
+            self.assertEqual(data["uuid"], str(latest.uuid))
+
+    async def test_expired_tokens_reset(self):
+        place = await self.write(self.create_place, "A")
+        await self.write(place.delete)
+        await sync_to_async(call_command)(
+            "compact_changes", tombstone_days=0, stdout=io.StringIO()
+        )
+        async with self.open_stream("since=1.0") as (_, sent):
+            self.assertEqual(await self.next_event(sent), events.RESET)
+
+    async def test_bad_requests(self):
+        for query in ("since=abc", "bbox=1,2", "tags_match=some"):
+            async with self.open_stream(query) as (start, sent):
+                self.assertEqual(start["status"], status.HTTP_400_BAD_REQUEST)
+                body = json.loads((await sent.get())["body"])
+                self.assertIn(query.split("=")[0], body)
+        async with self.open_stream(method="POST") as (start, _):
+            self.assertEqual(start["status"], status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def test_unknown_hosts_are_rejected(self):
+        with self.assertLogs("django.security.DisallowedHost", "ERROR"):
+            async with self.open_stream(host="evil.example.com") as (start, sent):
+                self.assertEqual(start["status"], status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(
+                    json.loads((await sent.get())["body"]), {"detail": "Invalid host."}
+                )
+        self.assertIsNone(events.get_broadcaster().task)
+
+    def test_slow_clients_are_reset(self):
+        subscription = events.Subscription()
+        item = {"place": None}
+        for change_id in range(events.QUEUE_SIZE + 1):
+            subscription.put(change_id, item, b"event")
+        # The events it missed are dropped, the reset is all it gets
+        self.assertEqual(subscription.pending, [(None, events.RESET)])
+        subscription.put(0, item, b"event")
+        subscription.heartbeat()
+        self.assertEqual(subscription.pending, [(None, events.RESET)])
+
+    async def test_other_requests_reach_django(self):
+        scopes = []
+
+        async def application(scope, receive, send):
+            scopes.append(scope)
+
+        scope = {"type": "http", "method": "GET", "path": "/api/place"}
+        await events.EventStreamApplication(application)(scope, None, None)
+        self.assertEqual(scopes, [scope])
+
+
+@skipUnless(connection.vendor == "postgresql", "Needs PostgreSQL")
+class TestPostgresEventsBackend(TransactionTestCase):
+    def test_notifies_on_commit(self):
+        backend = events.PostgresBackend()
+        woken = threading.Event()
+        backend.start(woken.set)
+        self.addCleanup(backend.stop)
+        # Once listening, it wakes the broadcaster for changes it may have missed
+        self.assertTrue(woken.wait(5))
+        woken.clear()
+
+        # Sent by the writers through the backend of the settings
+        Place.objects.create(
+            code="A",
+            location_lat=1.23,
+            location_lon=2.34,
+            reward_checkin_points=1,
+            type="office",
+        )
+        self.assertTrue(woken.wait(5))
+
+
+class TestPlaceTiles(TestCase):
+    sample_places = {
+        "syntagma": (37.975500, 23.734800, "cafe", 10),
+        "acropolis": (37.971500, 23.725700, "museum", 20),
+        "plaka": (37.972800, 23.730300, "cafe", 30),
+        "thessaloniki": (40.640100, 22.944400, "hotel", 40),
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.places = {}
+        for code, (lat, lon, place_type, points) in self.sample_places.items():
+            self.places[code] = self.create_place(code, lat, lon, place_type, points)
+
+    @staticmethod
+    def create_place(code, lat, lon, place_type="office", points=1):
+        place = Place(
+            code=code,
+            location_lat=lat,
+            location_lon=lon,
+            reward_checkin_points=points,
+            type=place_type,
+        )
+        place.save()
+        return place
+
+    @staticmethod
+    def cluster_rows():
+        return sorted(
+            PlaceCluster.objects.values_list(
+                "precision",
+                "cell",
+                "type",
+                "count",
+                "lat_sum",
+                "lon_sum",
+                "points_sum",
+            )
+        )
+
+    def assertClustersUpToDate(self):
+        kept = self.cluster_rows()
+        clusters.rebuild()
+        self.assertEqual(kept, self.cluster_rows())
+
+    def get_tile(self, zoom, x, y):
+        response = self.client.get(
+            reverse("place-tiles", kwargs={"zoom": zoom, "x": x, "y": y})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_tile_math(self):
+        min_lat, min_lon, max_lat, max_lon = tile_bbox(0, 0, 0)
+        self.assertEqual((min_lon, max_lon), (-180, 180))
+        self.assertAlmostEqual(max_lat, 85.0511, places=4)
+        self.assertAlmostEqual(min_lat, -max_lat)
+        for lat, lon, *_ in self.sample_places.values():
+            for zoom in (1, 8, 15, clusters.MAX_ZOOM):
+                bbox = tile_bbox(zoom, *point_tile(lat, lon, zoom))
+                self.assertTrue(clusters.in_tile(lat, lon, bbox))
+
+    def test_tiles_url(self):
+        self.assertEqual(
+            reverse("place-tiles", kwargs={"zoom": 3, "x": 4, "y": 5}),
+            "/api/place/tiles/3/4/5",
+        )
+
+    def test_clusters(self):
+        athens = self.get_tile(8, *point_tile(37.9755, 23.7348, 8)).json()
+        self.assertIsNone(athens["places"])
+        [cluster] = athens["clusters"]
+        self.assertEqual(cluster["count"], 3)
+        self.assertEqual(cluster["reward_checkin_points"], 60)
+        self.assertEqual(
+            cluster["types"],
+            [{"type": "cafe", "count": 2}, {"type": "museum", "count": 1}],
+        )
+        self.assertEqual(
+            cluster["location"],
+            {
+                "lat": round((37.9755 + 37.9715 + 37.9728) / 3, 6),
+                "lon": round((23.7348 + 23.7257 + 23.7303) / 3, 6),
+            },
+        )
+        self.assertTrue(geohash_encode(37.9755, 23.7348).startswith(cluster["cell"]))
+
+    def test_clusters_cover_every_place_once(self):
+        for zoom in (0, 2, 4):
+            counts = []
+            for x in range(2**zoom):
+                for y in range(2**zoom):
+                    tile = clusters.tile(zoom, x, y)
+                    counts += [cluster["count"] for cluster in tile["clusters"]]
+            self.assertEqual(sum(counts), len(self.sample_places))
+
+    def test_places_at_high_zoom(self):
+        zoom = clusters.PLACES_ZOOM
+        tile = self.get_tile(zoom, *point_tile(37.9755, 23.7348, zoom)).json()
+        self.assertEqual(tile["clusters"], [])
+        self.assertEqual([place["code"] for place in tile["places"]], ["syntagma"])
+
+        # Too many to list, clustered instead
+        crowded = (37.9755, 23.7348, 37.9756, 23.7349)
+        benchmarking.generate_places(clusters.MAX_TILE_PLACES + 1, region=crowded)
+        clusters.rebuild()
+        tile = clusters.tile(zoom, *point_tile(37.9755, 23.7348, zoom))
+        self.assertIsNone(tile["places"])
+        self.assertEqual(
+            sum(cluster["count"] for cluster in tile["clusters"]),
+            clusters.MAX_TILE_PLACES + 2,
+        )
+
+    def test_invalid_tiles(self):
+        for zoom, x, y in [(1, 2, 0), (1, 0, 2), (clusters.MAX_ZOOM + 1, 0, 0)]:
+            response = self.client.get(
+                reverse("place-tiles", kwargs={"zoom": zoom, "x": x, "y": y})
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tiles_cached_until_places_change(self):
+        tile = point_tile(37.9755, 23.7348, 8)
+        self.assertEqual(self.get_tile(8, *tile)["X-Cache"], "MISS")
+        self.assertEqual(self.get_tile(8, *tile)["X-Cache"], "HIT")
+
+        place = self.places["syntagma"]
+        place.type = "museum"
+        place.save()
+        response = self.get_tile(8, *tile)
+        self.assertEqual(response["X-Cache"], "MISS")
+        [cluster] = response.json()["clusters"]
+        self.assertEqual(cluster["types"][0], {"type": "museum", "count": 2})
+
+    def test_clusters_follow_writes(self):
+        self.assertClustersUpToDate()
+
+        place = self.places["syntagma"]
+        place.location_lat = 38.5
+        place.reward_checkin_points = 99
+        place.save()
+        self.assertClustersUpToDate()
+
+        # Saved again from the same instance, with the values of the last save
+        place.type = "hotel"
+        place.save()
+        self.assertClustersUpToDate()
+
+        response = self.client.patch(
+            reverse("place-detail", args=[self.places["plaka"].uuid]),
+            {"location": {"lat": 39.1, "lon": 21.2}},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertClustersUpToDate()
+
+        self.places["acropolis"].delete()
+        self.assertClustersUpToDate()
+
+        data = {
+            "code": "bulk",
+            "location": {"lat": 36.1, "lon": 27.9},
+            "reward_checkin_points": 5,
+            "type": "park",
+        }
+        response = self.client.post(
+            reverse("place-bulk"),
+            {
+                "create": [data],
+                "update": [
+                    {**data, "uuid": str(self.places["thessaloniki"].uuid)},
+                ],
+                "delete": [str(place.uuid)],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertClustersUpToDate()
+        self.assertEqual(
+            sum(
+                PlaceCluster.objects.filter(precision=1).values_list("count", flat=True)
+            ),
+            Place.objects.count(),
+        )
+
+    def test_clusters_follow_concurrent_writes(self):
+        # Two writers loaded the same place before either saved it
+        uuid = self.places["syntagma"].uuid
+        first, second = Place.objects.get(uuid=uuid), Place.objects.get(uuid=uuid)
+        first.type, first.location_lat, first.reward_checkin_points = "bar", 38.5, 7
+        first.save()
+        second.type, second.location_lon = "hotel", 21.2
+        second.save()
+        self.assertClustersUpToDate()
+
+        stale = Place.objects.get(uuid=uuid)
+        self.places["syntagma"].location_lat = 36.1
+        self.places["syntagma"].save()
+        bulk.update_places([(stale, {"type": "park"})])
+        self.assertClustersUpToDate()
+
+        stale.delete()
+        self.assertClustersUpToDate()
+        # Deleted again once deleted elsewhere, there is nothing to subtract
+        Place.objects.get(uuid=self.places["acropolis"].uuid).delete()
+        self.places["acropolis"].delete()
+        self.assertClustersUpToDate()
+
+    def test_rebuild_command(self):
+        kept = self.cluster_rows()
+        PlaceCluster.objects.all().delete()
+        out = io.StringIO()
+        call_command("rebuild_clusters", stdout=out)
+        self.assertIn(f"Rebuilt {len(kept)} clusters", out.getvalue())
+        self.assertEqual(self.cluster_rows(), kept)
+
+
+class TestPlaceStats(TestCase):
+    def create_place(self, code, place_type, points, tags=(), lat=37.9755, lon=23.7348):
+        place = Place(
+            code=code,
+            location_lat=lat,
+            location_lon=lon,
+            reward_checkin_points=points,
+            type=place_type,
+        )
+        place.save()
+        place.tags.add(*tags)
+        return place
+
+    def get_stats(self, url_name, **params):
+        response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    @staticmethod
+    def summary_rows():
+        return sorted(
+            PlaceTagSummary.objects.values_list("tag__name", "count", "points_sum")
+        )
+
+    def assertTagStatsUpToDate(self):
+        expected = {}
+        for place in Place.objects.prefetch_related("tags"):
+            for tag in place.tags.all():
+                count, points = expected.get(tag.name, (0, 0))
+                expected[tag.name] = (count + 1, points + place.reward_checkin_points)
+        self.assertEqual(
+            [row for row in self.summary_rows() if row[1]],
+            sorted((name, *sums) for name, sums in expected.items()),
+        )
+        kept = self.summary_rows()
+        stats.rebuild()
+        self.assertEqual(kept, self.summary_rows())
+
+    def test_stats_urls(self):
+        self.assertEqual(reverse("place-type-stats"), "/api/place/stats/types")
+        self.assertEqual(reverse("place-tag-stats"), "/api/place/stats/tags")
+        self.assertEqual(reverse("place-leaderboard"), "/api/place/leaderboard")
+
+    def test_type_stats(self):
+        self.create_place("A", "cafe", 10)
+        self.create_place("B", "cafe", 15, lat=40.6401, lon=22.9444)
+        self.create_place("C", "museum", 40)
+        self.assertEqual(
+            self.get_stats("place-type-stats"),
+            [
+                {
+                    "type": "cafe",
+                    "count": 2,
+                    "reward_checkin_points": {"total": 25, "average": 12.5},
+                },
+                {
+                    "type": "museum",
+                    "count": 1,
+                    "reward_checkin_points": {"total": 40, "average": 40.0},
+                },
+            ],
+        )
+
+    def test_tag_stats(self):
+        self.create_place("A", "cafe", 10, ["wifi", "vegan"])
+        self.create_place("B", "cafe", 20, ["wifi"])
+        self.assertEqual(
+            self.get_stats("place-tag-stats"),
+            [
+                {
+                    "name": "wifi",
+                    "slug": "wifi",
+                    "count": 2,
+                    "reward_checkin_points": {"total": 30, "average": 15.0},
+                },
+                {
+                    "name": "vegan",
+                    "slug": "vegan",
+                    "count": 1,
+                    "reward_checkin_points": {"total": 10, "average": 10.0},
+                },
+            ],
+        )
+
+    def test_stats_queries_constant(self):
+        def count_queries(url_name):
+            with CaptureQueriesContext(connection) as queries:
+                self.get_stats(url_name)
+            return len(queries)
+
+        self.create_place("A", "cafe", 10, ["wifi"])
+        small = [count_queries("place-type-stats"), count_queries("place-tag-stats")]
+        for i in range(20):
+            self.create_place(f"code_{i}", "cafe", i, ["wifi", f"tag_{i % 3}"])
+        caching.invalidate()
+        large = [count_queries("place-type-stats"), count_queries("place-tag-stats")]
+        self.assertEqual(small, large)
+        self.assertEqual(large, [1, 1])
+
+    def test_tag_stats_follow_writes(self):
+        place = self.create_place("A", "cafe", 10, ["wifi", "vegan"])
+        # Tagged before it was saved
+        unsaved = Place(
+            code="B",
+            location_lat=1.23,
+            location_lon=2.34,
+            reward_checkin_points=5,
+            type="office",
+        )
+        unsaved.tags.add("wifi")
+        unsaved.save()
+        self.assertTagStatsUpToDate()
+
+        place.reward_checkin_points = 50
+        place.save()
+        place.tags.remove("vegan")
+        self.assertTagStatsUpToDate()
+        place.tags.set(["parking", "wifi"])
+        self.assertTagStatsUpToDate()
+        place.tags.clear()
+        self.assertTagStatsUpToDate()
+
+        response = self.client.post(
+            reverse("place-list"),
+            {
+                "code": "C",
+                "location": {"lat": 38.1, "lon": 23.2},
+                "reward_checkin_points": 7,
+                "type": "park",
+                "tags": ["wifi", "quiet"],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = response.json()["uuid"]
+        response = self.client.patch(
+            reverse("place-detail", args=[created]),
+            {"reward_checkin_points": 9, "tags": ["quiet", "rooftop"]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTagStatsUpToDate()
+
+        response = self.client.post(
+            reverse("place-bulk"),
+            {
+                "create": [
+                    {
+                        "code": "D",
+                        "location": {"lat": 38.2, "lon": 23.3},
+                        "reward_checkin_points": 3,
+                        "type": "park",
+                        "tags": ["wifi", "rooftop"],
+                    }
+                ],
+                "update": [
+                    {
+                        "uuid": created,
+                        "code": "C",
+                        "location": {"lat": 38.1, "lon": 23.2},
+                        "reward_checkin_points": 11,
+                        "type": "park",
+                        "tags": ["wifi"],
+                    },
+                    {
+                        "uuid": str(unsaved.uuid),
+                        "code": "B",
+                        "location": {"lat": 1.23, "lon": 2.34},
+                        "reward_checkin_points": 6,
+                        "type": "office",
+                    },
+                ],
+                "delete": [str(place.uuid)],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTagStatsUpToDate()
+
+        Place.objects.get(code="B").delete()
+        Tag.objects.get(name="rooftop").delete()
+        self.assertTagStatsUpToDate()
+
+    def test_tag_stats_follow_concurrent_writes(self):
+        place = self.create_place("A", "cafe", 10, ["wifi"])
+        # Two writers loaded the place before either saved it
+        first, second = Place.objects.get(pk=place.pk), Place.objects.get(pk=place.pk)
+        first.reward_checkin_points = 20
+        first.save()
+        second.reward_checkin_points = 30
+        second.save()
+        self.assertTagStatsUpToDate()
+
+        first.tags.add("vegan")
+        first.tags.remove("wifi")
+        self.assertTagStatsUpToDate()
+
+        place.reward_checkin_points = 40
+        place.save()
+        bulk.update_places([(second, {"reward_checkin_points": 50, "tags": ["quiet"]})])
+        self.assertTagStatsUpToDate()
+
+        first.delete()
+        self.assertTagStatsUpToDate()
+
+    def test_leaderboard(self):
+        self.create_place("A", "cafe", 10)
+        self.create_place("B", "cafe", 30)
+        self.create_place("C", "museum", 30)
+        self.create_place("D", "park", 90, lat=40.6401, lon=22.9444)
+
+        def codes(**params):
+            return [
+                place["code"] for place in self.get_stats("place-leaderboard", **params)
+            ]
+
+        self.assertEqual(codes(), ["D", "B", "C", "A"])
+        self.assertEqual(codes(limit=2), ["D", "B"])
+        self.assertEqual(codes(bbox="23.7,37.9,23.8,38.0"), ["B", "C", "A"])
+        self.assertEqual(codes(type="cafe"), ["B", "A"])
+        self.assertEqual(
+            self.client.get(reverse("place-leaderboard"), {"limit": "x"}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    def test_rebuild_command(self):
+        self.create_place("A", "cafe", 10, ["wifi"])
+        kept = self.summary_rows()
+        PlaceTagSummary.objects.all().delete()
+        PlaceCluster.objects.all().delete()
+        out = io.StringIO()
+        call_command("rebuild_stats", stdout=out)
+        self.assertIn("Summed up 1 tags", out.getvalue())
+        self.assertEqual(self.summary_rows(), kept)
+        self.assertEqual(len(self.get_stats("place-type-stats")), 1)
+
+
+class TestConcurrentPlaceWrites(TransactionTestCase):
+    databases = "__all__"
+    WRITERS = 4
+
+    @staticmethod
+    def summary_rows():
+        return TestPlaceStats.summary_rows(), TestPlaceTiles.cluster_rows()
+
+    def test_summaries_follow_concurrent_saves(self):
+        place = Place.objects.create(
+            code="A",
+            location_lat=37.9755,
+            location_lon=23.7348,
+            reward_checkin_points=1,
+            type="cafe",
+        )
+        place.tags.add("wifi")
+        loaded = threading.Barrier(self.WRITERS)
+        errors = []
+
+        def write(number):
+            try:
+                writing = Place.objects.get(pk=place.pk)
+                # Every writer loads the place before any of them saves it
+                loaded.wait(5)
+                writing.reward_checkin_points = number * 10
+                writing.location_lat = number
+                writing.save()
+                writing.tags.add(f"tag{number}")
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        writers = [
+            threading.Thread(target=write, args=[number])
+            for number in range(self.WRITERS)
+        ]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        self.assertEqual(errors, [])
+
+        kept = self.summary_rows()
+        stats.rebuild()
+        clusters.rebuild()
+        self.assertEqual(kept, self.summary_rows())
+
+
+class TestPlaceAdmin(TestCase):
+    PLACES = 5000
+    # Far above what the pages take, far below reading every place per page
+    MAX_PAGE_MS = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        # Bulk inserted without signals, indexed and summed up afterwards
+        benchmarking.generate_places(cls.PLACES)
+        benchmarking.generate_tags()
+        search.rebuild()
+        stats.rebuild()
+        clusters.rebuild()
+        if connection.vendor == "postgresql":
+            # As autovacuum would, the plans depend on the statistics
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "pass")
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        # Scaled down with the places, for the lists to go past it
+        patcher = patch.object(PlaceAdmin, "count_limit", 1000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def changelist(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response, ms = benchmarking.timed(
+                self.client.get, reverse("admin:places_api_place_changelist"), params
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(ms, self.MAX_PAGE_MS)
+        return response.context["cl"], len(queries)
+
+    @staticmethod
+    def codes(cl):
+        return [place.code for place in cl.result_list]
+
+    @staticmethod
+    def cursor(url):
+        return dict(parse_qsl(url.lstrip("?")))
+
+    def test_pages_with_cursors(self):
+        expected = list(Place.objects.order_by("code").values_list("code", flat=True))
+        cl, _ = self.changelist()
+        pages = [self.codes(cl)]
+        self.assertIsNone(cl.previous_url)
+        while cl.next_url:
+            cl, _ = self.changelist(**self.cursor(cl.next_url))
+            pages.append(self.codes(cl))
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(len(pages[0]), PlaceAdmin.list_per_page)
+
+        cl, _ = self.changelist(**self.cursor(cl.previous_url))
+        self.assertEqual(self.codes(cl), pages[-2])
+        self.assertEqual(self.cursor(cl.first_url), {})
+
+    def test_sorted_by_indexes(self):
+        column = PlaceAdmin.list_display.index("reward_checkin_points") + 1
+        cl, _ = self.changelist(o=f"-{column}")
+        self.assertEqual(
+            cl.queryset.query.order_by, ("-reward_checkin_points", "code", "uuid")
+        )
+        cl, _ = self.changelist(**self.cursor(cl.next_url))
+        expected = Place.objects.order_by("-reward_checkin_points", "code", "uuid")
+        self.assertEqual(
+            self.codes(cl),
+            [place.code for place in expected[100:200]],
+        )
+
+        column = PlaceAdmin.list_display.index("type") + 1
+        cl, _ = self.changelist(o=f"-{column}")
+        self.assertEqual(cl.queryset.query.order_by, ("-type", "-code", "-uuid"))
+
+    def test_bad_cursor(self):
+        response = self.client.get(
+            reverse("admin:places_api_place_changelist"), {"cursor": "garbage"}
+        )
+        self.assertRedirects(
+            response,
+            reverse("admin:places_api_place_changelist") + "?e=1",
+            fetch_redirect_response=False,
+        )
+
+    def test_counts(self):
+        cl, _ = self.changelist()
+        self.assertEqual(cl.result_count_display, f"about {self.PLACES:,}")
+
+        cl, _ = self.changelist(type="cafe")
+        self.assertEqual(cl.result_count, Place.objects.filter(type="cafe").count())
+        wifi = Place.objects.filter(tags__slug="wifi")
+        cl, _ = self.changelist(tag="wifi")
+        self.assertEqual(cl.result_count, wifi.count())
+        cl, _ = self.changelist(tag="wifi", type="cafe")
+        self.assertEqual(cl.result_count, wifi.filter(type="cafe").count())
+
+        cl, _ = self.changelist(q="golden")
+        self.assertEqual(
+            cl.result_count, Place.objects.filter(name__icontains="golden").count()
+        )
+        cl, _ = self.changelist(q="0000000")
+        self.assertEqual(cl.result_count_display, "more than 1,000")
+
+    def test_search(self):
+        cl, _ = self.changelist(q="00000000012")
+        self.assertEqual(self.codes(cl), [f"{i:012d}" for i in range(120, 130)])
+
+        # Matching too many places to sort, and few enough
+        for limit in (10, self.PLACES):
+            with patch("places_api.admin.SORT_LIMIT", limit):
+                cl, _ = self.changelist(q="golden harbour")
+            self.assertEqual(
+                self.codes(cl),
+                list(
+                    Place.objects.filter(name__icontains="golden")
+                    .filter(name__icontains="harbour")
+                    .order_by("code")
+                    .values_list("code", flat=True)[:100]
+                ),
+            )
+
+    def test_filters(self):
+        for limit in (10, self.PLACES):
+            with patch("places_api.admin.SORT_LIMIT", limit):
+                cl, _ = self.changelist(tag="parking", type="cafe")
+            self.assertEqual(
+                self.codes(cl),
+                list(
+                    Place.objects.filter(tags__slug="parking", type="cafe")
+                    .order_by("code")
+                    .values_list("code", flat=True)[:100]
+                ),
+            )
+
+        cl, _ = self.changelist()
+        [type_filter, tag_filter] = cl.filter_specs
+        self.assertEqual(
+            {value for value, _ in type_filter.lookup_choices},
+            set(Place.objects.values_list("type", flat=True)),
+        )
+        self.assertEqual(tag_filter.lookup_choices[0][0], "wifi")
+
+    def test_queries_constant(self):
+        deep = Place.objects.order_by("code")[self.PLACES - 150]
+        counts = {
+            name: self.changelist(**params)[1]
+            for name, params in {
+                "first": {},
+                "deep": {
+                    "cursor": encode_cursor(
+                        [deep.code, str(deep.uuid)], False, ["code", "uuid"]
+                    )
+                },
+                "search": {"q": "golden"},
+                "type": {"type": "cafe"},
+                "tag": {"tag": "wifi"},
+                "both": {"tag": "wifi", "type": "cafe"},
+            }.items()
+        }
+        for name, count in counts.items():
+            self.assertLessEqual(count, 10, name)
+
+
+class TestPlaceCheckins(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log_dir = Path(directory.name)
+        # Flushed by the tests, no thread is started
+        self.buffer = checkins.CheckinBuffer(self.log_dir, flush_interval=1)
+        patcher = patch.object(checkins, "get_buffer", return_value=self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.place = Place.objects.create(
+            code="A", location_lat=1, location_lon=2, reward_checkin_points=5
+        )
+
+    def check_in(self, place=None, **data):
+        return self.client.post(
+            reverse("place-checkins", args=[(place or self.place).uuid]),
+            {"user": "alice", **data},
+            format="json",
+        )
+
+    def totals(self, place=None):
+        response = self.client.get(
+            reverse("place-checkins", args=[(place or self.place).uuid])
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def user_totals(self, user="alice"):
+        return self.client.get(reverse("user-checkins", args=[user])).json()
+
+    def log_lines(self):
+        return [
+            line
+            for path in sorted(self.log_dir.glob("*.log"))
+            for line in path.read_text().splitlines()
+        ]
+
+    def test_recorded_on_flush(self):
+        response = self.check_in()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        data = response.json()
+        self.assertEqual(data["place"], str(self.place.uuid))
+        self.assertEqual((data["user"], data["points"]), ("alice", 5))
+        self.assertEqual(len(self.log_lines()), 1)
+        self.assertEqual(self.totals(), {"count": 0, "points": 0})
+
+        self.check_in(user="bob")
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.totals(), {"count": 2, "points": 10})
+        self.assertEqual(self.user_totals(), {"user": "alice", "count": 1, "points": 5})
+        self.assertEqual(PlaceCheckin.objects.get(user="bob").points, 5)
+        self.assertEqual(self.log_lines(), [])
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_batches_add_up(self):
+        other = Place.objects.create(
+            code="B", location_lat=1, location_lon=2, reward_checkin_points=7
+        )
+        for i in range(1200):
+            self.check_in(place=other if i % 3 else None, user=f"user{i % 2}")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.buffer.flush(), 1200)
+        # Three transactions of bulk.BATCH_SIZE check-ins
+        self.assertLess(len(queries), 40)
+        self.assertEqual(self.totals(), {"count": 400, "points": 2000})
+        self.assertEqual(self.totals(other), {"count": 800, "points": 5600})
+        self.assertEqual(
+            sorted(UserCheckinSummary.objects.values_list("user", "count")),
+            [("user0", 600), ("user1", 600)],
+        )
+
+    def test_retries_count_once(self):
+        checkin_id = str(uuid.uuid4())
+        self.assertEqual(self.check_in(id=checkin_id).json()["id"], checkin_id)
+        self.buffer.flush()
+        self.check_in(id=checkin_id)
+        self.check_in(id=checkin_id)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.totals(), {"count": 1, "points": 5})
+
+    def test_invalid(self):
+        self.assertEqual(
+            self.client.post(
+                reverse("place-checkins", args=[self.place.uuid]), {}
+            ).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        self.assertEqual(self.check_in(id="x").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.post(
+                reverse("place-checkins", args=[uuid.uuid4()]), {"user": "alice"}
+            ).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+        self.assertEqual(self.buffer.pending(), 0)
+
+    def test_deleted_places_skipped(self):
+        self.check_in()
+        self.place.delete()
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertFalse(PlaceCheckin.objects.exists())
+
+    def test_backed_up(self):
+        self.buffer.max_pending = 1
+        self.check_in()
+        response = self.check_in()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(self.buffer.flush(), 1)
+
+    def test_failed_flush_retried(self):
+        self.check_in()
+        with patch.object(
+            checkins, "record_batch", side_effect=OperationalError("locked")
+        ):
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.check_in(user="bob")
+        self.assertEqual(len(self.log_lines()), 2)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.log_lines(), [])
+
+    def test_recorded_in_request(self):
+        checkins.get_buffer.return_value = checkins.CheckinBuffer(flush_interval=0)
+        self.assertEqual(self.check_in().status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.totals(), {"count": 1, "points": 5})
+        self.assertEqual(self.log_lines(), [])
+
+    def test_replay(self):
+        for user in ("alice", "bob", "carol"):
+            self.check_in(user=user)
+        # A segment being written to is left alone
+        self.assertEqual(checkins.replay(self.log_dir), (0, 0))
+
+        # The process dies, its segment is no longer locked
+        os.close(self.buffer.segment.fd)
+        with (self.log_dir / "1-1.log").open("w") as file:
+            file.write(
+                checkins.encode(
+                    PlaceCheckin(place_uuid=self.place.uuid, user="dan", points=5)
+                ).decode()
+            )
+            file.write('{"id": "')
+        with self.assertLogs("places_api.checkins", "WARNING"):
+            out = io.StringIO()
+            call_command("replay_checkins", log_dir=str(self.log_dir), stdout=out)
+        self.assertIn("Recorded 4 check-ins from 2 segments", out.getvalue())
+        self.assertEqual(self.totals(), {"count": 4, "points": 20})
+        self.assertEqual(self.log_lines(), [])
+        self.assertEqual(checkins.replay(self.log_dir), (0, 0))
@@ -1,8 +1,24 @@
+from django.urls import path
+from django.urls import re_path
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
+from .views import CacheStatsView
 from .views import PlaceViewSet
+from .views import TagViewSet
+from .views import UserCheckinsView
 
 router = DefaultRouter(trailing_slash=False)
 router.register(r"place/?", PlaceViewSet)
+router.register(r"tags/?", TagViewSet)
 
-urlpatterns = router.urls
+urlpatterns = [
+    # Async reads of the list and details, matched ahead of the viewset
+    # routes they share their URLs and names with
+    re_path(r"^place/?$", async_views.place_list),
+    re_path(r"^place/?/(?P<pk>[0-9a-fA-F-]{32,36})$", async_views.place_detail),
+]
+urlpatterns += router.urls + [
+    path("cache", CacheStatsView.as_view(), name="cache-stats"),
+    path("checkins/users/<str:user>", UserCheckinsView.as_view(), name="user-checkins"),
+]
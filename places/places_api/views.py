@@ -1,18 +1,149 @@
+import uuid
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import Exists
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.http import StreamingHttpResponse
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import mixins
+from rest_framework.generics import get_object_or_404
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework import status
+from . import bulk as bulk_writers
+from . import caching
+from . import changes as change_feed
+from . import checkins as checkin_buffer
+from . import clusters
+from . import conditional
+from . import export
+from . import replicas
+from . import stats
+from .filters import FullTextSearchFilter
+from .filters import GeoFilter
+from .filters import PlaceFilterSet
 from .models import Place
+from .models import PlaceCheckin
+from .models import PlaceCheckinSummary
+from .models import UUIDTaggedItem
+from .models import UserCheckinSummary
+from .pagination import KeysetPagination
+from .renderers import CSVRenderer
+from .renderers import NDJSONRenderer
+from .serializers import CheckinSerializer
 from .serializers import PlaceSerializer
+from .serializers import place_representations
+from .serializers import place_values
+from .serializers import TagCountSerializer
+from .serializers import checkin_representation
 from rest_framework.filters import SearchFilter
 from rest_framework.filters import OrderingFilter
+from rest_framework.utils.urls import replace_query_param
+from taggit.models import Tag
+
+
+class TokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = (
+        "Changes from this token were compacted, sync again without `since`."
+    )
+    default_code = "token_expired"
 
 
 class PlaceViewSet(viewsets.ModelViewSet):
-    queryset = Place.objects.all()
+    queryset = Place.objects.prefetch_related("tags")
     serializer_class = PlaceSerializer
-    filter_backends = [SearchFilter, OrderingFilter]
+    pagination_class = KeysetPagination
+    filter_backends = [
+        DjangoFilterBackend,
+        FullTextSearchFilter,
+        GeoFilter,
+        SearchFilter,
+        OrderingFilter,
+    ]
+    filterset_class = PlaceFilterSet
     ordering_fields = ["code"]
     search_fields = ["address"]
+    bulk_max_items = 10000
+
+    # Actions whose responses have the client read its writes from replicas
+    write_actions = {"create", "update", "partial_update", "destroy", "bulk"}
+
+    def list(self, request, *args, **kwargs):
+        with replicas.reading(request):
+            return caching.cached_response(
+                request,
+                caching.list_version_keys(),
+                lambda: self.list_places(request),
+                key_etag=True,
+                source=replicas.source(request),
+            )
+
+    def list_places(self, request):
+        # Rows and dicts rather than instances and the serializer, which
+        # writes use
+        rows = place_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(place_representations(list(rows)))
+        return self.get_paginated_response(place_representations(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            # The version is kept under the canonical form of the uuid
+            place_uuid = uuid.UUID(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            return self.retrieve_place(request)
+        with replicas.reading(request):
+            return caching.cached_response(
+                request,
+                caching.place_version_keys(place_uuid),
+                lambda: self.retrieve_place(request),
+                source=replicas.source(request),
+            )
+
+    def retrieve_place(self, request):
+        instance = self.get_object()
+        if not conditional.has_etag(request):
+            return Response(self.get_serializer(instance).data)
+
+        etag = conditional.place_etag(instance)
+        if conditional.if_none_match(request, etag):
+            return conditional.not_modified(etag)
+        return Response(self.get_serializer(instance).data, headers={"ETag": etag})
+
+    def perform_create(self, serializer):
+        serializer.save()
+        self.set_etag(serializer.instance)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            conditional.check_if_match(self.request, serializer.instance)
+            serializer.save()
+        self.set_etag(serializer.instance)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            conditional.check_if_match(self.request, instance)
+            instance.delete()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self.action in self.write_actions:
+            replicas.remember_writes(request, response)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def set_etag(self, place):
+        # finalize_response() adds self.headers to the response
+        if conditional.has_etag(self.request):
+            self.headers["ETag"] = conditional.place_etag(place)
 
     def destroy(self, request, pk=None, *args, **kwargs):
         """
@@ -32,3 +163,365 @@ class PlaceViewSet(viewsets.ModelViewSet):
             response = Response(response_body, status.HTTP_200_OK)
 
         return response
+
+    @action(detail=False, renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Streams every place matching the list filters as NDJSON (the default)
+        or CSV, chosen with `?format=csv` or the `Accept` header.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.query.order_by:
+            queryset = queryset.order_by("code", "uuid")
+
+        renderer = request.accepted_renderer
+        rows = (
+            export.csv_rows(queryset)
+            if renderer.format == CSVRenderer.format
+            else export.ndjson_rows(queryset)
+        )
+        response = StreamingHttpResponse(
+            rows, content_type=f"{renderer.media_type}; charset={renderer.charset}"
+        )
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="places.{renderer.format}"'
+        return response
+
+    @action(detail=False)
+    def changes(self, request):
+        """
+        The places changed after `?since=<token>`, each once, by its latest
+        change, oldest first: `{"changes": [...], "token": ..., "next": ...}`.
+        Changes carry the place, or `"deleted": true` and no place for the
+        deleted ones. Store `token` and pass it as `since` next time, `next`
+        links to the rest of the changes while there are more than `?limit=`.
+        Without `since`, every place is returned once.
+        """
+        limit = min(
+            self.query_int("limit", change_feed.PAGE_SIZE), change_feed.MAX_PAGE_SIZE
+        )
+        compaction = change_feed.latest_compaction()
+        since = 0
+        if "since" in request.query_params:
+            try:
+                token = change_feed.parse_token(request.query_params["since"])
+            except ValueError:
+                raise ValidationError({"since": ["Not a token of this feed."]})
+            if change_feed.expired(token, compaction):
+                raise TokenExpired()
+            since = token[0]
+
+        rows = change_feed.latest_changes(since, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        results = change_feed.change_items(rows, compaction[0])
+        token = change_feed.make_token(rows[-1].id if rows else since, compaction[0])
+        return Response(
+            {
+                "changes": results,
+                "token": token,
+                "next": replace_query_param(
+                    request.build_absolute_uri(), "since", token
+                )
+                if has_more
+                else None,
+            }
+        )
+
+    @action(
+        detail=False,
+        url_path=r"tiles/(?P<zoom>[0-9]+)/(?P<x>[0-9]+)/(?P<y>[0-9]+)",
+    )
+    def tiles(self, request, zoom, x, y):
+        """
+        The places of a web map tile, `/tiles/<zoom>/<x>/<y>` as OpenStreetMap
+        numbers them, clustered by geohash cell: `{"zoom": ..., "bbox": [...],
+        "clusters": [...], "places": ...}`. Each cluster has its count,
+        centroid, most common types and total check-in points. From zoom 15
+        on, `places` lists the places of the tile instead, unless it holds too
+        many of them.
+        """
+        zoom, x, y = int(zoom), int(x), int(y)
+        if zoom > clusters.MAX_ZOOM or x >= 2**zoom or y >= 2**zoom:
+            raise ValidationError(
+                {"tile": [f"No such tile, zooms go up to {clusters.MAX_ZOOM}."]}
+            )
+        return caching.cached_response(
+            request,
+            caching.list_version_keys(),
+            lambda: Response(clusters.tile(zoom, x, y)),
+            key_etag=True,
+        )
+
+    @action(detail=False, url_path="stats/types")
+    def type_stats(self, request):
+        """
+        The number of places of each type and the total and average of their
+        check-in points, most common type first.
+        """
+        return caching.cached_response(
+            request,
+            caching.list_version_keys(),
+            lambda: Response(stats.type_stats()),
+            key_etag=True,
+        )
+
+    @action(detail=False, url_path="stats/tags")
+    def tag_stats(self, request):
+        """
+        The number of places carrying each tag and the total and average of
+        their check-in points, most used tag first.
+        """
+        return caching.cached_response(
+            request,
+            caching.list_version_keys(),
+            lambda: Response(stats.tag_stats()),
+            key_etag=True,
+        )
+
+    @action(detail=False)
+    def leaderboard(self, request):
+        """
+        The `?limit=` (10) places with the most check-in points among those
+        the list filters keep, e.g. within `?bbox=`, most rewarding first.
+        """
+        limit = min(
+            self.query_int("limit", stats.LEADERBOARD_SIZE), stats.MAX_LEADERBOARD_SIZE
+        )
+        return caching.cached_response(
+            request,
+            caching.list_version_keys(),
+            lambda: Response(
+                stats.leaderboard(self.filter_queryset(self.get_queryset()), limit)
+            ),
+            key_etag=True,
+        )
+
+    @action(detail=True, methods=["get", "post"])
+    def checkins(self, request, pk=None):
+        """
+        POST `{"user": ...}` checks the user in at the place, awarding them
+        its check-in points, and answers 202: the check-in is recorded within
+        `PLACES_CHECKIN_FLUSH_INTERVAL` seconds. An `"id"`, a UUID, makes
+        retries count once. GET returns the number of check-ins recorded at
+        the place and the points they awarded.
+        """
+        # Only the columns needed, rather than the place and its tags
+        place_uuid, points = get_object_or_404(
+            Place.objects.values_list("uuid", "reward_checkin_points"), pk=pk
+        )
+        if request.method == "GET":
+            return Response(checkin_buffer.totals(PlaceCheckinSummary, place_uuid))
+
+        serializer = CheckinSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        checkin = PlaceCheckin(
+            place_uuid=place_uuid, points=points, **serializer.validated_data
+        )
+        checkin_buffer.get_buffer().add(checkin)
+        return Response(
+            checkin_representation(checkin), status=status.HTTP_202_ACCEPTED
+        )
+
+    def query_int(self, name, default):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            value = -1
+        if value < 0:
+            raise ValidationError({name: ["Must be a non-negative integer."]})
+        return value
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Creates, updates and deletes many places in a single request:
+        `{"create": [place, ...], "update": [place, ...], "delete": [uuid, ...]}`,
+        where updated places carry their `uuid`. Items are validated one by one
+        and written in chunked transactions, and every item gets its own
+        result, so an invalid item does not abort the rest of the batch.
+        """
+        data = request.data
+        if not isinstance(data, dict) or not all(
+            isinstance(data.get(op, []), list) for op in ("create", "update", "delete")
+        ):
+            raise ValidationError(
+                {"detail": "Expected lists under 'create', 'update' and 'delete'."}
+            )
+        items = sum(len(data.get(op, [])) for op in ("create", "update", "delete"))
+        if items > self.bulk_max_items:
+            raise ValidationError(
+                {"detail": f"At most {self.bulk_max_items} items per request."}
+            )
+
+        return Response(
+            {
+                "create": self.bulk_create(data.get("create", [])),
+                "update": self.bulk_update(data.get("update", [])),
+                "delete": self.bulk_delete(data.get("delete", [])),
+            }
+        )
+
+    def bulk_validate(self, items):
+        """Returns the validated data, or None, and the results list for items."""
+        serializer = self.get_serializer()
+        validated, results = [], []
+        for item in items:
+            try:
+                validated.append(serializer.run_validation(item))
+                results.append(None)
+            except ValidationError as exc:
+                validated.append(None)
+                results.append(
+                    {"status": status.HTTP_400_BAD_REQUEST, "errors": exc.detail}
+                )
+        return validated, results
+
+    @staticmethod
+    def bulk_write(writer, indexes, rows, results, success_status):
+        for chunk in bulk_writers.chunked(list(zip(indexes, rows))):
+            try:
+                places = writer([row for _, row in chunk])
+            except DatabaseError as exc:
+                for index, _ in chunk:
+                    results[index] = {
+                        "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        "errors": {"non_field_errors": [str(exc)]},
+                    }
+                continue
+            for (index, _), place in zip(chunk, places):
+                results[index] = {"uuid": str(place.uuid), "status": success_status}
+
+    def bulk_create(self, items):
+        validated, results = self.bulk_validate(items)
+        indexes = [i for i, row in enumerate(validated) if row is not None]
+        self.bulk_write(
+            bulk_writers.create_places,
+            indexes,
+            [validated[i] for i in indexes],
+            results,
+            status.HTTP_201_CREATED,
+        )
+        return results
+
+    def bulk_update(self, items):
+        validated, results = self.bulk_validate(items)
+        uuids = {}
+        for i, item in enumerate(items):
+            try:
+                uuids[i] = uuid.UUID(str(item.get("uuid")))
+            except (AttributeError, ValueError):
+                # Keeps the field errors of items that failed validation too
+                results[i] = results[i] or {
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "errors": {},
+                }
+                results[i]["errors"]["uuid"] = ["Must be a valid UUID."]
+
+        existing = Place.objects.in_bulk(list(uuids.values()))
+        indexes = []
+        for i, row in enumerate(validated):
+            if results[i] is not None:
+                continue
+            if uuids[i] not in existing:
+                results[i] = {
+                    "status": status.HTTP_404_NOT_FOUND,
+                    "uuid": str(uuids[i]),
+                }
+                continue
+            indexes.append(i)
+
+        self.bulk_write(
+            bulk_writers.update_places,
+            indexes,
+            [(existing[uuids[i]], validated[i]) for i in indexes],
+            results,
+            status.HTTP_200_OK,
+        )
+        return results
+
+    def bulk_delete(self, items):
+        results, uuids = [], {}
+        for i, item in enumerate(items):
+            try:
+                uuids[i] = uuid.UUID(str(item))
+                results.append(None)
+            except ValueError:
+                results.append(
+                    {
+                        "status": status.HTTP_400_BAD_REQUEST,
+                        "errors": {"uuid": ["Must be a valid UUID."]},
+                    }
+                )
+
+        deleted = set()
+        for chunk in bulk_writers.chunked(list(uuids.items())):
+            try:
+                places = bulk_writers.delete_places(
+                    [place_uuid for _, place_uuid in chunk]
+                )
+            except DatabaseError as exc:
+                for i, place_uuid in chunk:
+                    results[i] = {
+                        "uuid": str(place_uuid),
+                        "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        "errors": {"non_field_errors": [str(exc)]},
+                    }
+                continue
+            deleted.update(place.uuid for place in places)
+            for i, place_uuid in chunk:
+                results[i] = {
+                    "uuid": str(place_uuid),
+                    "status": status.HTTP_204_NO_CONTENT
+                    if place_uuid in deleted
+                    else status.HTTP_404_NOT_FOUND,
+                }
+        return results
+
+
+class TagViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Lists the tags in use with the number of places carrying each,
+    most used first, counted by a single query.
+    """
+
+    queryset = Tag.objects.all()
+    serializer_class = TagCountSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        # Counting per tag with a correlated subquery reads only the covering
+        # (tag, content_type, object_id) index, while joining and grouping
+        # the tagged items reads and sorts every one of their rows
+        items = UUIDTaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Place),
+            tag=OuterRef("pk"),
+        )
+        counts = items.values("tag").annotate(count=Count("*")).values("count")
+        return (
+            super()
+            .get_queryset()
+            .filter(Exists(items))
+            .annotate(count=Subquery(counts))
+            .order_by("-count", "name")
+        )
+
+
+class UserCheckinsView(APIView):
+    """The check-ins of a user recorded so far and the points they were awarded."""
+
+    def get(self, request, user):
+        return Response(
+            {"user": user, **checkin_buffer.totals(UserCheckinSummary, user)}
+        )
+
+
+class CacheStatsView(APIView):
+    """Hit and miss counts of the place response cache in this process."""
+
+    def get(self, request):
+        return Response(caching.stats())
@@ -10,39 +10,73 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-# Quick-start development settings - unsuitable for production
+def env_list(name, default=""):
+    return [
+        item.strip()
+        for item in os.environ.get(name, default).split(",")
+        if item.strip()
+    ]
+
+
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+# Deployment settings come from the environment, so the same image runs in
+# development and in production. See the README for the variables.
 # See https://docs.djangoproject.com/en/4.1/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = "django-insecure-_cpoyaf#oa3dxcj5_rat9yq%c$gh89i$22p5bahy8)rwds@y5u"
+SECRET_KEY = os.environ.get(
+    "DJANGO_SECRET_KEY",
+    "django-insecure-_cpoyaf#oa3dxcj5_rat9yq%c$gh89i$22p5bahy8)rwds@y5u",
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env_flag("DJANGO_DEBUG")
+
+ALLOWED_HOSTS = env_list("DJANGO_ALLOWED_HOSTS", "localhost,127.0.0.1,[::1]")
 
-ALLOWED_HOSTS = []
+CSRF_TRUSTED_ORIGINS = env_list("DJANGO_CSRF_TRUSTED_ORIGINS")
 
 
 # Application definition
 
+# The admin and the HTML pages of the browsable API, with their login views,
+# can be left out of servers only API clients talk to: they are not imported
+# then, which shortens the start of every process, see the README
+PLACES_ADMIN = env_flag("PLACES_ADMIN", True)
+PLACES_BROWSABLE_API = env_flag("PLACES_BROWSABLE_API", True)
+
 INSTALLED_APPS = [
-    "django.contrib.admin",
+    *(["django.contrib.admin"] if PLACES_ADMIN else []),
     "django.contrib.auth",
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "rest_framework",
+    "django_filters",
     "places_api",
     "taggit",
 ]
 
 MIDDLEWARE = [
+    # First, its timings include the other middleware
+    "places_api.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -72,18 +106,176 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "places.wsgi.application"
 
+# Served by gunicorn with uvicorn workers, see gunicorn.conf.py
+ASGI_APPLICATION = "places.asgi.application"
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db" / "db.sqlite3",
+# SQLite by default, DB_ENGINE=postgresql moves the database to the
+# PostgreSQL server the other DB_ variables point to, where
+# places_api/postgres.py adds its indexes, and PostGIS ones when available
+
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", 600))
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "places"),
+            "USER": os.environ.get("DB_USER", "places"),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", "localhost"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            "CONN_MAX_AGE": CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+        },
+    }
+elif DB_ENGINE == "sqlite":
+    # Both aliases open the same SQLite file, see places_api/backends/sqlite3
+    # for its tuning. Connections are kept for CONN_MAX_AGE seconds, one per
+    # thread and alias, "read" ones refuse writes and serve the reads outside
+    # of transactions, see places_api/routers.py
+    DATABASE_NAME = Path(os.environ.get("DB_PATH", BASE_DIR / "db")) / "db.sqlite3"
+    DATABASES = {
+        "default": {
+            "ENGINE": "places_api.backends.sqlite3",
+            "NAME": DATABASE_NAME,
+            "CONN_MAX_AGE": CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+        },
+        "read": {
+            "ENGINE": "places_api.backends.sqlite3",
+            "NAME": DATABASE_NAME,
+            "CONN_MAX_AGE": CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {"read_only": True},
+            "TEST": {"MIRROR": "default"},
+        },
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_ENGINE {DB_ENGINE!r}.")
+
+# PLACES_REPLICAS lists, comma separated, SQLite files the reads of the place
+# list and details are spread over: snapshots of the database that
+# `manage.py snapshot_database` replaces, see places_api/replicas.py. Those
+# taken more than PLACES_REPLICA_MAX_STALENESS seconds ago, unless "off",
+# are left for the database
+
+PLACES_REPLICAS = [
+    path for path in os.environ.get("PLACES_REPLICAS", "").split(",") if path
+]
+PLACES_REPLICA_MAX_STALENESS = os.environ.get("PLACES_REPLICA_MAX_STALENESS", "30")
+PLACES_REPLICA_MAX_STALENESS = (
+    None
+    if PLACES_REPLICA_MAX_STALENESS.lower() == "off"
+    else float(PLACES_REPLICA_MAX_STALENESS)
+)
+if PLACES_REPLICAS and DB_ENGINE != "sqlite":
+    raise ImproperlyConfigured("PLACES_REPLICAS are snapshots of a SQLite database.")
+for number, path in enumerate(PLACES_REPLICAS, 1):
+    DATABASES[f"replica{number}"] = {
+        "ENGINE": "places_api.backends.sqlite3",
+        "NAME": Path(path),
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+        "OPTIONS": {"read_only": True, "snapshot": True},
+        "TEST": {"MIRROR": "default"},
     }
+
+DATABASE_ROUTERS = ["places_api.routers.ReadWriteRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/ref/settings/#caches
+# "places" holds the place API responses, and "places_versions" the counters
+# that tell which of them are current. Responses can be private to each
+# process, the local memory backend evicts the least recently used ones, but
+# deployments running several workers have to share the counters, in a
+# directory set with PLACES_CACHE_DIR (the Docker image does) or, with the
+# redis package installed, a server:
+#   "BACKEND": "django.core.cache.backends.redis.RedisCache",
+#   "LOCATION": "redis://127.0.0.1:6379",
+
+PLACES_CACHE_DIR = os.environ.get("PLACES_CACHE_DIR")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "places": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "places",
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    "places_versions": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache"
+        if PLACES_CACHE_DIR
+        else "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": PLACES_CACHE_DIR or "places_versions",
+        "TIMEOUT": None,
+        # One counter per place read or written recently: the file based
+        # backend lists its directory on every set, so the culling bound also
+        # bounds the cost of a write
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
 }
 
 
+# Request metrics
+# Requests slower than PLACES_SLOW_REQUEST_MS are logged with their SQL, and
+# with a cProfile profile for the share PLACES_PROFILE_SAMPLE_RATE of them
+# that is profiled. See places_api/metrics.py, off by default
+
+PLACES_SLOW_REQUEST_MS = (
+    float(os.environ["PLACES_SLOW_REQUEST_MS"])
+    if os.environ.get("PLACES_SLOW_REQUEST_MS")
+    else None
+)
+PLACES_PROFILE_SAMPLE_RATE = float(os.environ.get("PLACES_PROFILE_SAMPLE_RATE", 0))
+
+
+# Live events
+# What tells the workers streaming /api/place/events that changes committed,
+# see places_api/events.py: their own writes and, every second, a read of the
+# change feed by default, notifications on PostgreSQL
+
+PLACES_EVENTS_BACKEND = os.environ.get(
+    "PLACES_EVENTS_BACKEND",
+    "places_api.events.PostgresBackend"
+    if DB_ENGINE == "postgresql"
+    else "places_api.events.PollingBackend",
+)
+
+
+# Check-ins
+# Appended to a log in PLACES_CHECKIN_LOG_DIR and recorded in batches every
+# PLACES_CHECKIN_FLUSH_INTERVAL seconds, see places_api/checkins.py. Without
+# a directory they are kept in memory, where a crash loses those of the last
+# interval, and an interval of 0 records each one in its request
+
+PLACES_CHECKIN_LOG_DIR = os.environ.get(
+    "PLACES_CHECKIN_LOG_DIR",
+    str(Path(os.environ.get("DB_PATH", BASE_DIR / "db")) / "checkins"),
+)
+PLACES_CHECKIN_FLUSH_INTERVAL = float(
+    os.environ.get("PLACES_CHECKIN_FLUSH_INTERVAL", 0.5)
+)
+
+
+# Tests
+# The test databases are created from templates of the migrated schema, see
+# places_api/runner.py, the SQLite ones kept in PLACES_TEST_TEMPLATE_DIR
+
+TEST_RUNNER = "places_api.runner.TestRunner"
+PLACES_TEST_TEMPLATE_DIR = os.environ.get(
+    "PLACES_TEST_TEMPLATE_DIR",
+    str(Path(tempfile.gettempdir()) / "places-test-templates"),
+)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -120,7 +312,45 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Filled by collectstatic, and served by the app itself when DEBUG is off, for
+# the admin and the browsable API
+STATIC_ROOT = Path(os.environ.get("STATIC_ROOT", BASE_DIR / "static"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Logging
+# https://docs.djangoproject.com/en/4.1/topics/logging/
+# Without DEBUG, Django only mails errors to ADMINS, send them to the server
+# logs instead
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "root": {
+        "handlers": ["console"],
+        "level": os.environ.get("DJANGO_LOG_LEVEL", "WARNING"),
+    },
+}
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+# JSON is rendered by orjson when the fast-json extra is installed, the same
+# bytes as the stock renderer writes: the rare floats orjson writes
+# differently, e.g. 5e-05 or 1e16, are rendered by the stock renderer
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "places_api.renderers.FastJSONRenderer",
+        *(
+            ["rest_framework.renderers.BrowsableAPIRenderer"]
+            if PLACES_BROWSABLE_API
+            else []
+        ),
+    ],
+}
@@ -13,13 +13,32 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
-from django.urls import path, include
+import re
+
+from django.conf import settings
+from django.urls import path, include, re_path
+from django.views.static import serve
 from places_api import urls as places_urls
+from places_api.metrics import metrics_view
 
 
 urlpatterns = [
-    path("admin/", admin.site.urls),
-    path("api-auth/", include("rest_framework.urls")),
     path("api/", include(places_urls)),
+    path("metrics", metrics_view, name="metrics"),
+    # No web server fronts the app in the Docker image, the admin and the
+    # browsable API get their collected assets from it (runserver serves them
+    # itself when DEBUG is on)
+    re_path(
+        rf"^{re.escape(settings.STATIC_URL.lstrip('/'))}(?P<path>.*)$",
+        serve,
+        {"document_root": settings.STATIC_ROOT},
+    ),
 ]
+
+# Imported only when enabled, see PLACES_ADMIN and PLACES_BROWSABLE_API
+if settings.PLACES_ADMIN:
+    from django.contrib import admin
+
+    urlpatterns.append(path("admin/", admin.site.urls))
+if settings.PLACES_BROWSABLE_API:
+    urlpatterns.append(path("api-auth/", include("rest_framework.urls")))